@@ -0,0 +1,153 @@
+#
+# asyncio versions of the node and cluster log waits
+#
+# Requires Python 3.5 or later: this module is only imported by the *_async
+# methods of Node and Cluster.
+#
+
+import asyncio
+import os
+import socket
+import time
+
+from ccmlib import common, readiness
+from ccmlib.log_tailer import LogSubscription
+from ccmlib.node import TimeoutError
+
+
+def _done_future(loop, subscription):
+    """
+    Returns a future that completes on the event loop once the subscription
+    has found all its expressions, or fails with the error of its tailer.
+    """
+    future = loop.create_future()
+
+    def complete():
+        if not future.done():
+            if subscription.error is not None:
+                future.set_exception(subscription.error)
+            else:
+                future.set_result(subscription)
+
+    def notify(_):
+        # Called from the tailer thread
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(complete)
+
+    subscription.add_done_callback(notify)
+    return future
+
+
+async def watch_log_for(node, exprs, from_mark=None, timeout=600, process=None, verbose=False, filename='system.log'):
+    """
+    See Node.watch_log_for. Cancelling the coroutine stops the watch.
+    """
+    tofind = [exprs] if isinstance(exprs, str) else exprs
+    if len(tofind) == 0:
+        return None
+
+    loop = asyncio.get_event_loop()
+    deadline = time.time() + timeout
+    log_file = os.path.join(node.get_path(), 'logs', filename)
+    output_read = False
+    tailer = node.cluster.log_tailer()
+    subscription = LogSubscription(log_file, tofind, from_mark=from_mark)
+    found = _done_future(loop, subscription)
+    tailer.add([subscription])
+    try:
+        # Wake up at least every second to check on the process
+        while not found.done():
+            await asyncio.wait([found], timeout=max(0, min(deadline - time.time(), 1)))
+            if found.done():
+                break
+            output_read, exited = node._check_watched_process(process, verbose, output_read)
+            if time.time() >= deadline:
+                raise node._log_watch_timeout(subscription, filename)
+            if exited:
+                return None
+        found.result()
+    finally:
+        found.cancel()
+        tailer.remove(subscription)
+
+    matchings = subscription.matchings
+    return matchings[0] if isinstance(exprs, str) else matchings
+
+
+async def wait_for_any_log(nodes, pattern, timeout, filename='system.log'):
+    """
+    See common.wait_for_any_log. Returns the first node in whose log the
+    pattern was found.
+    """
+    loop = asyncio.get_event_loop()
+    watches = []
+    try:
+        for node in nodes:
+            subscription = LogSubscription(os.path.join(node.get_path(), 'logs', filename), [pattern], from_mark=0)
+            watches.append((node, subscription, _done_future(loop, subscription)))
+            node.cluster.log_tailer().add([subscription])
+        if watches:
+            await asyncio.wait([found for _, _, found in watches], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for node, _, found in watches:
+            if found.done():
+                found.result()
+                return node
+    finally:
+        for node, subscription, found in watches:
+            found.cancel()
+            node.cluster.log_tailer().remove(subscription)
+
+    raise TimeoutError(time.strftime("%d %b %Y %H:%M:%S", time.gmtime()) +
+                       " Unable to find: " + repr(pattern) + " in any node log within " + str(timeout) + "s")
+
+
+async def check_socket_listening(itf, timeout=60):
+    """
+    See common.check_socket_listening.
+    """
+    end = time.time() + timeout
+    while time.time() <= end:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(itf[0], itf[1]),
+                                               timeout=max(0.01, end - time.time()))
+            writer.close()
+            return True
+        except (socket.error, asyncio.TimeoutError):
+            # Try again in another 200ms
+            await asyncio.sleep(.2)
+    return False
+
+
+async def wait_for_binary_interface(node, **kwargs):
+    """
+    See Node.wait_for_binary_interface.
+    """
+    if node.cluster.version() >= '1.2':
+        await watch_log_for(node, "Starting listening for CQL clients", **kwargs)
+
+    await asyncio.get_event_loop().run_in_executor(None, readiness.wait_for_native_transport, [node], 30)
+
+
+async def wait_for_exit(node, timeout):
+    """
+    See Node.wait_for_exit. Without a pidfd to wait on, the wait happens in
+    an executor thread.
+    """
+    handle = None if common.is_win() else node._process_handle()
+    fd = handle.fileno() if handle is not None else None
+    if fd is None:
+        return await asyncio.get_event_loop().run_in_executor(None, node.wait_for_exit, timeout)
+
+    loop = asyncio.get_event_loop()
+    exited = loop.create_future()
+
+    def notify():
+        if not exited.done():
+            exited.set_result(True)
+
+    loop.add_reader(fd, notify)
+    try:
+        await asyncio.wait([exited], timeout=timeout)
+    finally:
+        loop.remove_reader(fd)
+    return not node.is_running()
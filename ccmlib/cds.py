@@ -0,0 +1,173 @@
+#
+# Class Data Sharing archives of the Cassandra classes
+#
+# When enabled (CCM_CLASS_DATA_SHARING=true) and running on JDK 13+, the
+# first node started from an install directory dumps the classes it loaded
+# into an archive when it stops (-XX:ArchiveClassesAtExit). Later starts of
+# nodes using the same install directory, version, jars and JDK map that
+# archive (-XX:SharedArchiveFile) instead of loading and verifying the
+# classes again.
+#
+# The JVM only maps an archive if the class path entries it archived classes
+# from are the same, and refuses non-empty directories among them. Cassandra
+# puts the node's own conf directory first on the class path, so the nodes
+# using an archive get it moved after the jars (see JARS_FIRST): the jars,
+# which all the nodes of an install share, then come first, and the conf
+# directory is past the last entry the archive was built from.
+#
+
+from __future__ import absolute_import
+
+import hashlib
+import os
+import re
+import subprocess
+
+from ccmlib import common
+
+ENABLED_ENV = 'CCM_CLASS_DATA_SHARING'
+
+# Dynamic archives (-XX:ArchiveClassesAtExit) appeared in JDK 13
+MIN_JDK = 13
+
+# The line of cassandra-env.sh that moves the conf directory to the end of
+# the class path of the nodes started with JARS_FIRST_ENV set. Neither the
+# jars nor the JDK hold a cassandra.yaml or logback.xml that the node's
+# would then be shadowed by.
+JARS_FIRST_ENV = 'CCM_CDS_JARS_FIRST'
+JARS_FIRST = 'if [ -n "$CCM_CDS_JARS_FIRST" ]; then CLASSPATH="${CLASSPATH#"$CASSANDRA_CONF":}:$CASSANDRA_CONF"; fi'
+
+_java_versions = {}
+
+
+def enabled():
+    return os.environ.get(ENABLED_ENV, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def parse_java_version(output):
+    """
+    Returns the major version (8, 11, 17...) in the output of java -version,
+    or None if it can't be found.
+    """
+    match = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+    if match is None:
+        return None
+    major = int(match.group(1))
+    if major == 1 and match.group(2) is not None:
+        return int(match.group(2))
+    return major
+
+
+def java_version(env=None):
+    """
+    Returns the output of java -version for the java the nodes run with
+    (the one in JAVA_HOME if set), or None if it can't be run.
+    """
+    env = env if env is not None else os.environ
+    java = os.path.join(env['JAVA_HOME'], 'bin', 'java') if env.get('JAVA_HOME') else 'java'
+    if java not in _java_versions:
+        try:
+            output = subprocess.check_output([java, '-version'], stderr=subprocess.STDOUT)
+            _java_versions[java] = output.decode('utf-8', 'replace')
+        except (OSError, subprocess.CalledProcessError):
+            _java_versions[java] = None
+    return _java_versions[java]
+
+
+def _jars(install_dir):
+    for subdir in ('lib', 'build'):
+        for root, dirs, files in os.walk(os.path.join(install_dir, subdir)):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.jar'):
+                    yield os.path.join(root, name)
+
+
+def fingerprint(install_dir, java):
+    """
+    Returns a digest of the jars of an install directory (their paths, sizes
+    and modification times) and of the JDK, which changes whenever an
+    archive built from them would become stale. Returns None if there are no
+    jars.
+    """
+    digest = hashlib.sha1(java.encode('utf-8'))
+    found = False
+    for jar in _jars(install_dir):
+        st = os.stat(jar)
+        digest.update('{}:{}:{}\n'.format(os.path.relpath(jar, install_dir), st.st_size, int(st.st_mtime)).encode('utf-8'))
+        found = True
+    return digest.hexdigest() if found else None
+
+
+def archive_dir():
+    """
+    Archives are kept in the repository, so that invalidatecache removes them.
+    """
+    return os.path.join(common.get_default_path(), 'repository', 'cds')
+
+
+def archive_path(install_dir, version, fingerprint):
+    """
+    Returns the path of the archive of an install directory and version for
+    the given fingerprint.
+    """
+    location = hashlib.sha1(os.path.realpath(install_dir).encode('utf-8')).hexdigest()[:10]
+    return os.path.join(archive_dir(), '{}-{}-{}.jsa'.format(version, location, fingerprint[:16]))
+
+
+def _remove_stale(path):
+    # Same version and install directory, different jars or JDK
+    directory, current = os.path.split(path)
+    prefix = current.rsplit('-', 1)[0] + '-'
+    for name in os.listdir(directory):
+        # Also removes the dumps in progress for stale archives
+        if name.startswith(prefix) and not name.startswith(current):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def adopt(dumped, path):
+    """
+    Moves an archive dumped by a node that has exited into place, unless
+    another node's archive got there first. Returns whether there is an
+    archive at path.
+    """
+    if os.path.exists(dumped):
+        if os.path.getsize(dumped) > 0 and not os.path.exists(path):
+            os.rename(dumped, path)
+        else:
+            os.remove(dumped)
+    return os.path.exists(path)
+
+
+def jvm_options(node, env):
+    """
+    Returns the JVM options that make a starting node use the archive of its
+    install directory, or dump one when it stops if there is none yet, and
+    remembers in node._cds_dump where the dump goes so that Node.stop can
+    adopt it. Sets JARS_FIRST_ENV in the env of the node when it does.
+    Returns no options if disabled or unsupported.
+    """
+    node._cds_dump = None
+    if not enabled() or common.is_win():
+        return []
+    java = java_version(env)
+    if java is None or (parse_java_version(java) or 0) < MIN_JDK:
+        return []
+    install_dir = node.get_install_dir()
+    digest = fingerprint(install_dir, java)
+    if digest is None:
+        return []
+    path = archive_path(install_dir, node.get_cassandra_version(), digest)
+    if not os.path.exists(archive_dir()):
+        os.makedirs(archive_dir())
+    _remove_stale(path)
+    dumped = '{}.{}.{}.tmp'.format(path, node.cluster.name, node.name)
+    env[JARS_FIRST_ENV] = 'true'
+    # A dump left by an earlier run of this node, which isn't running now
+    if adopt(dumped, path):
+        return ['-XX:SharedArchiveFile={}'.format(path)]
+    node._cds_dump = (dumped, path)
+    return ['-XX:ArchiveClassesAtExit={}'.format(dumped)]
@@ -1,7 +1,6 @@
 # ccm clusters
 from __future__ import absolute_import
 
-import itertools
 import os
 import random
 import shutil
@@ -11,12 +10,19 @@ import sys
 import threading
 import time
 from collections import OrderedDict, defaultdict, namedtuple
+from contextlib import contextmanager
+from functools import partial
 
-import yaml
 from six import iteritems, print_
 
-from ccmlib import common, extension, repository
+from ccmlib import (common, compaction_log, config_session, extension, gc_log, gossip, parallel, readiness, repository,
+                    resources, timeline, timings)
+from ccmlib.config_session import ConfigSession
+from ccmlib.log_errors import ErrorExtractor
+from ccmlib.log_tailer import LogTailer
 from ccmlib.node import Node, NodeError, TimeoutError
+from ccmlib.process import wait_for_pidfiles
+from ccmlib.timings import Timings
 from six.moves import xrange
 
 
@@ -30,6 +36,10 @@ class Cluster(object):
         self._config_options = {}
         self._dse_config_options = {}
         self._environment_variables = {}
+        # How the host memory and CPUs are split between the nodes, if they are (see plan_resources)
+        self.resource_plan = None
+        # The configuration changes not written yet, if in a config_session
+        self._config_session = None
         self.__log_level = "INFO"
         self.__path = path
         self.__version = None
@@ -38,6 +48,9 @@ class Cluster(object):
         self._debug = []
         self._trace = []
         self.data_dir_count = 1
+        self._log_tailer = LogTailer()
+        # Phase timings of the last start and stop, by operation
+        self.timings = {}
 
         if self.name.lower() == "current":
             raise RuntimeError("Cannot name a cluster 'current'.")
@@ -102,7 +115,7 @@ class Cluster(object):
 
         # if any nodes have a data center, let's update the topology
         if any([node.data_center for node in self.nodes.values()]):
-            self.__update_topology_files()
+            self._update_topology_files()
 
         return self
 
@@ -130,35 +143,45 @@ class Cluster(object):
                 self.daemon = True  # set so that thread will exit when main thread exits
                 self.req_stop_event = threading.Event()
                 self.done_event = threading.Event()
-                self.log_positions = defaultdict(int)
-
-            def scan(self):
+                self.lock = threading.Lock()
+                self.subscriptions = {}
+                self.extractors = {}
+                self.errors = defaultdict(list)
+                self.advanced = set()
+
+            def subscribe(self, node):
+                extractor = self.extractors[node.name] = ErrorExtractor()
+
+                def collect(line, offset):
+                    with self.lock:
+                        self.advanced.add(node.name)
+                        record = extractor.feed(line, offset)
+                        if record is not None:
+                            self.errors[node.name].append(record.lines)
+                self.subscriptions[node.name] = self.cluster.log_tailer().subscribe(node.logfilename(), [], from_mark=0, callback=collect)
+
+            def scan(self, final=False):
                 errordata = OrderedDict()
 
-                try:
-                    for node in self.cluster.nodelist():
-                        scan_from_mark = self.log_positions[node.name]
-                        next_time_scan_from_mark = node.mark_log()
-                        if next_time_scan_from_mark == scan_from_mark:
-                            # log hasn't advanced, nothing to do for this node
-                            continue
-                        else:
-                            errors = node.grep_log_for_errors_from(seek_start=scan_from_mark)
-                        self.log_positions[node.name] = next_time_scan_from_mark
-                        if errors:
-                            errordata[node.name] = errors
-                except IOError as e:
-                    if 'No such file or directory' in str(e.strerror):
-                        pass  # most likely log file isn't yet written
-
-                    # in the case of unexpected error, report this thread to the callback
-                    else:
-                        errordata['log_scanner'] = [[str(e)]]
+                for node in self.cluster.nodelist():
+                    if node.name not in self.subscriptions:
+                        self.subscribe(node)
+                    with self.lock:
+                        # An error is complete when the next log line comes in, or
+                        # when its log hasn't advanced for a whole interval
+                        if final or node.name not in self.advanced:
+                            record = self.extractors[node.name].flush()
+                            if record is not None:
+                                self.errors[node.name].append(record.lines)
+                        self.advanced.discard(node.name)
+                        errors = self.errors.pop(node.name, None)
+                    if errors:
+                        errordata[node.name] = errors
 
                 return errordata
 
-            def scan_and_report(self):
-                errordata = self.scan()
+            def scan_and_report(self, final=False):
+                errordata = self.scan(final)
 
                 if errordata:
                     on_error_call(errordata)
@@ -171,10 +194,14 @@ class Cluster(object):
                     self.scan_and_report()
                     time.sleep(interval)
 
+                tailer = self.cluster.log_tailer()
                 try:
                     # do a final scan to make sure we got to the very end of the files
-                    self.scan_and_report()
+                    tailer.poll([sub.path for sub in self.subscriptions.values()])
+                    self.scan_and_report(final=True)
                 finally:
+                    for sub in self.subscriptions.values():
+                        tailer.remove(sub)
                     common.debug("Log-watching thread exiting.")
                     # done_event signals that the scan completed a final pass
                     self.done_event.set()
@@ -190,6 +217,13 @@ class Cluster(object):
         log_watcher.start()
         return log_watcher
 
+    def log_tailer(self):
+        """
+        Returns the LogTailer shared by all the log watches on the nodes of
+        this cluster, so that each log file is read only once.
+        """
+        return self._log_tailer
+
     def get_install_dir(self):
         common.validate_install_dir(self.__install_dir)
         return self.__install_dir
@@ -222,11 +256,15 @@ class Cluster(object):
             node.set_log_level("TRACE", trace_class)
 
         if data_center is not None:
-            self.__update_topology_files()
+            self._update_topology_files()
         node._save()
         return self
 
     def populate(self, nodes, debug=False, tokens=None, use_vnodes=False, ipprefix='127.0.0.', ipformat=None, install_byteman=False):
+        with self.config_session():
+            return self.__populate(nodes, debug, tokens, use_vnodes, ipprefix, ipformat, install_byteman)
+
+    def __populate(self, nodes, debug, tokens, use_vnodes, ipprefix, ipformat, install_byteman):
         node_count = nodes
         dcs = []
 
@@ -342,8 +380,7 @@ class Cluster(object):
 
     def clear(self):
         self.stop()
-        for node in list(self.nodes.values()):
-            node.clear()
+        parallel.run([(node, node.clear) for node in list(self.nodes.values())])
 
     def get_path(self):
         return os.path.join(self.__path, self.name)
@@ -367,10 +404,27 @@ class Cluster(object):
 
     def start(self, no_wait=False, verbose=False, wait_for_binary_proto=True,
               wait_other_notice=True, jvm_args=None, profile_options=None,
-              quiet_start=False, allow_root=False):
+              quiet_start=False, allow_root=False, concurrency=None, timeout=300):
+        """
+        Starts the nodes that are not running. Seeds are launched first, and
+        unless no_wait, the other nodes only once the seeds are listening for
+        clients. At most concurrency nodes (all of them if None) are starting
+        at any time: a node takes up a slot until it is listening for
+        clients. The waits for the nodes to be up and to see each other then
+        all run concurrently, and everything must complete within timeout
+        seconds. Returns None if node processes exited before listening for
+        clients. Any other failure on one node raises its error, and
+        failures on several a parallel.ParallelError (a NodeError).
+        """
+        timer = Timings('start', self.name)
         if jvm_args is None:
             jvm_args = []
 
+        if self.resource_plan is not None and self.resource_plan['nodes'] != len(self.nodes):
+            # Nodes were added or removed since the plan was made
+            self.plan_resources(self.resource_plan['budget'])
+        self.flush_config()
+
         extension.pre_cluster_start(self)
 
         common.assert_jdk_valid_for_cassandra_version(self.cassandra_version())
@@ -382,61 +436,120 @@ class Cluster(object):
                     if itf is not None:
                         common.assert_socket_available(itf)
 
-        started = []
-        for node in list(self.nodes.values()):
-            if not node.is_running():
-                mark = 0
-                if os.path.exists(node.logfilename()):
-                    mark = node.mark_log()
-
-                p = node.start(update_pid=False, jvm_args=jvm_args, profile_options=profile_options, verbose=verbose, quiet_start=quiet_start, allow_root=allow_root)
-
+        timer.mark('checks')
+
+        deadline = parallel.Deadline(timeout)
+        to_start = [node for node in list(self.nodes.values()) if not node.is_running()]
+        seeds = [node for node in to_start if node in self.seeds]
+        others = [node for node in to_start if node not in self.seeds]
+        # Nodes that were already running must also see the new ones
+        running = [(node, node.mark_log()) for node in list(self.nodes.values()) if node.is_live()]
+        cql_message = "Starting listening for CQL clients"
+        start_message = "Listening for thrift clients..." if self.cassandra_version() < "2.2" else cql_message
+        spawn_lock = threading.Lock()
+
+        def launch(node):
+            mark = 0
+            if os.path.exists(node.logfilename()):
+                mark = node.mark_log()
+            with spawn_lock:
+                p = node.start(update_pid=False, wait_other_notice=False, jvm_args=list(jvm_args), profile_options=profile_options,
+                               verbose=verbose, quiet_start=quiet_start, allow_root=allow_root)
                 # Prior to JDK8, starting every node at once could lead to a
                 # nanotime collision where the RNG that generates a node's tokens
                 # gives identical tokens to several nodes. Thus, we stagger
                 # the node starts
                 if common.get_jdk_version() < '1.8':
                     time.sleep(1)
+            if not no_wait:
+                node.watch_log_for(start_message, timeout=deadline.remaining(), process=p, verbose=verbose, from_mark=mark)
+                node_timer = getattr(p, 'timings', None)
+                if node_timer is not None:
+                    node_timer.mark('start_log')
+                    node._record_timings(node_timer)
+            return node, p, mark
+
+        # The other nodes join through the seeds, which must be up first
+        started = []
+        try:
+            for group in (seeds, others):
+                started += list(parallel.run([(node, partial(launch, node)) for node in group], concurrency).values())
+        except RuntimeError:
+            # The node process exited, and watch_log_for printed its output
+            return None
+        except parallel.ParallelError as e:
+            if all(isinstance(error, RuntimeError) for error in e.errors.values()):
+                return None
+            raise
 
-                started.append((node, p, mark))
+        timer.mark('launch')
 
         if no_wait:
             time.sleep(2)  # waiting 2 seconds to check for early errors and for the pid to be set
-        else:
-            for node, p, mark in started:
-                try:
-                    start_message = "Listening for thrift clients..." if self.cassandra_version() < "2.2" else "Starting listening for CQL clients"
-                    node.watch_log_for(start_message, timeout=60, process=p, verbose=verbose, from_mark=mark)
-                except RuntimeError:
-                    return None
 
         self.__update_pids(started)
+        timer.mark('pidfiles')
 
         for node, p, _ in started:
             if not node.is_running():
                 raise NodeError("Error starting {0}.".format(node.name), p)
 
-        if not no_wait:
-            if wait_other_notice:
-                for (node, _, mark), (other_node, _, _) in itertools.permutations(started, 2):
-                    node.watch_log_for_alive(other_node, from_mark=mark)
-
-            if wait_for_binary_proto:
-                for node, p, mark in started:
-                    node.wait_for_binary_interface(process=p, verbose=verbose, from_mark=mark)
+        if not no_wait and (wait_other_notice or wait_for_binary_proto):
+            new_nodes = [node for node, _, _ in started]
+            convergence = None
+            if wait_other_notice and new_nodes:
+                # Each log is read once to fill the whole "sees as UP" matrix
+                observers = [(node, mark) for node, _, mark in started] + running
+                convergence = gossip.Convergence([node for node, _ in observers], new_nodes,
+                                                 marks=dict((node.name, mark) for node, mark in observers)).start()
+            try:
+                if wait_for_binary_proto:
+                    if cql_message != start_message and self.version() >= '1.2':
+                        parallel.run([(node, partial(node.watch_log_for, cql_message, timeout=deadline.remaining(), process=p,
+                                                     verbose=verbose, from_mark=mark))
+                                      for node, p, mark in started])
+                        timer.mark('cql_log')
+                    # Handshake with all the native transports at once
+                    readiness.wait_for_native_transport(new_nodes, timeout=deadline.remaining())
+                    timer.mark('native_transport')
+                if convergence is not None:
+                    if not convergence.wait(deadline.remaining()):
+                        raise TimeoutError(time.strftime("%d %b %Y %H:%M:%S", time.gmtime()) + " Gossip did not converge: " +
+                                           gossip.describe(convergence.missing()))
+                    timer.mark('gossip')
+            finally:
+                if convergence is not None:
+                    convergence.close()
 
         extension.post_cluster_start(self)
+        self.__record_timings(timer)
 
         return started
 
-    def stop(self, wait=True, signal_event=signal.SIGTERM, **kwargs):
-        not_running = []
+    def stop(self, wait=True, signal_event=signal.SIGTERM, grace_period=None, **kwargs):
+        """
+        Stops all the nodes at once and waits for them to exit concurrently,
+        killing those still running grace_period seconds after being
+        signalled (if set). Returns the nodes that were not running. A
+        failure on one node raises its NodeError, and failures on several a
+        parallel.ParallelError (also a NodeError).
+        """
+        timer = Timings('stop', self.name)
         extension.pre_cluster_stop(self)
-        for node in list(self.nodes.values()):
-            if not node.stop(wait=wait, signal_event=signal_event, **kwargs):
-                not_running.append(node)
+        stopped = self.stop_nodes(list(self.nodes.values()), wait=wait, signal_event=signal_event, grace_period=grace_period, **kwargs)
+        timer.mark('stop_nodes')
         extension.post_cluster_stop(self)
-        return not_running
+        if any(stopped.values()):
+            self.__record_timings(timer)
+        return [self.nodes[name] for name, was_running in stopped.items() if not was_running]
+
+    def stop_nodes(self, nodes, wait=True, signal_event=signal.SIGTERM, grace_period=None, **kwargs):
+        """
+        Stops the given nodes concurrently (see Node.stop). Returns whether
+        each node was running, by node name.
+        """
+        return parallel.run([(node, partial(node.stop, wait=wait, signal_event=signal_event, grace_period=grace_period, **kwargs))
+                             for node in nodes])
 
     def set_log_level(self, new_level, class_names=None):
         class_names = class_names or []
@@ -510,7 +623,25 @@ class Cluster(object):
             self._config_options = common.merge_configuration(self._config_options, values)
 
         self._persist_config()
-        self.__update_topology_files()
+        self._update_topology_files()
+        return self
+
+    def plan_resources(self, budget=resources.DEFAULT_BUDGET, memory=None, cpus=None):
+        """
+        Splits budget (a fraction) of the host memory, and the host CPUs,
+        between the nodes: sets their heap sizes and the matching
+        concurrency, memtable and compaction options (see resources.plan).
+        Options and environment variables set on the cluster or on a node
+        take precedence. The plan is kept in cluster.conf, and made again by
+        start if nodes were added or removed. A budget of None drops the plan.
+        """
+        if budget is None:
+            # cassandra.yaml is rendered from the install's, so the planned
+            # options go away with the plan
+            self.resource_plan = None
+        else:
+            self.resource_plan = resources.plan(len(self.nodes), self.cassandra_version(), budget=budget, memory=memory, cpus=cpus)
+        self._persist_config()
         return self
 
     def set_batch_commitlog(self, enabled):
@@ -581,7 +712,39 @@ class Cluster(object):
     def __get_version_from_build(self):
         return common.get_version_from_build(self.get_install_dir())
 
+    @contextmanager
+    def config_session(self):
+        """
+        Collects the changes made to the configuration of the cluster and of
+        its nodes within a with block, and writes each changed file once, at
+        the end of the block, rather than on every change. Starting the
+        cluster or one of its nodes within the block writes the pending
+        changes first (see flush_config). Nested sessions join the outer one.
+        Pending changes are written even if the block raises, as they would
+        have been without a session.
+        """
+        if self._config_session is not None:
+            yield self._config_session
+            return
+        session = ConfigSession(self)
+        self._config_session = session
+        try:
+            yield session
+        finally:
+            self._config_session = None
+            session.flush()
+
+    def flush_config(self):
+        """
+        Writes the configuration changes pending in a config_session, if any.
+        """
+        if self._config_session is not None:
+            self._config_session.flush()
+
     def _update_config(self):
+        if self._config_session is not None:
+            self._config_session.defer_cluster(config_session.CONF)
+            return
         node_list = [node.name for node in list(self.nodes.values())]
         seed_list = self.get_seeds()
         filename = os.path.join(self.__path, self.name, 'cluster.conf')
@@ -596,17 +759,29 @@ class Cluster(object):
             'log_level': self.__log_level,
             'use_vnodes': self.use_vnodes,
             'datadirs': self.data_dir_count,
-            'environment_variables': self._environment_variables
+            'environment_variables': self._environment_variables,
+            'resource_plan': self.resource_plan
         }
         extension.append_to_cluster_config(self, config_map)
-        with open(filename, 'w') as f:
-            yaml.safe_dump(config_map, f)
+        common.write_if_changed(filename, common.dump_yaml(config_map))
+
+    def __record_timings(self, timer):
+        self.timings[timer.operation] = timer
+        try:
+            timings.record(self.get_path(), timer)
+        except (IOError, OSError) as e:
+            common.warning("Could not save the {} timings of {}: {}".format(timer.operation, self.name, e))
 
     def __update_pids(self, started):
+        # Wait for all the pidfiles at once, then just read them
+        wait_for_pidfiles(dict((node._pidfile(), node._read_pid) for node, _, _ in started))
         for node, p, _ in started:
-            node._update_pid(p)
+            node._update_pid(p, timeout=0)
 
-    def __update_topology_files(self):
+    def _update_topology_files(self):
+        if self._config_session is not None:
+            self._config_session.defer_cluster(config_session.TOPOLOGY)
+            return
         dcs = [('default', 'dc1')]
         for node in self.nodelist():
             if node.data_center is not None:
@@ -618,8 +793,7 @@ class Cluster(object):
 
         for node in self.nodelist():
             topology_file = os.path.join(node.get_conf_dir(), 'cassandra-topology.properties')
-            with open(topology_file, 'w') as f:
-                f.write(content)
+            common.write_if_changed(topology_file, content)
 
     def enable_ssl(self, ssl_path, require_client_auth):
         shutil.copyfile(os.path.join(ssl_path, 'keystore.jks'), os.path.join(self.get_path(), 'keystore.jks'))
@@ -688,3 +862,50 @@ class Cluster(object):
 
     def wait_for_any_log(self, pattern, timeout, filename='system.log'):
         return common.wait_for_any_log(self.nodelist(), pattern, timeout, filename=filename)
+
+    def timeline(self, since=None, until=None, levels=None, logs=('system',), nodes=None):
+        """
+        Returns an iterator over the entries of the logs of the nodes (all of
+        them by default), interleaved by timestamp. logs selects among the
+        'system', 'debug' and 'gc' logs. Entries can be restricted to a time
+        window (since inclusive, until exclusive, as datetimes) and to a list
+        of levels. Logs are read lazily, one entry per log at a time.
+        """
+        for log in logs:
+            if log not in timeline.LOG_KINDS:
+                raise common.ArgumentError("Unknown log {}, expecting one of {}".format(log, ", ".join(sorted(timeline.LOG_KINDS))))
+        return timeline.timeline(nodes if nodes is not None else self.nodelist(), logs, since=since, until=until, levels=levels)
+
+    def gc_summary(self, since=None, until=None, marks=None):
+        """
+        Returns the GcStats of each node, by node name. marks can map node
+        names to marks returned by Node.mark_gc_log, to only consider the
+        pauses after them. GcStats.combine gives the cluster-wide figures.
+        """
+        marks = marks or {}
+        return OrderedDict((node.name, node.gc_stats(since=since, until=until, from_mark=marks.get(node.name)))
+                           for node in self.nodelist())
+
+    def check_gc_pauses(self, max_p99, since=None, until=None, marks=None):
+        """
+        Raises GcPauseError if the 99th percentile GC pause of any node, or
+        of the whole cluster, is longer than max_p99 ms. Returns the
+        cluster-wide GcStats otherwise.
+        """
+        return gc_log.check_pauses(self.gc_summary(since=since, until=until, marks=marks), max_p99)
+
+    def compaction_summary(self, since=None, until=None):
+        """
+        Returns the TableCompactionStats of each node, by node name and then
+        by (keyspace, table). compaction_log.combine gives the cluster-wide
+        figures of each table.
+        """
+        return OrderedDict((node.name, node.compaction_stats(since=since, until=until)) for node in self.nodelist())
+
+    def wait_for_any_log_async(self, pattern, timeout, filename='system.log'):
+        """
+        Coroutine version of wait_for_any_log, for use from an asyncio event
+        loop. Requires Python 3.5 or later.
+        """
+        from ccmlib import aio
+        return aio.wait_for_any_log(self.nodelist(), pattern, timeout, filename=filename)
@@ -3,8 +3,6 @@ from __future__ import absolute_import
 
 import os
 
-import yaml
-
 from ccmlib import common, extension, repository
 from ccmlib.cluster import Cluster
 from ccmlib.dse_cluster import DseCluster
@@ -18,7 +16,7 @@ class ClusterFactory():
         cluster_path = os.path.join(path, name)
         filename = os.path.join(cluster_path, 'cluster.conf')
         with open(filename, 'r') as f:
-            data = yaml.load(f)
+            data = common.load_yaml(f)
         try:
             install_dir = None
             if 'install_dir' in data:
@@ -46,6 +44,8 @@ class ClusterFactory():
                 cluster.use_vnodes = data['use_vnodes']
             if 'datadirs' in data:
                 cluster.data_dir_count = int(data['datadirs'])
+            if data.get('resource_plan') is not None:
+                cluster.resource_plan = data['resource_plan']
             extension.load_from_cluster_config(cluster, data)
         except KeyError as k:
             raise common.LoadError("Error Loading " + filename + ", missing property:" + k)
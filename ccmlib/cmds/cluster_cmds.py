@@ -5,11 +5,12 @@ import os
 import signal
 import subprocess
 import sys
+from datetime import datetime
 
 import yaml
 from six import print_
 
-from ccmlib import common, repository
+from ccmlib import common, repository, resources, timeline, timings
 from ccmlib.cluster import Cluster
 from ccmlib.cluster_factory import ClusterFactory
 from ccmlib.cmds.command import Cmd
@@ -17,6 +18,7 @@ from ccmlib.common import ArgumentError
 from ccmlib.dse_cluster import DseCluster
 from ccmlib.dse_node import DseNode
 from ccmlib.node import Node, NodeError
+from ccmlib.parallel import ParallelError
 
 CLUSTER_CMDS = [
     "create",
@@ -46,7 +48,10 @@ CLUSTER_CMDS = [
     "checklogerror",
     "showlastlog",
     "jconsole",
-    "setworkload"
+    "setworkload",
+    "timeline",
+    "timings",
+    "planresources"
 ]
 
 
@@ -562,6 +567,10 @@ class ClusterStartCmd(Cmd):
                           help="Yourkit options when profiling", default=None)
         parser.add_option('--quiet-windows', action="store_true", dest="quiet_start", help="Pass -q on Windows 2.2.4+ and 3.0+ startup. Ignored on linux.", default=False)
         parser.add_option('--root', action="store_true", dest="allow_root", help="Allow CCM to start cassandra as root", default=False)
+        parser.add_option('--concurrency', type="int", dest="concurrency",
+                          help="Maximum number of nodes starting at the same time (default: all of them)", default=None)
+        parser.add_option('--timeout', type="int", dest="timeout",
+                          help="Seconds for the whole cluster to be up (default: 300)", default=300)
         return parser
 
     def validate(self, parser, options, args):
@@ -591,17 +600,23 @@ class ClusterStartCmd(Cmd):
                                   jvm_args=self.options.jvm_args,
                                   profile_options=profile_options,
                                   quiet_start=self.options.quiet_start,
-                                  allow_root=self.options.allow_root) is None:
+                                  allow_root=self.options.allow_root,
+                                  concurrency=self.options.concurrency,
+                                  timeout=self.options.timeout) is None:
                 details = ""
                 if not self.options.verbose:
                     details = " (you can use --verbose for more information)"
                 print_("Error starting nodes, see above for details%s" % details, file=sys.stderr)
                 exit(1)
+        except ParallelError as e:
+            print_("Error starting nodes:\n{}".format(e), file=sys.stderr)
+            exit(1)
         except NodeError as e:
             print_(str(e), file=sys.stderr)
-            print_("Standard error output is:", file=sys.stderr)
-            for line in e.process.stderr:
-                print_(line.rstrip('\n'), file=sys.stderr)
+            if e.process is not None:
+                print_("Standard error output is:", file=sys.stderr)
+                for line in e.process.stderr:
+                    print_(line.rstrip('\n'), file=sys.stderr)
             exit(1)
 
 
@@ -633,6 +648,8 @@ class ClusterStopCmd(Cmd):
         parser.add_option('--not-gently', action="store_const", dest="signal_event",
                           help="Shut down immediately (kill -9)",
                           const=default_signal_events['9'])
+        parser.add_option('--grace-period', type="int", dest="grace_period",
+                          help="Kill (kill -9) the nodes still running this many seconds after the shutdown signal", default=None)
         return parser
 
     def validate(self, parser, options, args):
@@ -640,7 +657,8 @@ class ClusterStopCmd(Cmd):
 
     def run(self):
         try:
-            not_running = self.cluster.stop(wait=not self.options.no_wait, signal_event=self.options.signal_event)
+            not_running = self.cluster.stop(wait=not self.options.no_wait, signal_event=self.options.signal_event,
+                                            grace_period=self.options.grace_period)
             if self.options.verbose and len(not_running) > 0:
                 sys.stdout.write("The following nodes were not running: ")
                 for node in not_running:
@@ -753,11 +771,12 @@ class ClusterUpdateconfCmd(Cmd):
                 self.setting['truncate_request_timeout_in_ms'] = self.options.rpc_timeout
                 self.setting['request_timeout_in_ms'] = self.options.rpc_timeout
 
-        self.cluster.set_configuration_options(values=self.setting)
-        if self.options.cl_batch:
-            self.cluster.set_batch_commitlog(True)
-        if self.options.cl_periodic:
-            self.cluster.set_batch_commitlog(False)
+        with self.cluster.config_session():
+            self.cluster.set_configuration_options(values=self.setting)
+            if self.options.cl_batch:
+                self.cluster.set_batch_commitlog(True)
+            if self.options.cl_periodic:
+                self.cluster.set_batch_commitlog(False)
 
 
 class ClusterUpdatedseconfCmd(Cmd):
@@ -1042,3 +1061,142 @@ class ClusterSetworkloadCmd(Cmd):
         except common.ArgumentError as e:
             print_(str(e), file=sys.stderr)
             exit(1)
+
+
+class ClusterTimelineCmd(Cmd):
+
+    def description(self):
+        return "Print the logs of all nodes interleaved by timestamp"
+
+    def get_parser(self):
+        usage = "usage: ccm timeline [options]"
+        parser = self._get_default_parser(usage, self.description())
+        parser.add_option('--since', type="string", dest="since", default=None,
+                          help="Only show entries from this time on (format: YYYY-MM-DD HH:MM:SS)")
+        parser.add_option('--until', type="string", dest="until", default=None,
+                          help="Only show entries before this time (format: YYYY-MM-DD HH:MM:SS)")
+        parser.add_option('-l', '--level', type="string", dest="levels", default=None,
+                          help="Comma separated list of levels to show (e.g. WARN,ERROR)")
+        parser.add_option('--logs', type="string", dest="logs", default="system",
+                          help="Comma separated list of logs to merge, among system, debug and gc (default: system)")
+        parser.add_option('-n', '--nodes', type="string", dest="nodes", default=None,
+                          help="Comma separated list of nodes whose logs to merge (default: all)")
+        return parser
+
+    def validate(self, parser, options, args):
+        Cmd.validate(self, parser, options, args, load_cluster=True)
+        try:
+            self.since = self.__parse_time(options.since)
+            self.until = self.__parse_time(options.until)
+        except ValueError as e:
+            print_(str(e), file=sys.stderr)
+            exit(1)
+        self.levels = options.levels.upper().split(',') if options.levels else None
+        self.logs = options.logs.split(',')
+        self.nodes = None
+        if options.nodes:
+            try:
+                self.nodes = [self.cluster.nodes[name] for name in options.nodes.split(',')]
+            except KeyError as e:
+                print_("Unknown node {}".format(e), file=sys.stderr)
+                exit(1)
+
+    def __parse_time(self, value):
+        if value is None:
+            return None
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+        raise ValueError("Invalid time {}, expecting YYYY-MM-DD HH:MM:SS".format(value))
+
+    def run(self):
+        try:
+            entries = self.cluster.timeline(since=self.since, until=self.until, levels=self.levels,
+                                            logs=self.logs, nodes=self.nodes)
+            for entry in entries:
+                print_(timeline.format_entry(entry))
+        except common.ArgumentError as e:
+            print_(str(e), file=sys.stderr)
+            exit(1)
+
+
+class ClusterTimingsCmd(Cmd):
+
+    def description(self):
+        return "Print how long each phase of the last starts or stops of the cluster and its nodes took"
+
+    def get_parser(self):
+        usage = "usage: ccm timings [options]"
+        parser = self._get_default_parser(usage, self.description())
+        parser.add_option('-o', '--operation', type="choice", choices=["start", "stop"], dest="operation", default="start",
+                          help="Operation whose timings to print, start or stop (default: start)")
+        parser.add_option('-r', '--runs', type="int", dest="runs", default=2,
+                          help="Number of runs to print side by side, latest last (default: 2)")
+        parser.add_option('-n', '--nodes', type="string", dest="nodes", default=None,
+                          help="Comma separated list of nodes whose timings to print (default: all)")
+        return parser
+
+    def validate(self, parser, options, args):
+        Cmd.validate(self, parser, options, args, load_cluster=True)
+        if options.runs < 1:
+            print_("--runs must be at least 1", file=sys.stderr)
+            exit(1)
+        self.nodes = list(self.cluster.nodelist())
+        if options.nodes:
+            try:
+                self.nodes = [self.cluster.nodes[name] for name in options.nodes.split(',')]
+            except KeyError as e:
+                print_("Unknown node {}".format(e), file=sys.stderr)
+                exit(1)
+
+    def run(self):
+        paths = [self.cluster.get_path()] + [node.get_path() for node in self.nodes]
+        printed = False
+        for path in paths:
+            runs = timings.load(path, self.options.operation)[-self.options.runs:]
+            if runs:
+                if printed:
+                    print_("")
+                for line in timings.format_runs(runs):
+                    print_(line)
+                printed = True
+        if not printed:
+            print_("No {} timings recorded".format(self.options.operation), file=sys.stderr)
+
+
+class ClusterPlanresourcesCmd(Cmd):
+
+    def description(self):
+        return "Split the host memory and CPUs between the nodes, setting their heap and concurrency options"
+
+    def get_parser(self):
+        usage = "usage: ccm planresources [options]"
+        parser = self._get_default_parser(usage, self.description())
+        parser.add_option('-b', '--budget', type="float", dest="budget", default=resources.DEFAULT_BUDGET,
+                          help="Fraction of the host memory to split between the nodes (default: {})".format(resources.DEFAULT_BUDGET))
+        parser.add_option('--show', action="store_true", dest="show", default=False,
+                          help="Only print the current plan")
+        parser.add_option('--disable', action="store_true", dest="disable", default=False,
+                          help="Drop the plan, going back to the default heap and options")
+        return parser
+
+    def validate(self, parser, options, args):
+        Cmd.validate(self, parser, options, args, load_cluster=True)
+
+    def run(self):
+        if self.options.disable:
+            self.cluster.plan_resources(None)
+            return
+        if not self.options.show:
+            try:
+                self.cluster.plan_resources(self.options.budget)
+            except common.ArgumentError as e:
+                print_(str(e), file=sys.stderr)
+                exit(1)
+        if self.cluster.resource_plan is None:
+            print_("No resource plan", file=sys.stderr)
+            return
+        for line in resources.describe(self.cluster.resource_plan):
+            print_(line)
@@ -6,6 +6,7 @@ from __future__ import absolute_import
 
 import copy
 import fnmatch
+import hashlib
 import logging
 import os
 import platform
@@ -15,6 +16,7 @@ import socket
 import stat
 import subprocess
 import sys
+import threading
 import time
 from distutils.version import LooseVersion  #pylint: disable=import-error, no-name-in-module
 
@@ -39,6 +41,11 @@ CASSANDRA_SH = "cassandra.in.sh"
 CONFIG_FILE = "config"
 CCM_CONFIG_DIR = "CCM_CONFIG_DIR"
 
+# How the files of an install directory get into the nodes: copied (the
+# default), or hardlinked or symlinked, and copied only once ccm edits them
+LINK_INSTALL_FILES = "CCM_LINK_INSTALL_FILES"
+LINK_MODES = ("copy", "hardlink", "symlink")
+
 logging.basicConfig(format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
                     datefmt='%H:%M:%S',
                     level=logging.DEBUG
@@ -153,7 +160,49 @@ def get_config():
         return {}
 
     with open(config_path, 'r') as f:
-        return yaml.load(f)
+        return load_yaml(f)
+
+
+# The libyaml bindings are much faster, when PyYAML was built with them
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+_yaml_templates = {}
+_yaml_templates_lock = threading.Lock()
+
+
+def load_yaml(stream):
+    """
+    Parses YAML (a string or a file), like yaml.safe_load.
+    """
+    return yaml.load(stream, Loader=_YAML_LOADER)
+
+
+def dump_yaml(data, stream=None, **kwargs):
+    """
+    Serializes data to YAML, like yaml.safe_dump.
+    """
+    return yaml.dump(data, stream, Dumper=_YAML_DUMPER, **kwargs)
+
+
+def load_yaml_template(path):
+    """
+    Returns the parsed content of a YAML file that rarely changes, such as
+    the cassandra.yaml of an install directory, and its text. Files are
+    parsed once per process, then again only if their modification time or
+    size changed. Callers get their own copy of the content.
+    """
+    st = os.stat(path)
+    key = (st.st_mtime, st.st_size)
+    with _yaml_templates_lock:
+        cached = _yaml_templates.get(path)
+    if cached is None or cached[0] != key:
+        with open(path, 'r') as f:
+            text = f.read()
+        cached = (key, load_yaml(text), text)
+        with _yaml_templates_lock:
+            _yaml_templates[path] = cached
+    return copy.deepcopy(cached[1]), cached[2]
 
 
 def now_ms():
@@ -183,22 +232,227 @@ def switch_cluster(path, new_name):
         f.write(new_name + '\n')
 
 
+def _digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def write_if_changed(file, content):
+    """
+    Writes content to file, through a temporary file moved into place,
+    unless the file already holds exactly that content (same size and
+    hash). Text gets the platform line endings, as in text mode. Returns
+    whether the file was written.
+    """
+    data = content if isinstance(content, bytes) else content.replace('\n', os.linesep).encode('utf-8')
+    if os.path.isfile(file) and os.path.getsize(file) == len(data) and _digest(file) == hashlib.sha1(data).digest():
+        return False
+    file_tmp = file + "." + str(os.getpid()) + ".tmp"
+    with open(file_tmp, 'wb') as f_tmp:
+        f_tmp.write(data)
+    shutil.move(file_tmp, file)
+    return True
+
+
+def copy_if_changed(src, dst):
+    """
+    Copies src to dst (a file or a directory) like shutil.copy, unless dst
+    already has the same content. Returns whether it copied.
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if os.path.isfile(dst) and os.path.getsize(dst) == os.path.getsize(src) and _digest(dst) == _digest(src):
+        return False
+    _unlink_shared(dst)
+    shutil.copy(src, dst)
+    return True
+
+
+def is_shared(path):
+    """
+    Returns whether path is a symlink, or a file with other hardlinks, whose
+    content must not be modified in place.
+    """
+    return os.path.islink(path) or (os.path.isfile(path) and os.stat(path).st_nlink > 1)
+
+
+def _unlink_shared(path):
+    # Before overwriting a file, so that the write doesn't go through a link
+    if is_shared(path):
+        os.remove(path)
+
+
+def copy_on_write(path):
+    """
+    Replaces a shared file (see is_shared) with a copy of its own, before it
+    is modified in place. Files written with write_if_changed need not be:
+    the new content replaces the link.
+    """
+    if not is_shared(path):
+        return False
+    path_tmp = path + "." + str(os.getpid()) + ".tmp"
+    shutil.copy2(path, path_tmp)
+    shutil.move(path_tmp, path)
+    return True
+
+
+def link_mode():
+    """
+    Returns how install files get into nodes, from the CCM_LINK_INSTALL_FILES
+    environment variable: "copy" (the default), "hardlink" or "symlink".
+    """
+    mode = os.environ.get(LINK_INSTALL_FILES, '').strip().lower() or 'copy'
+    if mode not in LINK_MODES:
+        raise ArgumentError("{} must be one of {}, got {}".format(LINK_INSTALL_FILES, ', '.join(LINK_MODES), mode))
+    return mode
+
+
+def materialize_file(src, dst, mode=None):
+    """
+    Puts the install file src at dst (a file or a directory): a copy, a
+    hardlink or a symlink to it, depending on mode (see link_mode). Links
+    fall back to copies when they can't be made, e.g. across filesystems.
+    Returns whether dst changed.
+    """
+    mode = mode or link_mode()
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if mode != 'copy':
+        src = os.path.abspath(src)
+        if mode == 'symlink' and os.path.islink(dst) and os.readlink(dst) == src:
+            return False
+        if mode == 'hardlink' and os.path.isfile(dst) and not os.path.islink(dst) and os.path.samefile(src, dst):
+            return False
+        dst_tmp = dst + "." + str(os.getpid()) + ".tmp"
+        try:
+            if mode == 'symlink':
+                os.symlink(src, dst_tmp)
+            else:
+                os.link(src, dst_tmp)
+        except (OSError, AttributeError, NotImplementedError):
+            pass
+        else:
+            shutil.move(dst_tmp, dst)
+            return True
+    return copy_if_changed(src, dst)
+
+
+def materialize_tree(src_dir, dst_dir, mode=None):
+    """
+    Replaces dst_dir with the content of src_dir, like shutil.copytree, but
+    with each file put in place by materialize_file.
+    """
+    mode = mode or link_mode()
+    if os.path.isdir(dst_dir):
+        rmdirs(dst_dir)
+    if mode == 'copy':
+        shutil.copytree(src_dir, dst_dir)
+        return
+    for root, dirs, files in os.walk(src_dir):
+        target = os.path.join(dst_dir, os.path.relpath(root, src_dir))
+        if not os.path.isdir(target):
+            os.makedirs(target)
+        for name in files:
+            materialize_file(os.path.join(root, name), os.path.join(target, name), mode)
+
+
+class EditPlan(object):
+
+    """
+    The line edits to make to a text file, collected first and then applied
+    in a single pass over the file, with a single write. Edits apply in the
+    order they were added, so that a plan does the same as the matching
+    replace_in_file and replaces_or_add_into_file_tail calls made one after
+    the other.
+    """
+
+    CONFIG_CLOSE = "</configuration>"
+
+    def __init__(self, file):
+        self.file = file
+        # (compiled regexp, replacement line, index of its group of tail additions or None)
+        self._rules = []
+        # [replacement line added when no line matched, index of the group's last rule, matched]
+        self._tail = []
+        self._close_config = None
+
+    def replace(self, regexp, replace):
+        """
+        Replaces the lines in which regexp is found with replace.
+        """
+        self._rules.append((re.compile(regexp), replace, None))
+        return self
+
+    def replaces(self, replacement_list):
+        for regexp, replace in replacement_list:
+            self.replace(regexp, replace)
+        return self
+
+    def replaces_or_add(self, replacement_list, add_config_close=True):
+        """
+        Like replaces, but if none of the regexps is found, adds the last
+        replacement at the end of the file. Closing </configuration> tags
+        are dropped, and if the last call asked for add_config_close, one is
+        added back after the additions.
+        """
+        group = len(self._tail)
+        for regexp, replace in replacement_list:
+            self._rules.append((re.compile(regexp), replace, group))
+        self._tail.append([replace, len(self._rules) - 1, False])
+        self._close_config = add_config_close
+        return self
+
+    def __edit(self, line, first_rule=0):
+        for i in range(first_rule, len(self._rules)):
+            r, replace, group = self._rules[i]
+            if r.search(line):
+                line = replace + "\n"
+                if group is not None:
+                    self._tail[group][2] = True
+                if "\n" in replace:
+                    # The following edits see each line of the replacement
+                    return ''.join(self.__edit(part, i + 1) for part in line.splitlines(True))
+        return line
+
+    def render(self):
+        """
+        Returns the content of the file with the edits made.
+        """
+        for addition in self._tail:
+            addition[2] = False
+        lines = []
+        with open(self.file, 'r') as f:
+            for line in f:
+                lines.append(self.__edit(line))
+        for replace, last_rule, matched in self._tail:
+            if not matched:
+                # Later edits apply to the added line, as they would to the file
+                lines.append(self.__edit("\n", last_rule + 1))
+                lines.append(self.__edit(replace + "\n", last_rule + 1))
+        if self._close_config is not None:
+            lines = [line for line in lines if self.CONFIG_CLOSE not in line]
+            if self._close_config:
+                lines.append(self.CONFIG_CLOSE + "\n")
+        return ''.join(lines)
+
+    def apply(self):
+        """
+        Makes the edits. Returns whether the file changed.
+        """
+        if not self._rules:
+            return False
+        return write_if_changed(self.file, self.render())
+
+
 def replace_in_file(file, regexp, replace):
     replaces_in_file(file, [(regexp, replace)])
 
 
 def replaces_in_file(file, replacement_list):
-    rs = [(re.compile(regexp), repl) for (regexp, repl) in replacement_list]
-    file_tmp = file + "." + str(os.getpid()) + ".tmp"
-    with open(file, 'r') as f:
-        with open(file_tmp, 'w') as f_tmp:
-            for line in f:
-                for r, replace in rs:
-                    match = r.search(line)
-                    if match:
-                        line = replace + "\n"
-                f_tmp.write(line)
-    shutil.move(file_tmp, file)
+    EditPlan(file).replaces(replacement_list).apply()
 
 
 def replace_or_add_into_file_tail(file, regexp, replace):
@@ -206,29 +460,7 @@ def replace_or_add_into_file_tail(file, regexp, replace):
 
 
 def replaces_or_add_into_file_tail(file, replacement_list, add_config_close=True):
-    rs = [(re.compile(regexp), repl) for (regexp, repl) in replacement_list]
-    is_line_found = False
-    file_tmp = file + "." + str(os.getpid()) + ".tmp"
-    with open(file, 'r') as f:
-        with open(file_tmp, 'w') as f_tmp:
-            for line in f:
-                for r, replace in rs:
-                    match = r.search(line)
-                    if match:
-                        line = replace + "\n"
-                        is_line_found = True
-                if "</configuration>" not in line:
-                    f_tmp.write(line)
-            # In case, entry is not found, and need to be added
-            if not is_line_found:
-                f_tmp.write('\n' + replace + "\n")
-            # We are moving the closing tag to the end of the file.
-            # Previously, we were having an issue where new lines we wrote
-            # were appearing after the closing tag, and thus being ignored.
-            if add_config_close:
-                f_tmp.write("</configuration>\n")
-
-    shutil.move(file_tmp, file)
+    EditPlan(file).replaces_or_add(replacement_list, add_config_close).apply()
 
 
 def rmdirs(path):
@@ -261,6 +493,7 @@ def make_cassandra_env(install_dir, node_path, update_conf=True):
     cluster_sh_file = os.path.join(node_path, os.path.pardir, 'cassandra.in.sh')
     if os.path.exists(cluster_sh_file):
         append = open(cluster_sh_file).read()
+        copy_on_write(dst)
         with open(dst, 'a') as f:
             f.write('\n\n### Start Cluster wide config ###\n')
             f.write(append)
@@ -542,7 +775,7 @@ def parse_settings(args, literal_yaml=False):
     settings = {}
     if literal_yaml:
         for s in args:
-            settings = dict(settings, **yaml.load(s))
+            settings = dict(settings, **load_yaml(s))
     else:
         for s in args:
             if is_win():
@@ -593,6 +826,7 @@ def parse_settings(args, literal_yaml=False):
 
 def copy_file(src_file, dst_file):
     try:
+        _unlink_shared(dst_file)
         shutil.copy2(src_file, dst_file)
     except (IOError, shutil.Error) as e:
         print_(str(e), file=sys.stderr)
@@ -603,7 +837,7 @@ def copy_directory(src_dir, dst_dir):
     for name in os.listdir(src_dir):
         filename = os.path.join(src_dir, name)
         if os.path.isfile(filename):
-            shutil.copy(filename, dst_dir)
+            materialize_file(filename, dst_dir)
 
 
 def get_version_from_build(install_dir=None, node_path=None):
@@ -665,7 +899,7 @@ def is_dse_cluster(path):
             cluster_path = os.path.join(path, name)
             filename = os.path.join(cluster_path, 'cluster.conf')
             with open(filename, 'r') as f:
-                data = yaml.load(f)
+                data = load_yaml(f)
             if 'dse_dir' in data:
                 return True
     except IOError:
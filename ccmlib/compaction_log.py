@@ -0,0 +1,210 @@
+#
+# Compaction log (compaction.log) parsing and per-table statistics
+#
+# Cassandra writes compaction.log when a table has the 'log_all' compaction
+# option, one json object per line: "enable"/"disable" when a strategy is
+# switched on or off, "flush" with the sstables written by a flush,
+# "compaction" with the input and output sstables of a compaction, and
+# "pending" with the number of compactions a strategy has left to do.
+#
+
+from __future__ import absolute_import
+
+import json
+import math
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from ccmlib.log_reader import RotatingLog
+
+_EPOCH = datetime(1970, 1, 1)
+
+# A compaction or flush of a table. time, start and end are naive UTC
+# datetimes; duration is in seconds (0 for flushes). sstables_before and
+# sstables_after count the live sstables of the table that the log has
+# shown, and tiers_in/tiers_out are the LCS levels of the sstables, or their
+# size tiers (see size_tier) with other strategies.
+CompactionEvent = namedtuple('CompactionEvent', 'kind keyspace table time start end duration bytes_in bytes_out '
+                                                'sstables_in sstables_out sstables_before sstables_after '
+                                                'tier_kind tiers_in tiers_out')
+
+# The number of compactions a table had left to do at some point
+PendingCompactions = namedtuple('PendingCompactions', 'keyspace table time pending')
+
+
+def _time(millis):
+    return _EPOCH + timedelta(milliseconds=int(millis))
+
+
+def size_tier(size):
+    """
+    Groups sstables by size the way size-tiered compaction would, in powers
+    of 4 above 50MB (tier 0 holds everything below).
+    """
+    if size < 50 << 20:
+        return 0
+    return 1 + int(math.log(size / float(50 << 20), 4))
+
+
+def _tiers(sstables):
+    levels = [s.get('details', {}).get('level') for s in sstables]
+    if sstables and None not in levels:
+        return 'level', tuple(sorted(set(levels)))
+    return 'bucket', tuple(sorted(set(size_tier(s.get('size', 0)) for s in sstables)))
+
+
+def parse_events(lines):
+    """
+    Yields a CompactionEvent for each flush and compaction of a compaction
+    log and a PendingCompactions for each pending entry, reading the lines
+    one at a time.
+    """
+    live = {}
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # Most likely a line still being written
+            continue
+        kind = entry.get('type')
+        key = (entry.get('keyspace'), entry.get('table'))
+        if kind == 'pending':
+            yield PendingCompactions(key[0], key[1], _time(entry.get('time', 0)), int(entry.get('pending', 0)))
+            continue
+        if kind == 'flush':
+            inputs, outputs = [], [t['table'] for t in entry.get('tables', [])]
+            start = end = _time(entry.get('time', 0))
+        elif kind == 'compaction':
+            inputs = [t['table'] for t in entry.get('input', [])]
+            outputs = [t['table'] for t in entry.get('output', [])]
+            start, end = _time(entry.get('start', entry.get('time', 0))), _time(entry.get('end', entry.get('time', 0)))
+        else:
+            continue
+        # Sstables that existed before the log was enabled only show up as
+        # compaction inputs
+        input_generations = set(s.get('generation') for s in inputs)
+        before = len(live.get(key, set()) | input_generations)
+        live[key] = (live.get(key, set()) - input_generations) | set(s.get('generation') for s in outputs)
+        tier_kind, tiers_in = _tiers(inputs)
+        out_kind, tiers_out = _tiers(outputs)
+        yield CompactionEvent(kind, key[0], key[1], _time(entry.get('time', 0)), start, end,
+                              (end - start).total_seconds(),
+                              sum(s.get('size', 0) for s in inputs), sum(s.get('size', 0) for s in outputs),
+                              len(inputs), len(outputs), before, len(live[key]),
+                              tier_kind if inputs else out_kind, tiers_in, tiers_out)
+
+
+class TableCompactionStats(object):
+
+    """
+    Aggregates of the flushes and compactions of a table: how many, the
+    bytes they read and wrote, time spent compacting, throughput, and the
+    write amplification (bytes written by flushes and compactions per byte
+    flushed).
+    """
+
+    def __init__(self, keyspace, table):
+        self.keyspace = keyspace
+        self.table = table
+        self.compactions = 0
+        self.flushes = 0
+        self.bytes_flushed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.duration = 0.0
+        self.sstables = 0
+        self.pending = 0
+        self.events = []
+
+    def add(self, event):
+        self.events.append(event)
+        self.sstables = event.sstables_after
+        if event.kind == 'flush':
+            self.flushes += 1
+            self.bytes_flushed += event.bytes_out
+        else:
+            self.compactions += 1
+            self.bytes_in += event.bytes_in
+            self.bytes_out += event.bytes_out
+            self.duration += event.duration
+
+    def throughput(self):
+        """
+        Bytes read per second of compaction.
+        """
+        return self.bytes_in / self.duration if self.duration else 0.0
+
+    def write_amplification(self):
+        if not self.bytes_flushed:
+            return 0.0
+        return (self.bytes_flushed + self.bytes_out) / float(self.bytes_flushed)
+
+    def merge(self, other):
+        self.compactions += other.compactions
+        self.flushes += other.flushes
+        self.bytes_flushed += other.bytes_flushed
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.duration += other.duration
+        self.sstables += other.sstables
+        self.pending += other.pending
+        self.events = sorted(self.events + other.events, key=lambda e: e.time)
+
+    def summary(self):
+        return {'compactions': self.compactions,
+                'flushes': self.flushes,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'duration_s': round(self.duration, 3),
+                'throughput_mb_per_s': round(self.throughput() / (1 << 20), 3),
+                'write_amplification': round(self.write_amplification(), 3),
+                'sstables': self.sstables,
+                'pending': self.pending}
+
+
+def analyze(path, since=None, until=None, from_mark=None):
+    """
+    Returns the TableCompactionStats of each table of the compaction log at
+    path, by (keyspace, table), optionally limited to a time window (naive
+    UTC datetimes, since inclusive and until exclusive) or to what was logged
+    after from_mark. The number of pending compactions is the last one
+    logged.
+    """
+    stats = OrderedDict()
+    lines = (line for _, _, _, line in RotatingLog(path).lines(from_mark))
+    for event in parse_events(lines):
+        if since is not None and event.time < since:
+            continue
+        if until is not None and event.time >= until:
+            continue
+        key = (event.keyspace, event.table)
+        table = stats.get(key)
+        if table is None:
+            table = stats[key] = TableCompactionStats(*key)
+        if isinstance(event, PendingCompactions):
+            table.pending = event.pending
+        else:
+            table.add(event)
+    return stats
+
+
+def combine(stats_by_node):
+    """
+    Returns the cluster-wide TableCompactionStats of each table, given the
+    ones of each node.
+    """
+    combined = OrderedDict()
+    for stats in stats_by_node.values():
+        for key, table in stats.items():
+            if key not in combined:
+                combined[key] = TableCompactionStats(*key)
+            combined[key].merge(table)
+    return combined
+
+
+def describe_backlog(stats):
+    """
+    Returns a short description of the tables with pending compactions.
+    """
+    return ", ".join("{}.{}: {} pending, {} sstables".format(t.keyspace, t.table, t.pending, t.sstables)
+                     for t in stats.values() if t.pending)
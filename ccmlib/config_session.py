@@ -0,0 +1,61 @@
+#
+# Deferred writes of the configuration files of a cluster and its nodes
+#
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+# The parts of the configuration of a node, in the order they are written:
+# the files copied from the install conf directory, cassandra.yaml, the
+# log4j or logback configuration, the env file, and node.conf
+COPY, YAML, LOGGING, ENV, CONF = 'copy', 'yaml', 'logging', 'env', 'conf'
+NODE_PARTS = (COPY, YAML, LOGGING, ENV, CONF)
+
+# The parts of the configuration of a cluster: cluster.conf, and the
+# cassandra-topology.properties of its nodes (written after their other files)
+TOPOLOGY = 'topology'
+
+
+class ConfigSession(object):
+
+    """
+    The configuration files of a cluster and of its nodes that changed since
+    the session was opened (see Cluster.config_session), to be written once
+    each when it is flushed.
+    """
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self._cluster_parts = set()
+        self._nodes = OrderedDict()
+
+    def defer_cluster(self, *parts):
+        self._cluster_parts.update(parts)
+
+    def defer(self, node, *parts):
+        self._nodes.setdefault(node.name, (node, set()))[1].update(parts)
+
+    def pending(self):
+        """
+        Returns whether there are changes that were not written yet.
+        """
+        return bool(self._cluster_parts or self._nodes)
+
+    def flush(self):
+        """
+        Writes the changed files, each once. Writes made while flushing are
+        not deferred.
+        """
+        cluster_parts, nodes = self._cluster_parts, self._nodes
+        self._cluster_parts, self._nodes = set(), OrderedDict()
+        session, self.cluster._config_session = self.cluster._config_session, None
+        try:
+            if CONF in cluster_parts:
+                self.cluster._update_config()
+            for node, parts in nodes.values():
+                node._write_config([part for part in NODE_PARTS if part in parts])
+            if TOPOLOGY in cluster_parts:
+                self.cluster._update_topology_files()
+        finally:
+            self.cluster._config_session = session
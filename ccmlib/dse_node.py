@@ -9,7 +9,6 @@ import stat
 import subprocess
 import time
 
-import yaml
 from six import iteritems, print_
 
 from ccmlib import common, extension, repository
@@ -41,6 +40,9 @@ class DseNode(Node):
         """
         return os.path.join(self.get_path(), 'resources', 'cassandra', 'conf')
 
+    def _cassandra_yaml_template(self):
+        return os.path.join(self.get_install_dir(), common.DSE_CASSANDRA_CONF_DIR, common.CASSANDRA_CONF)
+
     def get_tool(self, toolname):
         return common.join_bin(os.path.join(self.get_install_dir(), 'resources', 'cassandra'), 'bin', toolname)
 
@@ -67,7 +69,7 @@ class DseNode(Node):
             (node_ip, _) = self.network_interfaces['binary']
             conf_file = os.path.join(self.get_path(), 'resources', 'dse', 'conf', 'dse.yaml')
             with open(conf_file, 'r') as f:
-                data = yaml.load(f)
+                data = common.load_yaml(f)
             graph_options = data['graph']
             graph_options['gremlin_server']['host'] = node_ip
             self.set_dse_configuration_options({'graph': graph_options})
@@ -98,7 +100,7 @@ class DseNode(Node):
         cdir = self.get_install_dir()
         launch_bin = common.join_bin(cdir, 'bin', 'dse')
         # Copy back the dse scripts since profiling may have modified it the previous time
-        shutil.copy(launch_bin, self.get_bin_dir())
+        common.materialize_file(launch_bin, self.get_bin_dir())
         return common.join_bin(self.get_path(), 'bin', 'dse')
 
     def add_custom_launch_arguments(self, args):
@@ -262,33 +264,27 @@ class DseNode(Node):
             dst_conf = os.path.join(self.get_path(), 'resources', product, 'conf')
             if not os.path.isdir(src_conf):
                 continue
-            if os.path.isdir(dst_conf):
-                common.rmdirs(dst_conf)
-            shutil.copytree(src_conf, dst_conf)
+            common.materialize_tree(src_conf, dst_conf)
             if product == 'solr':
                 src_web = os.path.join(self.get_install_dir(), 'resources', product, 'web')
                 dst_web = os.path.join(self.get_path(), 'resources', product, 'web')
-                if os.path.isdir(dst_web):
-                    common.rmdirs(dst_web)
-                shutil.copytree(src_web, dst_web)
+                common.materialize_tree(src_web, dst_web)
             if product == 'tomcat':
                 src_lib = os.path.join(self.get_install_dir(), 'resources', product, 'lib')
                 dst_lib = os.path.join(self.get_path(), 'resources', product, 'lib')
-                if os.path.isdir(dst_lib):
-                    common.rmdirs(dst_lib)
                 if os.path.exists(src_lib):
-                    shutil.copytree(src_lib, dst_lib)
+                    common.materialize_tree(src_lib, dst_lib)
+                elif os.path.isdir(dst_lib):
+                    common.rmdirs(dst_lib)
                 src_webapps = os.path.join(self.get_install_dir(), 'resources', product, 'webapps')
                 dst_webapps = os.path.join(self.get_path(), 'resources', product, 'webapps')
-                if os.path.isdir(dst_webapps):
-                    common.rmdirs(dst_webapps)
-                shutil.copytree(src_webapps, dst_webapps)
+                common.materialize_tree(src_webapps, dst_webapps)
         src_lib = os.path.join(self.get_install_dir(), 'resources', product, 'gremlin-console', 'conf')
         dst_lib = os.path.join(self.get_path(), 'resources', product, 'gremlin-console', 'conf')
-        if os.path.isdir(dst_lib):
-            common.rmdirs(dst_lib)
         if os.path.exists(src_lib):
-            shutil.copytree(src_lib, dst_lib)
+            common.materialize_tree(src_lib, dst_lib)
+        elif os.path.isdir(dst_lib):
+            common.rmdirs(dst_lib)
 
     def import_bin_files(self):
         common.copy_directory(os.path.join(self.get_install_dir(), 'bin'), self.get_bin_dir())
@@ -298,8 +294,7 @@ class DseNode(Node):
         common.copy_directory(os.path.join(self.get_install_dir(), 'resources', 'cassandra', 'bin'), cassandra_bin_dir)
         if os.path.exists(os.path.join(self.get_install_dir(), 'resources', 'cassandra', 'tools')):
             cassandra_tools_dir = os.path.join(self.get_path(), 'resources', 'cassandra', 'tools')
-            shutil.rmtree(cassandra_tools_dir, ignore_errors=True)
-            shutil.copytree(os.path.join(self.get_install_dir(), 'resources', 'cassandra', 'tools'), cassandra_tools_dir)
+            common.materialize_tree(os.path.join(self.get_install_dir(), 'resources', 'cassandra', 'tools'), cassandra_tools_dir)
         self.export_dse_home_in_dse_env_sh()
 
     def export_dse_home_in_dse_env_sh(self):
@@ -317,38 +312,38 @@ class DseNode(Node):
         with open(self.get_bin_dir() + "/dse-env.sh", "r") as dse_env_sh:
             buf = dse_env_sh.readlines()
 
-        with open(self.get_bin_dir() + "/dse-env.sh", "w") as out_file:
-            for line in buf:
-                out_file.write(line)
-                if line == "# This is here so the installer can force set DSE_HOME\n":
-                    out_file.write("DSE_HOME=" + self.get_install_dir() + "\nexport DSE_HOME\n")
+        content = []
+        for line in buf:
+            content.append(line)
+            if line == "# This is here so the installer can force set DSE_HOME\n":
+                content.append("DSE_HOME=" + self.get_install_dir() + "\nexport DSE_HOME\n")
+        common.write_if_changed(self.get_bin_dir() + "/dse-env.sh", ''.join(content))
 
-    def _update_log4j(self):
-        super(DseNode, self)._update_log4j()
+    def _plan_log4j_edits(self, edits):
+        super(DseNode, self)._plan_log4j_edits(edits)
 
-        conf_file = os.path.join(self.get_conf_dir(), common.LOG4J_CONF)
         append_pattern = 'log4j.appender.V.File='
         log_file = os.path.join(self.get_path(), 'logs', 'solrvalidation.log')
         if common.is_win():
             log_file = re.sub("\\\\", "/", log_file)
-        common.replace_in_file(conf_file, append_pattern, append_pattern + log_file)
+        edits.replace(append_pattern, append_pattern + log_file)
 
         append_pattern = 'log4j.appender.A.File='
         log_file = os.path.join(self.get_path(), 'logs', 'audit.log')
         if common.is_win():
             log_file = re.sub("\\\\", "/", log_file)
-        common.replace_in_file(conf_file, append_pattern, append_pattern + log_file)
+        edits.replace(append_pattern, append_pattern + log_file)
 
         append_pattern = 'log4j.appender.B.File='
         log_file = os.path.join(self.get_path(), 'logs', 'audit', 'dropped-events.log')
         if common.is_win():
             log_file = re.sub("\\\\", "/", log_file)
-        common.replace_in_file(conf_file, append_pattern, append_pattern + log_file)
+        edits.replace(append_pattern, append_pattern + log_file)
 
     def __update_yaml(self):
         conf_file = os.path.join(self.get_path(), 'resources', 'dse', 'conf', 'dse.yaml')
         with open(conf_file, 'r') as f:
-            data = yaml.load(f)
+            data = common.load_yaml(f)
 
         data['system_key_directory'] = os.path.join(self.get_path(), 'keys')
 
@@ -361,8 +356,7 @@ class DseNode(Node):
         # Merge options with original yaml data.
         data = common.merge_configuration(data, full_options)
 
-        with open(conf_file, 'w') as f:
-            yaml.safe_dump(data, f, default_flow_style=False)
+        common.write_if_changed(conf_file, common.dump_yaml(data, default_flow_style=False))
 
     def __generate_server_xml(self):
         server_xml = os.path.join(self.get_path(), 'resources', 'tomcat', 'conf', 'server.xml')
@@ -387,12 +381,11 @@ class DseNode(Node):
 
         conf_file = os.path.join(self.get_path(), 'resources', 'graph', 'gremlin-console', 'conf', 'remote.yaml')
         with open(conf_file, 'r') as f:
-            data = yaml.load(f)
+            data = common.load_yaml(f)
 
         data['hosts'] = [node_ip]
 
-        with open(conf_file, 'w') as f:
-            yaml.safe_dump(data, f, default_flow_style=False)
+        common.write_if_changed(conf_file, common.dump_yaml(data, default_flow_style=False))
 
     def _get_directories(self):
         dirs = []
@@ -453,13 +446,13 @@ class DseNode(Node):
                         break
                 content.append(line)
 
-        with open(conf_file, 'w') as f:
-            f.writelines(content)
+        common.write_if_changed(conf_file, ''.join(content))
 
         # set unique spark.shuffle.service.port for each node; this is only needed for DSE 5.0.x;
         # starting in 5.1 this setting is no longer needed
         if self.cluster.version() > '5.0' and self.cluster.version() < '5.1':
             defaults_file = os.path.join(self.get_path(), 'resources', 'spark', 'conf', 'spark-defaults.conf')
+            common.copy_on_write(defaults_file)
             with open(defaults_file, 'a') as f:
                 port_num = 7737 + int(node_num)
                 f.write("\nspark.shuffle.service.port %s\n" % port_num)
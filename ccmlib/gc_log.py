@@ -0,0 +1,418 @@
+#
+# GC log parsing and pause statistics
+#
+
+from __future__ import absolute_import
+
+import bisect
+import glob
+import heapq
+import os
+import re
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from ccmlib.common import CCMError
+from ccmlib.log_reader import LogSegment, RotatingLog
+
+# Upper bounds (in ms) of the buckets of the pause time histograms; the last
+# bucket holds everything above
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# A stop-the-world pause. timestamp is a naive local datetime (None if the
+# log has no date stamps), uptime is in seconds, duration in ms and sizes in
+# bytes. Sizes that the log doesn't show are None.
+GcPause = namedtuple('GcPause', 'timestamp uptime kind duration heap_before heap_after heap_capacity young_before young_after')
+
+_stamp = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)\.(\d{3})([+-])(\d\d)(\d\d)')
+_uptime = re.compile(r'(?:^|[\[ ])(\d+\.\d+)s?[\]:]')
+_size = r'(\d+(?:\.\d+)?)([BKMG])'
+
+# JDK 8 (-XX:+PrintGCDetails -XX:+PrintGCDateStamps)
+_jdk8_stamped = re.compile(r'\d{4}-\d\d-\d\dT|\d+\.\d+: ')
+_jdk8_start = re.compile(r'(?:\d{4}-\d\d-\d\dT[\d:.]+[+-]\d{4}: )?\d+\.\d+: \[')
+_jdk8_young = re.compile(r'\[(?:PSYoungGen|ParNew|DefNew): ' + _size + '->' + _size + r'\(' + _size + r'\)')
+_jdk8_g1 = re.compile(r'Eden: ' + _size + r'\(' + _size + r'\)->' + _size + r'\(' + _size + r'\) Survivors: ' +
+                      _size + '->' + _size + ' Heap: ' + _size + r'\(' + _size + r'\)->' + _size + r'\(' + _size + r'\)')
+_jdk8_section = re.compile(r'\[[A-Za-z][\w ]*: [^\[\]]*\]')
+_jdk8_heap = re.compile(_size + '->' + _size + r'\(' + _size + r'\)')
+_jdk8_secs = re.compile(r'(\d+\.\d+) secs\]')
+_jdk8_real = re.compile(r'real=(\d+\.\d+) secs')
+
+# JDK 9+ unified logging (-Xlog:gc*)
+_unified_pause = re.compile(r'GC\((\d+)\) Pause (\w+)(.*?) (?:' + _size + '->' + _size + r'\(' + _size + r'\) )?(\d+(?:\.\d+)?)ms\s*$')
+_unified_regions = re.compile(r'GC\((\d+)\) (Eden|Survivor) regions: (\d+)->(\d+)')
+_unified_young = re.compile(r'GC\((\d+)\) (?:PSYoungGen|DefNew|ParNew): ' + _size + '->' + _size)
+_unified_region_size = re.compile(r'Heap [Rr]egion [Ss]ize: ' + _size)
+
+_UNITS = {'B': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+class GcPauseError(CCMError):
+    pass
+
+
+def _bytes(value, unit):
+    return int(float(value) * _UNITS[unit])
+
+
+def local_time(text):
+    """
+    Converts the first date stamp of a GC log line, which the JVM writes
+    with its UTC offset, to a naive local datetime like those of system.log.
+    Returns None if there is none.
+    """
+    m = _stamp.search(text)
+    if m is None:
+        return None
+    g = m.groups()
+    stamp = datetime(int(g[0]), int(g[1]), int(g[2]), int(g[3]), int(g[4]), int(g[5]), int(g[6]) * 1000)
+    offset = timedelta(hours=int(g[8]), minutes=int(g[9]))
+    utc = stamp - offset if g[7] == '+' else stamp + offset
+    return datetime.fromtimestamp((utc - datetime(1970, 1, 1)).total_seconds())
+
+
+def find_gc_log(path):
+    """
+    Returns the GC log being written in the directory of path: the
+    gc.log.N.current file when the JDK 8 rotation is used (N moves on as the
+    files rotate), gc.log with unified logging.
+    """
+    directory = os.path.dirname(path)
+    current = []
+    for p in glob.glob(os.path.join(directory, 'gc.log.*.current')):
+        try:
+            current.append((os.path.getmtime(p), p))
+        except OSError:
+            continue
+    if current:
+        return max(current)[1]
+    unified = os.path.join(directory, 'gc.log')
+    if os.path.exists(unified):
+        return unified
+    return path
+
+
+def gc_log_segments(path):
+    """
+    Returns the files of the GC log in the directory of path, oldest first.
+    The JVM rotates them as gc.log.0, gc.log.1, ... (marking the one being
+    written as .current with JDK 8).
+    """
+    found = []
+    for p in glob.glob(os.path.join(os.path.dirname(path), 'gc.log*')):
+        try:
+            found.append((os.path.getmtime(p), p))
+        except OSError:
+            continue
+    return [LogSegment(p) for _, p in sorted(found)]
+
+
+class GcLog(RotatingLog):
+
+    """
+    The GC log of a node along with its rotated files. The file being
+    written is looked up again on each read, as JDK 8 renames it when it
+    rotates, so marks stay valid across rotations.
+    """
+
+    def current(self):
+        return find_gc_log(self.path)
+
+    def segments(self):
+        current = self.current()
+        return [segment for segment in gc_log_segments(current) if segment.path != current] + [LogSegment(current, active=True)]
+
+    def generation(self):
+        return RotatingLog(self.current()).generation()
+
+    def mark(self):
+        return RotatingLog(self.current()).mark()
+
+
+def _jdk8_pause(entry):
+    if 'CMS-concurrent' in entry or ('[GC' not in entry and '[Full GC' not in entry):
+        return None
+    if '[Full GC' in entry:
+        kind = 'full'
+    elif 'Initial Mark' in entry or 'initial-mark' in entry:
+        kind = 'initial-mark'
+    elif 'remark' in entry.lower():
+        kind = 'remark'
+    elif 'GC cleanup' in entry:
+        kind = 'cleanup'
+    elif '(mixed)' in entry:
+        kind = 'mixed'
+    else:
+        kind = 'young'
+
+    real = _jdk8_real.search(entry)
+    secs = _jdk8_secs.findall(entry)
+    if real:
+        duration = float(real.group(1)) * 1000
+    elif secs:
+        duration = float(secs[-1]) * 1000
+    else:
+        return None
+
+    heap = young = None
+    g1 = _jdk8_g1.search(entry)
+    if g1:
+        g = g1.groups()
+        young = (_bytes(g[0], g[1]) + _bytes(g[8], g[9]), _bytes(g[4], g[5]) + _bytes(g[10], g[11]))
+        heap = (_bytes(g[12], g[13]), _bytes(g[16], g[17]), _bytes(g[18], g[19]))
+    else:
+        y = _jdk8_young.search(entry)
+        if y:
+            g = y.groups()
+            young = (_bytes(g[0], g[1]), _bytes(g[2], g[3]))
+        h = _jdk8_heap.search(_jdk8_section.sub('', entry.split('\n')[0]))
+        if h:
+            g = h.groups()
+            heap = (_bytes(g[0], g[1]), _bytes(g[2], g[3]), _bytes(g[4], g[5]))
+
+    uptime = _uptime.search(entry)
+    return GcPause(local_time(entry.split(': ', 1)[0]), float(uptime.group(1)) if uptime else None, kind, duration,
+                   heap[0] if heap else None, heap[1] if heap else None, heap[2] if heap else None,
+                   young[0] if young else None, young[1] if young else None)
+
+
+class _UnifiedParser(object):
+
+    def __init__(self):
+        self.region_size = None
+        self.regions = {}
+        self.young = {}
+
+    def feed(self, line):
+        m = _unified_pause.search(line)
+        if m is None:
+            m = _unified_regions.search(line)
+            if m:
+                gc_id = m.group(1)
+                before, after = self.regions.get(gc_id, (0, 0))
+                self.regions[gc_id] = (before + int(m.group(3)), after + int(m.group(4)))
+                return None
+            m = _unified_young.search(line)
+            if m:
+                g = m.groups()
+                self.young[g[0]] = (_bytes(g[1], g[2]), _bytes(g[3], g[4]))
+                return None
+            m = _unified_region_size.search(line)
+            if m:
+                self.region_size = _bytes(m.group(1), m.group(2))
+            return None
+
+        g = m.groups()
+        gc_id, kind, detail = g[0], g[1].lower(), g[2]
+        if kind == 'young' and '(Mixed)' in detail:
+            kind = 'mixed'
+        elif kind == 'init' or kind == 'initial':
+            kind = 'initial-mark'
+        young = self.young.pop(gc_id, None)
+        regions = self.regions.pop(gc_id, None)
+        if young is None and regions is not None and self.region_size:
+            young = (regions[0] * self.region_size, regions[1] * self.region_size)
+        heap = (_bytes(g[3], g[4]), _bytes(g[5], g[6]), _bytes(g[7], g[8])) if g[3] else None
+        # The first decoration is the date when time is logged
+        uptime = _uptime.search(line)
+        return GcPause(local_time(line.split(']', 1)[0]), float(uptime.group(1)) if uptime else None, kind,
+                       float(g[9]), heap[0] if heap else None, heap[1] if heap else None, heap[2] if heap else None,
+                       young[0] if young else None, young[1] if young else None)
+
+
+def parse_pauses(lines):
+    """
+    Yields a GcPause for each stop-the-world pause of a GC log, in either
+    the JDK 8 or the JDK 9+ unified logging format, reading the lines one
+    at a time.
+    """
+    unified = _UnifiedParser()
+    entry = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.startswith('['):
+            pause = unified.feed(line)
+            if pause is not None:
+                yield pause
+            continue
+        # JDK 8 entries span several lines with -XX:+PrintGCDetails
+        if _jdk8_stamped.match(line):
+            if entry is not None:
+                pause = _jdk8_pause(entry)
+                if pause is not None:
+                    yield pause
+            entry = line if _jdk8_start.match(line) else None
+        elif entry is not None:
+            entry += '\n' + line
+    if entry is not None:
+        pause = _jdk8_pause(entry)
+        if pause is not None:
+            yield pause
+
+
+class GcStats(object):
+
+    """
+    Statistics over a series of GC pauses: count, total and percentiles of
+    the pause times, a histogram of them (see HISTOGRAM_BOUNDS), the worst
+    pauses, and the allocation and promotion rates (in bytes per second)
+    derived from the heap sizes around each pause.
+    """
+
+    WORST_PAUSES = 10
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        # Sorted when percentiles are asked for, rather than on each add
+        self.durations = array('d')
+        self._sorted = True
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.allocated = 0
+        self.promoted = 0
+        self.first = None
+        self.last = None
+        self._worst = []
+        self._previous = None
+
+    def add(self, pause):
+        self.count += 1
+        self.total += pause.duration
+        self.durations.append(pause.duration)
+        self._sorted = False
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, pause.duration)] += 1
+        item = (pause.duration, self.count, pause)
+        if len(self._worst) < self.WORST_PAUSES:
+            heapq.heappush(self._worst, item)
+        else:
+            heapq.heappushpop(self._worst, item)
+
+        previous = self._previous
+        if previous is not None and previous.heap_after is not None and pause.heap_before is not None:
+            self.allocated += max(0, pause.heap_before - previous.heap_after)
+        if pause.kind in ('young', 'mixed') and None not in (pause.heap_before, pause.heap_after, pause.young_before, pause.young_after):
+            old_before = pause.heap_before - pause.young_before
+            old_after = pause.heap_after - pause.young_after
+            self.promoted += max(0, old_after - old_before)
+        self._previous = pause
+
+        when = pause.uptime if pause.uptime is not None else _seconds(pause.timestamp)
+        if when is not None:
+            self.first = when if self.first is None else min(self.first, when)
+            self.last = when if self.last is None else max(self.last, when)
+
+    @staticmethod
+    def combine(all_stats):
+        """
+        Returns the statistics of the pauses of all the given ones, e.g. of all
+        the nodes of a cluster. The rates are then cluster-wide.
+        """
+        combined = GcStats()
+        span = 0
+        for stats in all_stats:
+            combined.count += stats.count
+            combined.total += stats.total
+            combined.durations.extend(stats.durations)
+            combined._sorted = False
+            combined.histogram = [a + b for a, b in zip(combined.histogram, stats.histogram)]
+            combined.allocated += stats.allocated
+            combined.promoted += stats.promoted
+            for item in stats._worst:
+                heapq.heappush(combined._worst, item)
+            span = max(span, stats.span())
+        combined._worst = heapq.nlargest(GcStats.WORST_PAUSES, combined._worst)
+        heapq.heapify(combined._worst)
+        if span:
+            combined.first, combined.last = 0, span
+        return combined
+
+    def span(self):
+        return self.last - self.first if self.first is not None else 0
+
+    def percentile(self, p):
+        """
+        Returns the pause time (in ms) below which p percent of the pauses fall.
+        """
+        durations = self.__sorted_durations()
+        if not durations:
+            return 0.0
+        rank = max(0, min(len(durations) - 1, int(-(-p * len(durations) // 100)) - 1))
+        return durations[rank]
+
+    def max(self):
+        durations = self.__sorted_durations()
+        return durations[-1] if durations else 0.0
+
+    def __sorted_durations(self):
+        if not self._sorted:
+            self.durations = array('d', sorted(self.durations))
+            self._sorted = True
+        return self.durations
+
+    def worst(self):
+        """
+        Returns the longest pauses, longest first.
+        """
+        return [pause for _, _, pause in sorted(self._worst, reverse=True)]
+
+    def allocation_rate(self):
+        span = self.span()
+        return self.allocated / span if span else 0.0
+
+    def promotion_rate(self):
+        span = self.span()
+        return self.promoted / span if span else 0.0
+
+    def summary(self):
+        return {'pauses': self.count,
+                'total_ms': round(self.total, 3),
+                'p50_ms': self.percentile(50),
+                'p99_ms': self.percentile(99),
+                'max_ms': self.max(),
+                'allocation_mb_per_s': round(self.allocation_rate() / (1 << 20), 3),
+                'promotion_mb_per_s': round(self.promotion_rate() / (1 << 20), 3)}
+
+
+def _seconds(timestamp):
+    if timestamp is None:
+        return None
+    return (timestamp - datetime(1970, 1, 1)).total_seconds()
+
+
+def analyze(path, since=None, until=None, from_mark=None):
+    """
+    Returns the GcStats of the GC log at path (see find_gc_log), including
+    its rotated files, or of what was logged since from_mark (as returned
+    by Node.mark_gc_log) only. Pauses can also be restricted to a time
+    window, since inclusive and until exclusive.
+    """
+    if from_mark is not None:
+        lines = (line for _, _, _, line in GcLog(path).lines(from_mark))
+    else:
+        path = find_gc_log(path)
+        lines = (line for segment in gc_log_segments(path) for _, _, line in segment.lines())
+    stats = GcStats()
+    for pause in parse_pauses(lines):
+        if since is not None and (pause.timestamp is None or pause.timestamp < since):
+            continue
+        if until is not None and (pause.timestamp is None or pause.timestamp >= until):
+            continue
+        stats.add(pause)
+    return stats
+
+
+def check_pauses(stats_by_node, max_p99):
+    """
+    Raises GcPauseError if the 99th percentile pause time of any node, or
+    of the whole cluster, exceeds max_p99 ms.
+    """
+    failures = ["{}: p99 {:.1f}ms".format(name, stats.percentile(99))
+                for name, stats in stats_by_node.items() if stats.percentile(99) > max_p99]
+    combined = GcStats.combine(stats_by_node.values())
+    if combined.percentile(99) > max_p99:
+        failures.append("cluster: p99 {:.1f}ms".format(combined.percentile(99)))
+    if failures:
+        raise GcPauseError("GC pauses over the {}ms p99 threshold: {}".format(max_p99, ", ".join(failures)))
+    return combined
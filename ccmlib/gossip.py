@@ -0,0 +1,129 @@
+#
+# Gossip convergence: which nodes see which others as UP (or DOWN)
+#
+
+from __future__ import absolute_import
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from ccmlib.log_tailer import LogSubscription
+
+# How each state shows up in the log of the node that notices it:
+# "InetAddress /127.0.0.2 is now UP", "Node /127.0.0.2 has restarted, now UP",
+# "InetAddress /127.0.0.2 is now DOWN", "InetAddress /127.0.0.2 is now dead"
+_STATES = {'UP': re.compile(r' now UP'),
+           'DOWN': re.compile(r' is now (?:dead|DOWN)')}
+
+
+class Convergence(object):
+
+    """
+    An observers x targets matrix of whether each observer has logged that
+    it sees each target in a given gossip state (UP or DOWN), built by
+    reading the log of each observer once, from its mark on. Nodes don't
+    have to see themselves.
+    """
+
+    def __init__(self, observers, targets, state='UP', marks=None, filename='system.log'):
+        self.observers = list(observers)
+        self.targets = list(targets)
+        self.state = state
+        self.filename = filename
+        marks = marks or {}
+        self._marks = dict((node.name, marks.get(node.name)) for node in self.observers)
+        self._state = _STATES[state]
+        # Don't take 127.0.0.1 for 127.0.0.10
+        self._addresses = [(target.name, re.compile(re.escape(target.address()) + r'(?![\d.])')) for target in self.targets]
+        self._seen = OrderedDict((node.name, set()) for node in self.observers)
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._subscriptions = []
+        self.__check()
+
+    def __expected(self, observer):
+        return set(name for name, _ in self._addresses if name != observer)
+
+    def __check(self):
+        if all(self.__expected(observer) <= seen for observer, seen in self._seen.items()):
+            self._event.set()
+
+    def __collector(self, observer):
+        def collect(line, offset):
+            if not self._state.search(line):
+                return
+            with self._lock:
+                for name, address in self._addresses:
+                    if name != observer and address.search(line):
+                        self._seen[observer].add(name)
+                self.__check()
+        return collect
+
+    def start(self):
+        """
+        Starts reading the logs of the observers. Returns self.
+        """
+        self._subscriptions = [LogSubscription(os.path.join(node.get_path(), 'logs', self.filename), [],
+                                               from_mark=self._marks[node.name], callback=self.__collector(node.name))
+                               for node in self.observers]
+        for subscription in self._subscriptions:
+            # Only happens if the tailer fails
+            subscription.add_done_callback(lambda _: self._event.set())
+        if self.observers:
+            self.observers[0].cluster.log_tailer().add(self._subscriptions)
+        return self
+
+    def wait(self, timeout=None):
+        """
+        Waits up to timeout seconds for every observer to see every target in
+        the state. Returns whether they all did, and raises the error of the
+        log tailer if it failed.
+        """
+        self._event.wait(timeout)
+        for subscription in self._subscriptions:
+            if subscription.error is not None:
+                raise subscription.error
+        return self._event.is_set()
+
+    def close(self):
+        for node, subscription in zip(self.observers, self._subscriptions):
+            node.cluster.log_tailer().remove(subscription)
+        self._subscriptions = []
+
+    def matrix(self):
+        """
+        Returns, by observer name, whether it sees each target (by name) in
+        the state.
+        """
+        with self._lock:
+            return OrderedDict((observer, OrderedDict((name, name in seen) for name, _ in self._addresses if name != observer))
+                               for observer, seen in self._seen.items())
+
+    def missing(self):
+        """
+        Returns the (observer, target) name pairs still missing.
+        """
+        return [(observer, target) for observer, row in self.matrix().items() for target, seen in row.items() if not seen]
+
+
+def describe(missing, state='UP'):
+    """
+    Describes the (observer, target) pairs returned by Convergence.missing.
+    """
+    return ", ".join("{} does not see {} as {}".format(observer, target, state) for observer, target in missing)
+
+
+def wait_for(observers, targets, state='UP', marks=None, timeout=120, filename='system.log'):
+    """
+    Waits up to timeout seconds for all the observers to see all the targets
+    in the given state. Returns the (observer, target) name pairs that are
+    still missing, so nothing if the cluster converged.
+    """
+    convergence = Convergence(observers, targets, state=state, marks=marks, filename=filename).start()
+    try:
+        convergence.wait(timeout)
+        return convergence.missing()
+    finally:
+        convergence.close()
@@ -0,0 +1,133 @@
+#
+# Minimal ctypes binding to the Linux inotify API
+#
+
+from __future__ import absolute_import
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def is_available():
+    """
+    Returns whether inotify can be used on this platform.
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        return hasattr(_get_libc(), 'inotify_init1')
+    except (OSError, AttributeError):
+        return False
+
+
+def _check(ret):
+    if ret < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return ret
+
+
+class Inotify(object):
+
+    """
+    An inotify instance. Watches are added with add_watch() and events are
+    collected with read_events(), which blocks for at most the given timeout.
+    Raises OSError if the instance cannot be created (for example when the
+    per-user instance limit is reached), so callers can fall back to polling.
+    """
+
+    def __init__(self):
+        self.fd = _check(_get_libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        self.watches = {}
+
+    def add_watch(self, path, mask):
+        if not isinstance(path, bytes):
+            path = path.encode(sys.getfilesystemencoding() or 'utf-8')
+        wd = _check(_get_libc().inotify_add_watch(self.fd, path, mask))
+        self.watches[wd] = path
+        return wd
+
+    def rm_watch(self, wd):
+        if self.watches.pop(wd, None) is not None:
+            _get_libc().inotify_rm_watch(self.fd, wd)
+
+    def fileno(self):
+        return self.fd
+
+    def read_events(self, timeout=None):
+        """
+        Waits up to timeout seconds for events and returns them as a list of
+        (wd, mask, cookie, name) tuples. An empty list means the timeout expired.
+        """
+        try:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+        except (select.error, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+
+        events = []
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            events.append((wd, mask, cookie, name.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')))
+        return events
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self.watches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,117 @@
+#
+# Streaming extraction of errors and their stack traces from node logs
+#
+
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+import six
+
+from ccmlib.log_index import line_level
+
+CHUNK_SIZE = 1 << 16
+
+# An ERROR line and the continuation lines that follow it (stack trace
+# included), along with the byte offsets where it starts and ends.
+ErrorRecord = namedtuple('ErrorRecord', 'start end lines')
+
+
+class ErrorExtractor(object):
+
+    """
+    Groups log lines into error records, one line at a time: an ERROR line
+    starts a record, lines that don't mention a log level are appended to the
+    current record, and any other line closes it. Only the record being
+    built is kept in memory.
+    """
+
+    def __init__(self):
+        self._lines = None
+        self._start = None
+        self._end = None
+
+    def pending(self):
+        return self._lines is not None
+
+    def feed(self, line, start, end=None):
+        """
+        Feeds the line starting at byte offset start, with or without its
+        line terminator. Returns the record this line completes, if any.
+        """
+        line = line.rstrip('\r\n')
+        level = line_level(line)
+        completed = None
+        if self._lines is not None:
+            if level is None:
+                # if a log line can't be identified, assume continuation of an ERROR message
+                self._lines.append(line)
+                self._end = end
+                return None
+            self._end = start
+            completed = self.flush()
+        if level == 'ERROR':
+            self._lines = [line]
+            self._start = start
+            self._end = end
+        return completed
+
+    def flush(self):
+        """
+        Returns the record being built, if any, as complete.
+        """
+        if self._lines is None:
+            return None
+        record = ErrorRecord(self._start, self._end, self._lines)
+        self._lines = None
+        return record
+
+
+def extract_errors(lines):
+    """
+    Yields the error records found in an iterable of (start offset, end
+    offset, line) triples.
+    """
+    extractor = ErrorExtractor()
+    for start, end, line in lines:
+        record = extractor.feed(line, start, end)
+        if record is not None:
+            yield record
+    record = extractor.flush()
+    if record is not None:
+        yield record
+
+
+def read_chunked_lines(handle, start=0, chunk_size=CHUNK_SIZE):
+    """
+    Yields (start offset, end offset, line) for each line of the binary file
+    handle from byte offset start on, reading it in chunks of chunk_size
+    bytes. Unlike log_reader.read_lines, a trailing line without a line
+    terminator is returned as well.
+    """
+    handle.seek(start)
+    buffered = b''
+    while True:
+        chunk = handle.read(chunk_size)
+        if not chunk:
+            break
+        lines = (buffered + chunk).split(b'\n')
+        buffered = lines.pop()
+        for line in lines:
+            end = start + len(line) + 1
+            yield start, end, _decode(line)
+            start = end
+    if buffered:
+        yield start, start + len(buffered), _decode(buffered)
+
+
+def iter_errors(handle, start=0, chunk_size=CHUNK_SIZE):
+    """
+    Yields the error records of the binary file handle from byte offset start
+    on, in constant memory (besides the records themselves).
+    """
+    return extract_errors(read_chunked_lines(handle, start, chunk_size))
+
+
+def _decode(line):
+    return line.decode('utf-8', 'replace') if six.PY3 else line
@@ -0,0 +1,358 @@
+#
+# Persistent incremental index over node log files
+#
+
+from __future__ import absolute_import
+
+import bisect
+import errno
+import json
+import os
+import re
+import threading
+from array import array
+
+import six
+
+from ccmlib import log_reader
+from ccmlib.log_reader import read_lines
+
+# Where the indexes and stores of the logs of a node are kept, next to its
+# logs directory so that they aren't taken for logs
+INDEX_DIR = 'log_index'
+INDEXED_LEVELS = ('ERROR', 'WARN')
+
+# Not all Python 2 platforms have the 'q' array type code
+_OFFSET = 'q' if six.PY3 else 'l'
+
+_level_pattern = re.compile(r'(INFO|DEBUG|WARN|ERROR)')
+
+
+def line_level(line):
+    """
+    Returns the first log level mentioned in the line, if any.
+    """
+    match = _level_pattern.search(line)
+    return match.group(0) if match else None
+
+
+def index_dir(log_file):
+    """
+    Returns the directory of the indexes of a log: INDEX_DIR, next to the
+    directory of the log.
+    """
+    logs_dir = os.path.dirname(os.path.abspath(log_file))
+    return os.path.join(os.path.dirname(logs_dir), INDEX_DIR)
+
+
+class LogIndex(object):
+
+    """
+    Remembers how far a log file has been scanned, the offsets of its ERROR
+    and WARN lines, and the offsets of the lines matching the most recently
+    grepped patterns. Each grep then only scans the bytes appended since
+    the previous one. The index is saved in the index directory: a small
+    json file with the scanned positions, and the offsets in binary files
+    that each save only appends to. It is reset when the log file is
+    truncated or replaced.
+
+    Greps also cover the archives the log was rolled into. Since those never
+    change, the offsets of the lines they match are kept per archive
+    fingerprint. Patterns matching more than MAX_MATCHES lines aren't worth
+    indexing, and are grepped by reading the whole log instead.
+    """
+
+    VERSION = 2
+    MAX_PATTERNS = 32
+    MAX_MATCHES = 10000
+
+    def __init__(self, log_file, index_file):
+        self.log_file = log_file
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        # Offset list name -> how many of its offsets are saved already
+        self._saved = {}
+        # (archive fingerprint, pattern key) -> matching lines, so that
+        # archives are only decompressed once per process
+        self._archive_lines = {}
+        self._state, self._offsets = self.__load()
+
+    @staticmethod
+    def for_log(log_file):
+        return LogIndex(log_file, os.path.join(index_dir(log_file), os.path.basename(log_file) + '.json'))
+
+    def __offsets_file(self, name):
+        return '{}.{}.bin'.format(os.path.splitext(self.index_file)[0], name)
+
+    def __empty_state(self):
+        return {'version': self.VERSION,
+                'fingerprint': None,
+                'scanned': 0,
+                # Offset list name -> number of offsets
+                'lists': dict((level, 0) for level in INDEXED_LEVELS),
+                'patterns': {},
+                'archives': {},
+                'clock': 0,
+                'next_list': 0}
+
+    def __load(self):
+        try:
+            with open(self.index_file, 'r') as f:
+                state = json.load(f)
+            if state.get('version') != self.VERSION:
+                raise ValueError('Unsupported version')
+            offsets = {}
+            for name, count in state['lists'].items():
+                values = array(_OFFSET)
+                if count:
+                    with open(self.__offsets_file(name), 'r+b') as f:
+                        values.fromfile(f, count)
+                        # Drop whatever an interrupted save appended after
+                        # the saved count
+                        f.truncate(count * values.itemsize)
+                offsets[name] = values
+                self._saved[name] = count
+            return state, offsets
+        except (IOError, OSError, ValueError, KeyError, EOFError):
+            self._saved = {}
+            return self.__empty_state(), dict((level, array(_OFFSET)) for level in INDEXED_LEVELS)
+
+    def __new_list(self):
+        name = str(self._state['next_list'])
+        self._state['next_list'] += 1
+        self._offsets[name] = array(_OFFSET)
+        return name
+
+    def __drop_list(self, name):
+        if name is None:
+            return
+        self._offsets.pop(name, None)
+        self._saved.pop(name, None)
+        try:
+            os.remove(self.__offsets_file(name))
+        except OSError:
+            pass
+
+    def __save(self):
+        state = self._state
+        index_dir = os.path.dirname(self.index_file)
+        try:
+            if not os.path.exists(index_dir):
+                os.makedirs(index_dir)
+            # Offsets past the counts saved in the json are ignored when
+            # loading, so append them first
+            for name, values in self._offsets.items():
+                saved = self._saved.get(name, 0)
+                if saved < len(values) or (name not in self._saved and values):
+                    with open(self.__offsets_file(name), 'ab' if saved else 'wb') as f:
+                        values[saved:].tofile(f)
+                    self._saved[name] = len(values)
+            state['lists'] = dict((name, len(values)) for name, values in self._offsets.items())
+            tmp = '{}.{}.tmp'.format(self.index_file, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.rename(tmp, self.index_file)
+        except (IOError, OSError, ValueError):
+            # The index is only an optimization. Rewrite the offset files
+            # whole next time, since an append may have been cut short.
+            # (Python 2 may also fail to encode a pattern with non utf-8
+            # bytes to json.)
+            self._saved = {}
+
+    def __validate(self, f):
+        state = self._state
+        size = os.fstat(f.fileno()).st_size
+        if size < state['scanned'] or log_reader.fingerprint(f) != state['fingerprint']:
+            for entry in state['patterns'].values():
+                self.__drop_list(entry['list'])
+            old = state
+            self._state = state = self.__empty_state()
+            state['fingerprint'] = log_reader.fingerprint(f)
+            state['archives'] = old.get('archives', {})
+            state['next_list'] = old['next_list']
+            for level in INDEXED_LEVELS:
+                self._offsets[level] = array(_OFFSET)
+                self._saved.pop(level, None)
+        return state
+
+    def __scan(self, f, entry=None, pattern=None):
+        """
+        Scans the bytes that either the index or the given pattern entry
+        haven't seen yet. Returns whether anything changed.
+        """
+        state = self.__validate(f)
+        scanned = state['scanned']
+        start = scanned if entry is None else min(scanned, entry['scanned'])
+        matches = None if entry is None else self._offsets[entry['list']]
+        end = start
+        for line_start, line_end, line in read_lines(f, start):
+            if line_start >= scanned:
+                level = line_level(line)
+                if level in INDEXED_LEVELS:
+                    self._offsets[level].append(line_start)
+            if matches is not None and line_start >= entry['scanned'] and pattern.search(line):
+                matches.append(line_start)
+            end = line_end
+        state['scanned'] = max(scanned, end)
+        if entry is not None:
+            entry['scanned'] = max(entry['scanned'], end)
+        return end != start
+
+    def update(self):
+        """
+        Indexes the log levels of the lines appended since the last scan.
+        """
+        with self._lock:
+            try:
+                with open(self.log_file, 'rb') as f:
+                    changed = self.__scan(f)
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                return
+            if changed:
+                self.__save()
+
+    def level_offsets(self, level, from_offset=0):
+        """
+        Returns the offsets of the indexed lines of the given level (ERROR
+        or WARN) starting at or after from_offset.
+        """
+        offsets = self._offsets[level]
+        return offsets[bisect.bisect_left(offsets, from_offset):].tolist()
+
+    def scanned(self):
+        return self._state['scanned']
+
+    def grep(self, expr):
+        """
+        Returns the (line, match object) pairs for the lines of the log file
+        and of its archives matching the regular expression expr, oldest
+        first.
+        """
+        pattern = re.compile(expr)
+        key = '{}:{}'.format(pattern.flags, pattern.pattern)
+        with self._lock:
+            with open(self.log_file, 'rb') as f:
+                state = self.__validate(f)
+                entry = state['patterns'].get(key)
+                is_new = entry is None
+                if is_new:
+                    entry = state['patterns'][key] = {'scanned': 0, 'list': self.__new_list()}
+                state['clock'] += 1
+                entry['used'] = state['clock']
+                matchings, archives_changed = self.__grep_archives(pattern, key)
+                if entry['list'] is None:
+                    changed = self.__scan(f)
+                else:
+                    changed = self.__scan(f, entry, pattern)
+                    if len(self._offsets[entry['list']]) > self.MAX_MATCHES:
+                        self.__drop_list(entry['list'])
+                        entry['list'] = None
+                if changed or is_new or archives_changed:
+                    self.__evict()
+                    self.__save()
+
+                if entry['list'] is None:
+                    end = 0
+                    for _, end, line in read_lines(f, 0):
+                        m = pattern.search(line)
+                        if m:
+                            matchings.append((line, m))
+                else:
+                    for offset in self._offsets[entry['list']]:
+                        for _, _, line in read_lines(f, offset):
+                            matchings.append((line, pattern.search(line)))
+                            break
+                    end = entry['scanned']
+
+                # A last line that is still being written isn't indexed
+                f.seek(end)
+                tail = f.read()
+                if tail:
+                    line = tail.decode('utf-8', 'replace') if six.PY3 else tail
+                    m = pattern.search(line)
+                    if m:
+                        matchings.append((line, m))
+        return matchings
+
+    def __grep_archives(self, pattern, key):
+        """
+        Returns the matchings in the archives of the log, and whether the
+        cached offsets had to be updated.
+        """
+        cache = self._state.setdefault('archives', {})
+        matchings = []
+        present = set()
+        changed = False
+        for segment in log_reader.RotatingLog(self.log_file).archives():
+            fp = segment.fingerprint()
+            if fp is None:
+                continue
+            present.add(fp)
+            cached = cache.setdefault(fp, {})
+            lines = self._archive_lines.get((fp, key))
+            if lines is None and cached.get(key) is not None:
+                try:
+                    lines = _lines_at(segment, self._offsets[cached[key]])
+                except log_reader.ARCHIVE_ERRORS:
+                    pass
+                else:
+                    self._archive_lines[(fp, key)] = lines
+            if lines is None:
+                try:
+                    found = [(start, line) for start, _, line in segment.lines(strict=True) if pattern.search(line)]
+                except log_reader.ARCHIVE_ERRORS:
+                    # Most likely still being compressed: don't remember a partial read
+                    lines = [line for _, _, line in segment.lines() if pattern.search(line)]
+                else:
+                    lines = [line for _, line in found]
+                    if key not in cached:
+                        name = None
+                        if len(found) <= self.MAX_MATCHES:
+                            name = self.__new_list()
+                            self._offsets[name].extend(start for start, _ in found)
+                        cached[key] = name
+                        changed = True
+                    if cached[key] is not None:
+                        self._archive_lines[(fp, key)] = lines
+            matchings.extend((line, pattern.search(line)) for line in lines)
+        for fp in list(cache):
+            if fp not in present:
+                for name in cache.pop(fp).values():
+                    self.__drop_list(name)
+                changed = True
+        for fp, k in list(self._archive_lines):
+            if fp not in present:
+                del self._archive_lines[(fp, k)]
+        return matchings, changed
+
+    def __evict(self):
+        patterns = self._state['patterns']
+        if len(patterns) > self.MAX_PATTERNS:
+            by_use = sorted(patterns, key=lambda k: patterns[k].get('used', 0))
+            for key in by_use[:len(patterns) - self.MAX_PATTERNS]:
+                self.__drop_list(patterns.pop(key)['list'])
+                for archived in self._state.get('archives', {}).values():
+                    self.__drop_list(archived.pop(key, None))
+                for fp, k in list(self._archive_lines):
+                    if k == key:
+                        del self._archive_lines[(fp, k)]
+
+
+def _lines_at(segment, offsets):
+    """
+    Returns the lines of the segment starting at the given sorted offsets.
+    """
+    lines = []
+    if not offsets:
+        return lines
+    wanted = iter(offsets)
+    offset = next(wanted)
+    for start, _, line in segment.lines(offsets[0], strict=True):
+        if start == offset:
+            lines.append(line)
+            offset = next(wanted, None)
+            if offset is None:
+                break
+    return lines
@@ -0,0 +1,391 @@
+#
+# Helpers to follow node log files as they are written
+#
+
+from __future__ import absolute_import
+
+import errno
+import gzip
+import hashlib
+import os
+import re
+import select
+import stat
+import threading
+import time
+import zipfile
+import zlib
+from contextlib import closing
+
+import six
+
+from ccmlib import inotify
+
+_INOTIFY_MASK = (inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE | inotify.IN_CREATE |
+                 inotify.IN_MOVED_TO | inotify.IN_DELETE | inotify.IN_MOVED_FROM)
+
+
+class PollingChangeWaiter(object):
+
+    """
+    Waits for log files to change by sleeping, starting with a short delay that
+    doubles every time nothing new was found, up to max_delay. Used where
+    inotify is not available.
+    """
+
+    def __init__(self, paths=(), min_delay=0.01, max_delay=0.5):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min_delay
+        self._wakeup = threading.Event()
+
+    def add_file(self, path):
+        pass
+
+    def wait(self, timeout):
+        """
+        Sleeps for the current backoff delay (never longer than timeout) and
+        returns True, as a change may have happened in the meantime.
+        """
+        self._wakeup.wait(max(0, min(self.delay, timeout)))
+        self._wakeup.clear()
+        self.delay = min(self.delay * 2, self.max_delay)
+        return True
+
+    def wakeup(self):
+        """
+        Makes a concurrent call to wait() return immediately.
+        """
+        self._wakeup.set()
+
+    def reset(self):
+        """
+        To be called when new data was found, so the next wait is short again.
+        """
+        self.delay = self.min_delay
+
+    def close(self):
+        pass
+
+
+class InotifyChangeWaiter(object):
+
+    """
+    Waits for log files to change using inotify. The parent directory of each
+    file is watched, so that the creation or replacement of a file is noticed
+    as well as appends to it.
+    """
+
+    def __init__(self, paths=()):
+        self._inotify = inotify.Inotify()
+        self._wakeup_pipe = os.pipe()
+        self._names = {}
+        self._wds = {}
+        self._pending = set()
+        self._backoff = PollingChangeWaiter()
+        for path in paths:
+            self.add_file(path)
+
+    def add_file(self, path):
+        directory, name = os.path.split(os.path.abspath(path))
+        self._names.setdefault(directory, set()).add(name)
+        if directory not in self._wds.values():
+            self._pending.add(directory)
+            self.__add_pending_watches()
+
+    def __add_pending_watches(self):
+        for directory in list(self._pending):
+            try:
+                wd = self._inotify.add_watch(directory, _INOTIFY_MASK)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            self._wds[wd] = directory
+            self._pending.discard(directory)
+
+    def wait(self, timeout):
+        """
+        Blocks until one of the files changes or timeout seconds have passed.
+        Returns True if a change was notified.
+        """
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            polling = False
+            if self._pending:
+                # Some directory doesn't exist yet, so fall back to polling for it.
+                self.__add_pending_watches()
+                if self._pending:
+                    polling = True
+                    remaining = min(remaining, self._backoff.delay)
+                    self._backoff.delay = min(self._backoff.delay * 2, self._backoff.max_delay)
+            try:
+                readable, _, _ = select.select([self._inotify.fileno(), self._wakeup_pipe[0]], [], [], remaining)
+            except (select.error, OSError) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if self._wakeup_pipe[0] in readable:
+                os.read(self._wakeup_pipe[0], 4096)
+                return True
+            if not readable:
+                return polling
+            for wd, mask, _, name in self._inotify.read_events(0):
+                if mask & inotify.IN_Q_OVERFLOW:
+                    return True
+                directory = self._wds.get(wd)
+                if directory is not None and name in self._names.get(directory, ()):
+                    return True
+
+    def wakeup(self):
+        os.write(self._wakeup_pipe[1], b'x')
+
+    def reset(self):
+        self._backoff.reset()
+
+    def close(self):
+        self._inotify.close()
+        for fd in self._wakeup_pipe:
+            os.close(fd)
+        self._wakeup_pipe = ()
+
+
+def change_waiter(paths=()):
+    """
+    Returns an object whose wait(timeout) method returns as soon as one of the
+    given files is modified. Uses inotify when available, and an adaptive
+    backoff poll otherwise.
+    """
+    if inotify.is_available():
+        try:
+            return InotifyChangeWaiter(paths)
+        except OSError:
+            # Most likely the inotify instance limit has been reached
+            pass
+    return PollingChangeWaiter(paths)
+
+
+def fingerprint(handle, size=4096):
+    """
+    Identifies a log file by a hash of its first line (which carries a
+    timestamp), so that it can be recognized after it is renamed or rolled.
+    Returns None while the file doesn't have a complete first line.
+    """
+    handle.seek(0)
+    return _head_fingerprint(handle.read(size))
+
+
+def _head_fingerprint(head):
+    newline = head.find(b'\n')
+    if newline < 0:
+        return None
+    return hashlib.sha1(head[:newline + 1]).hexdigest()
+
+
+def read_lines(handle, start, end=None):
+    """
+    Yields (start offset, end offset, line) for each complete line of the
+    binary file handle, starting at byte offset start and stopping at end if
+    given. A trailing line that is still being written is not returned.
+    The handle may also be a decompressing stream that can't seek.
+    """
+    _skip_to(handle, start)
+    while end is None or start < end:
+        line = handle.readline()
+        if not line.endswith(b'\n'):
+            break
+        next_start = start + len(line)
+        if line.endswith(b'\r\n'):
+            line = line[:-2] + b'\n'
+        yield start, next_start, line.decode('utf-8', 'replace') if six.PY3 else line
+        start = next_start
+
+
+def _skip_to(handle, offset):
+    seekable = getattr(handle, 'seekable', None)
+    if seekable is not None and seekable():
+        handle.seek(offset)
+        return
+    while offset > 0:
+        skipped = len(handle.read(min(offset, 1 << 16)))
+        if not skipped:
+            break
+        offset -= skipped
+
+
+# What reading an archive that logback is still writing (or has just
+# removed) may raise
+ARCHIVE_ERRORS = (IOError, OSError, EOFError, zlib.error, zipfile.BadZipfile)
+
+_archive_fingerprints = {}
+
+
+class LogMark(int):
+
+    """
+    A position in a log that is still meaningful after the log is rolled: the
+    byte offset in the file that was active when the mark was taken, along
+    with the fingerprint of that file as its generation. Being an int, a mark
+    can be used wherever a plain offset into the active file was expected.
+    """
+
+    def __new__(cls, offset=0, generation=None):
+        mark = super(LogMark, cls).__new__(cls, offset)
+        mark.generation = generation
+        return mark
+
+    def __reduce__(self):
+        return LogMark, (int(self), self.generation)
+
+    def __repr__(self):
+        return 'LogMark({}, {!r})'.format(int(self), self.generation)
+
+
+class LogSegment(object):
+
+    """
+    One file of the history of a log: either the active file, or an archive
+    rolled by logback, which is read as a stream if it is compressed.
+    """
+
+    def __init__(self, path, active=False):
+        self.path = path
+        self.active = active
+
+    def open(self):
+        """
+        Returns a binary stream over the uncompressed content of the segment.
+        """
+        if self.path.endswith('.zip'):
+            with closing(zipfile.ZipFile(self.path)) as archive:
+                members = [m for m in archive.infolist() if not m.filename.endswith('/')]
+                if not members:
+                    raise zipfile.BadZipfile("No log file in {}".format(self.path))
+                # The member stays readable once the archive is closed
+                return archive.open(members[0])
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, 'rb')
+        return open(self.path, 'rb')
+
+    def fingerprint(self):
+        """
+        Returns the generation of the segment, as recorded in LogMarks.
+        """
+        try:
+            if self.active:
+                with open(self.path, 'rb') as f:
+                    return fingerprint(f)
+            # Archives never change, so only read their head once
+            st = os.stat(self.path)
+            key = (st.st_mtime, st.st_size)
+            cached = _archive_fingerprints.get(self.path)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            with closing(self.open()) as stream:
+                fp = _head_fingerprint(stream.read(4096))
+            _archive_fingerprints[self.path] = (key, fp)
+            return fp
+        except ARCHIVE_ERRORS:
+            return None
+
+    def lines(self, start=0, end=None, strict=False):
+        """
+        Yields (start offset, end offset, line) for the complete lines of the
+        segment from byte offset start on. Unless strict is set, an archive
+        that can't be read (yet) is treated as empty or cut short.
+        """
+        try:
+            stream = self.open()
+        except ARCHIVE_ERRORS as e:
+            if strict or (self.active and getattr(e, 'errno', None) != errno.ENOENT):
+                raise
+            return
+        with closing(stream):
+            try:
+                for item in read_lines(stream, start, end):
+                    yield item
+            except ARCHIVE_ERRORS:
+                if strict or self.active:
+                    raise
+
+
+class RotatingLog(object):
+
+    """
+    A log file along with the archives logback rolls it into, such as
+    system.log.1.zip or system.log.2020-01-01.0.zip. Archives are ordered
+    oldest first by modification time, and are never extracted to disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._archive_name = re.compile(re.escape(os.path.basename(path)) + r'\.\d[\w.\-]*$')
+
+    def archives(self):
+        directory = os.path.dirname(self.path)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        found = []
+        for name in names:
+            # Logback renames the active file to a .tmp file before compressing it
+            if not self._archive_name.match(name) or name.endswith('.tmp'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                found.append((st.st_mtime, name, path))
+        return [LogSegment(path) for _, _, path in sorted(found)]
+
+    def segments(self):
+        return self.archives() + [LogSegment(self.path, active=True)]
+
+    def generation(self):
+        return LogSegment(self.path, active=True).fingerprint()
+
+    def mark(self):
+        """
+        Returns a LogMark at the current end of the active file.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                return LogMark(size, fingerprint(f))
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return LogMark(0)
+
+    def lines(self, from_mark=None, end=None):
+        """
+        Yields (segment, start offset, end offset, line) for each complete
+        line after from_mark, oldest first, stopping at offset end of the
+        active file if given. Without a mark, the whole history is read. A
+        mark without a generation is an offset into the active file, and a
+        mark whose generation isn't around anymore starts at the oldest
+        archive left.
+        """
+        segments = self.segments()
+        first, offset = 0, 0
+        if from_mark is not None:
+            generation = getattr(from_mark, 'generation', None)
+            if generation is None:
+                first, offset = len(segments) - 1, int(from_mark)
+            else:
+                for i in reversed(range(len(segments))):
+                    if segments[i].fingerprint() == generation:
+                        first, offset = i, int(from_mark)
+                        break
+        for i in range(first, len(segments)):
+            segment = segments[i]
+            for start, next_start, line in segment.lines(offset if i == first else 0,
+                                                         end if segment.active else None):
+                yield segment, start, next_start, line
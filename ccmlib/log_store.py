@@ -0,0 +1,329 @@
+#
+# Structured parsing of node logs into a queryable columnar store
+#
+
+from __future__ import absolute_import
+
+import json
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import six
+
+from ccmlib.log_index import index_dir
+from ccmlib.log_reader import LogMark, RotatingLog
+
+LEVELS = ('TRACE', 'DEBUG', 'INFO', 'WARN', 'ERROR')
+
+# "INFO  [main] 2017-01-01 00:00:00,000 CassandraDaemon.java:123 - message" as
+# written by logback, or "INFO [main] 2013-01-01 00:00:00,000 CassandraDaemon.java
+# (line 123) message" as written by log4j in older versions
+_header = re.compile(r'\s*(TRACE|DEBUG|INFO|WARN|ERROR)\s+\[(.*?)\]\s+'
+                     r'(\d{4})-(\d\d)-(\d\d)[ T](\d\d):(\d\d):(\d\d)(?:[,.](\d{3}))?\s+'
+                     r'(\S+?)(?::(\d+)| \(line (\d+)\))(?: -)? ?(.*)$')
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Not all Python 2 platforms have the 'q' array type code
+_INT64 = 'q' if six.PY3 else 'l'
+
+# Column name -> array type code
+_COLUMNS = (('level', 'b'), ('thread', 'i'), ('time', _INT64), ('file', 'i'), ('line', 'i'), ('message_end', _INT64))
+
+# A parsed log entry. timestamp is a naive datetime in the log's own time
+# zone, and message includes the continuation lines (stack trace) if any.
+LogRecord = namedtuple('LogRecord', 'level thread timestamp file line message')
+
+
+def parse_line(line):
+    """
+    Parses the header line of a log entry. Returns a LogRecord, or None if
+    the line is not in the standard layout (e.g. a stack trace line).
+    """
+    m = _header.match(line)
+    if m is None:
+        return None
+    g = m.groups()
+    millis = int(g[8]) if g[8] else 0
+    timestamp = datetime(int(g[2]), int(g[3]), int(g[4]), int(g[5]), int(g[6]), int(g[7]), millis * 1000)
+    return LogRecord(g[0], g[1], timestamp, g[9], int(g[10] or g[11]), g[12].rstrip('\r\n'))
+
+
+def parse_log(lines):
+    """
+    Yields the LogRecords of an iterable of log lines, folding the lines that
+    don't start a log entry into the message of the previous one. Lines
+    before the first entry are skipped.
+    """
+    current = None
+    for line in lines:
+        record = parse_line(line)
+        if record is None:
+            if current is not None:
+                current = current._replace(message=current.message + '\n' + line.rstrip('\r\n'))
+            continue
+        if current is not None:
+            yield current
+        current = record
+    if current is not None:
+        yield current
+
+
+def _to_millis(timestamp):
+    if isinstance(timestamp, datetime):
+        delta = timestamp - _EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+    return int(timestamp)
+
+
+class LogStore(object):
+
+    """
+    The entries of a node log, parsed once and stored column by column next
+    to its index (see log_index.index_dir): one array file each for level, thread, timestamp,
+    source file, source line and message end offset, and the messages
+    themselves in a single utf-8 file. Threads and source files are
+    dictionary encoded. Each update only parses what was written since the
+    previous one, following the log into its archives when it is rolled,
+    and the last entry (which may still get continuation lines) is only
+    stored once the next one starts.
+    """
+
+    VERSION = 1
+
+    def __init__(self, log_file, store_dir):
+        self.log_file = log_file
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        self._last = None
+        self.__load()
+
+    @staticmethod
+    def for_log(log_file):
+        return LogStore(log_file, os.path.join(index_dir(log_file), os.path.basename(log_file) + '.store'))
+
+    def __path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def __reset(self):
+        self._meta = {'version': self.VERSION, 'fingerprint': None, 'scanned': 0, 'count': 0,
+                      'threads': [], 'files': []}
+        self._columns = dict((name, array(code)) for name, code in _COLUMNS)
+        self._codes = {'threads': {}, 'files': {}}
+        self._last = None
+        for name in [name for name, _ in _COLUMNS] + ['messages']:
+            try:
+                os.remove(self.__path(name + '.bin'))
+            except OSError:
+                pass
+
+    def __load(self):
+        try:
+            with open(self.__path('meta.json'), 'r') as f:
+                meta = json.load(f)
+            if meta.get('version') != self.VERSION:
+                raise ValueError('Unsupported version')
+            columns = {}
+            count = meta['count']
+            for name, code in _COLUMNS:
+                column = array(code)
+                with open(self.__path(name + '.bin'), 'rb') as f:
+                    column.fromfile(f, count)
+                columns[name] = column
+            self._meta, self._columns = meta, columns
+            self._codes = dict((d, dict((v, i) for i, v in enumerate(meta[d]))) for d in ('threads', 'files'))
+            # Drop whatever an interrupted update appended after the last
+            # saved count
+            for name, code in _COLUMNS:
+                self.__truncate(name + '.bin', count * columns[name].itemsize)
+            self.__truncate('messages.bin', columns['message_end'][-1] if count else 0)
+        except (IOError, OSError, ValueError, KeyError, EOFError):
+            self.__reset()
+
+    def __truncate(self, name, size):
+        path = self.__path(name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, 'r+b') as f:
+                f.truncate(size)
+
+    def __save(self, new_columns, messages):
+        if not os.path.exists(self.store_dir):
+            os.makedirs(self.store_dir)
+        try:
+            for name, _ in _COLUMNS:
+                with open(self.__path(name + '.bin'), 'ab') as f:
+                    new_columns[name].tofile(f)
+            with open(self.__path('messages.bin'), 'ab') as f:
+                f.write(messages)
+            tmp = '{}.{}.tmp'.format(self.__path('meta.json'), os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(self._meta, f)
+            os.rename(tmp, self.__path('meta.json'))
+        except (IOError, OSError):
+            # The columns may not line up anymore: have the store rebuilt
+            self.__reset()
+            try:
+                os.remove(self.__path('meta.json'))
+            except OSError:
+                pass
+            raise
+
+    def __encode(self, dictionary, value):
+        codes = self._codes[dictionary]
+        code = codes.get(value)
+        if code is None:
+            values = self._meta[dictionary]
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def update(self):
+        """
+        Parses and stores the log entries written since the last update.
+        """
+        with self._lock:
+            log = RotatingLog(self.log_file)
+            active = log.generation()
+            if active is None:
+                # Wait for the active file to have a first line to identify it
+                return
+            from_mark = None
+            start = 0
+            fingerprint = self._meta['fingerprint']
+            if fingerprint is not None:
+                if fingerprint == active:
+                    if os.path.getsize(self.log_file) >= self._meta['scanned']:
+                        from_mark = LogMark(self._meta['scanned'], fingerprint)
+                        start = self._meta['scanned']
+                elif fingerprint in [s.fingerprint() for s in log.archives()]:
+                    # Rolled: finish the archive, then read the new file
+                    from_mark = LogMark(self._meta['scanned'], fingerprint)
+                if from_mark is None:
+                    # Replaced or truncated rather than rolled: start over
+                    self.__reset()
+            meta = self._meta
+
+            new_columns = dict((name, array(code)) for name, code in _COLUMNS)
+            messages = []
+            message_end = [self._columns['message_end'][-1] if meta['count'] else 0]
+
+            def store(record):
+                message = record.message.encode('utf-8') if six.PY3 else record.message
+                message_end[0] += len(message)
+                new_columns['level'].append(LEVELS.index(record.level))
+                new_columns['thread'].append(self.__encode('threads', record.thread))
+                new_columns['time'].append(_to_millis(record.timestamp))
+                new_columns['file'].append(self.__encode('files', record.file))
+                new_columns['line'].append(record.line)
+                new_columns['message_end'].append(message_end[0])
+                messages.append(message)
+
+            last, last_start, last_active = None, None, False
+            scanned = start
+            for segment, line_start, line_end, line in log.lines(from_mark):
+                if segment.active:
+                    scanned = line_end
+                record = parse_line(line)
+                if record is None:
+                    if last is not None:
+                        last = last._replace(message=last.message + '\n' + line.rstrip('\r\n'))
+                    continue
+                if last is not None:
+                    store(last)
+                last, last_start, last_active = record, line_start, segment.active
+            if last_active:
+                # Its stack trace may still be being written: parse it again next time
+                scanned = last_start
+            elif last is not None:
+                store(last)
+                last = None
+            self._last = last
+
+            count = len(new_columns['level'])
+            if count or meta['fingerprint'] != active or meta['scanned'] != scanned:
+                for name, _ in _COLUMNS:
+                    self._columns[name].extend(new_columns[name])
+                meta['count'] += count
+                meta['fingerprint'] = active
+                meta['scanned'] = scanned
+                self.__save(new_columns, b''.join(messages))
+
+    def __len__(self):
+        return self._meta['count']
+
+    def query(self, level=None, since=None, until=None, logger=None, regex=None):
+        """
+        Returns the LogRecords of the log, oldest first, filtered by level
+        (one level or a list of them), by time range (since inclusive, until
+        exclusive, as datetimes), by logger (the class name, with or without
+        its package, as logged by the %F layout field) and by a regular
+        expression searched in the message.
+        """
+        self.update()
+        level_names = None
+        if level is not None:
+            level_names = set([level] if isinstance(level, six.string_types) else level)
+        since_ms = _to_millis(since) if since is not None else None
+        until_ms = _to_millis(until) if until is not None else None
+        file_names = None
+        if logger is not None:
+            name = logger[:-len('.java')] if logger.endswith('.java') else logger
+            name = name.rsplit('.', 1)[-1]
+            file_names = set([name, name + '.java'])
+        pattern = re.compile(regex) if regex is not None else None
+
+        def matches(record):
+            return ((level_names is None or record.level in level_names) and
+                    (since_ms is None or _to_millis(record.timestamp) >= since_ms) and
+                    (until_ms is None or _to_millis(record.timestamp) < until_ms) and
+                    (file_names is None or record.file in file_names) and
+                    (pattern is None or pattern.search(record.message) is not None))
+
+        with self._lock:
+            meta, columns = self._meta, self._columns
+            levels = None if level_names is None else set(LEVELS.index(l) for l in level_names)
+            files = None if file_names is None else set(i for i, f in enumerate(meta['files']) if f in file_names)
+
+            # Filter on the fixed-size columns first, and only read the
+            # messages of the entries that pass
+            level_col, time_col, file_col = columns['level'], columns['time'], columns['file']
+            selected = []
+            for i in range(meta['count']):
+                if levels is not None and level_col[i] not in levels:
+                    continue
+                if since_ms is not None and time_col[i] < since_ms:
+                    continue
+                if until_ms is not None and time_col[i] >= until_ms:
+                    continue
+                if files is not None and file_col[i] not in files:
+                    continue
+                selected.append(i)
+
+            records = []
+            if selected:
+                ends = columns['message_end']
+                with open(self.__path('messages.bin'), 'rb') as f:
+                    # mmap can't map an empty file
+                    blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if ends[-1] else b''
+                    try:
+                        for i in selected:
+                            message = blob[ends[i - 1] if i else 0:ends[i]]
+                            if six.PY3:
+                                message = message.decode('utf-8', 'replace')
+                            if pattern is not None and not pattern.search(message):
+                                continue
+                            records.append(LogRecord(LEVELS[level_col[i]], meta['threads'][columns['thread'][i]],
+                                                     _EPOCH + timedelta(milliseconds=time_col[i]),
+                                                     meta['files'][file_col[i]], columns['line'][i], message))
+                    finally:
+                        if ends[-1]:
+                            blob.close()
+
+            if self._last is not None and matches(self._last):
+                records.append(self._last)
+            return records
@@ -0,0 +1,369 @@
+#
+# Cluster-wide log tailing service
+#
+
+from __future__ import absolute_import
+
+import errno
+import os
+import re
+import threading
+from collections import deque
+
+from ccmlib import common, log_reader
+from ccmlib.log_reader import read_lines
+
+# How many of the last lines read a subscription keeps for error messages
+READS_BUFFER_LINES = 20
+
+# Numbered backreferences would point to the wrong group once a pattern is
+# embedded in a combined regex
+_backreference = re.compile(r'\\[1-9]')
+_default_flags = re.compile('').flags
+
+
+class LogSubscription(object):
+
+    """
+    A set of regular expressions to find in a log file, from a given mark on.
+    Once all expressions have been found, wait() returns True and matchings
+    holds the (line, match object) pairs in the order they were found. If the
+    mark is a LogMark from before the log was rolled, the search starts in
+    the archive the mark points into.
+
+    The pending expressions are combined into a single alternation, so that
+    each line is scanned once however many of them there are. Only the lines
+    the alternation matches are searched with each expression separately.
+
+    If a callback is given, it is called with (line, offset) for each new
+    line of the file until the subscription is removed from its tailer.
+
+    If the tailer fails, error holds its exception, which wait() raises.
+    """
+
+    def __init__(self, path, exprs, from_mark=None, callback=None):
+        self.path = path
+        self.pending = [e if hasattr(e, 'search') else re.compile(e) for e in exprs]
+        self.matchings = []
+        self.reads = deque(maxlen=READS_BUFFER_LINES)
+        self.from_mark = from_mark if from_mark is not None else 0
+        self.callback = callback
+        self.error = None
+        self._event = threading.Event()
+        self._done_lock = threading.Lock()
+        self._done_callbacks = []
+        if not self.pending and callback is None:
+            self._event.set()
+        self.__combine()
+
+    def __combine(self):
+        """
+        Builds the alternation of the pending expressions that can be
+        combined. The others (with non-default flags or backreferences) are
+        searched separately.
+        """
+        combinable = [e for e in self.pending if e.flags == _default_flags and not _backreference.search(e.pattern)]
+        self._combined = None
+        if len(combinable) > 1:
+            try:
+                self._combined = re.compile('|'.join('(?P<_p{}>{})'.format(i, e.pattern) for i, e in enumerate(combinable)))
+            except re.error:
+                # e.g. the same group name in two expressions
+                pass
+        if self._combined is None:
+            self._separate = list(self.pending)
+        else:
+            self._separate = [e for e in self.pending if not any(e is c for c in combinable)]
+
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Waits up to timeout seconds for all expressions to be found, and
+        returns whether they were. Raises the error of the tailer if it
+        failed.
+        """
+        self._event.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self._event.is_set()
+
+    def add_done_callback(self, fn):
+        """
+        Calls fn(subscription) once all expressions have been found or the
+        tailer failed, or right away if that already happened. fn is called
+        from the tailer thread, so it must not block.
+        """
+        with self._done_lock:
+            if not self._event.is_set():
+                self._done_callbacks.append(fn)
+                return
+        fn(self)
+
+    def __set_done(self):
+        with self._done_lock:
+            self._event.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                common.warning("Log subscription callback on {} failed: {}".format(self.path, e))
+
+    def fail(self, error):
+        """
+        Ends the subscription with the error its tailer failed with, since
+        nothing will feed it anymore.
+        """
+        if not self._event.is_set():
+            self.error = error
+            self.__set_done()
+
+    def feed(self, line, offset):
+        if offset < self.from_mark or self._event.is_set():
+            return
+        if self.callback is not None:
+            try:
+                self.callback(line, offset)
+            except Exception as e:
+                common.warning("Log subscription callback on {} failed: {}".format(self.path, e))
+        if self.pending:
+            self.reads.append(line)
+            candidates = self._separate
+            if self._combined is not None and self._combined.search(line):
+                # The line may match more than one expression
+                candidates = self.pending
+            found = False
+            for e in list(candidates):
+                m = e.search(line)
+                if m:
+                    self.matchings.append((line, m))
+                    self.pending.remove(e)
+                    found = True
+            if not self.pending:
+                self.__set_done()
+            elif found:
+                self.__combine()
+
+
+class _TailedFile(object):
+
+    def __init__(self, path, position):
+        self.path = path
+        self.position = position
+        self.handle = None
+        self.subscriptions = []
+
+    def __open(self):
+        if self.handle is None:
+            try:
+                self.handle = open(self.path, 'rb')
+            except IOError as e:
+                if e.errno == errno.ENOENT:
+                    return False
+                raise
+        return True
+
+    def __dispatch(self, handle, start, end=None):
+        found = False
+        for line_start, line_end, line in read_lines(handle, start, end):
+            found = True
+            if end is None:
+                self.position = line_end
+            for sub in self.subscriptions:
+                sub.feed(line, line_start)
+        return found
+
+    def generation(self):
+        """
+        Returns the fingerprint of the file being read, which may still be
+        the previous one if it was rolled since the last poll.
+        """
+        if self.handle is not None:
+            return log_reader.fingerprint(self.handle)
+        return log_reader.RotatingLog(self.path).generation()
+
+    def catch_up_rolled(self, subscription):
+        """
+        Feeds the archived lines after the subscription mark if the mark was
+        taken before the log was rolled, and moves the mark to the start of
+        the active file.
+        """
+        mark = subscription.from_mark
+        generation = getattr(mark, 'generation', None)
+        if generation is None or generation == self.generation():
+            return
+        subscription.from_mark = 0
+        for segment, line_start, _, line in log_reader.RotatingLog(self.path).lines(mark):
+            if segment.active:
+                break
+            subscription.feed(line, line_start)
+
+    def catch_up(self, subscription):
+        """
+        Feeds the lines between the subscription mark and the current
+        position, which other subscriptions have already seen.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                for line_start, _, line in read_lines(f, subscription.from_mark, self.position):
+                    subscription.feed(line, line_start)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def poll(self):
+        """
+        Dispatches the lines appended since the last poll, and returns whether
+        there were any.
+        """
+        if not self.__open():
+            return False
+        found = self.__dispatch(self.handle, self.position)
+
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return found
+        if st.st_ino != os.fstat(self.handle.fileno()).st_ino or st.st_size < self.position:
+            # The file was replaced or truncated: what we have read so far
+            # is gone, so start over from the beginning of the new file.
+            self.close()
+            self.position = 0
+            for sub in self.subscriptions:
+                sub.from_mark = 0
+            if self.__open():
+                found = self.__dispatch(self.handle, self.position) or found
+        return found
+
+    def prune(self):
+        self.subscriptions = [s for s in self.subscriptions if s.callback is not None or not s.done()]
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class LogTailer(object):
+
+    """
+    Reads log files once on behalf of many subscriptions. Each file is read
+    by a single background thread, which is started when the first
+    subscription is added and exits when the last one is removed. Each new
+    line is dispatched to all the subscriptions on its file.
+    """
+
+    def __init__(self, max_wait=1):
+        self.max_wait = max_wait
+        self._lock = threading.RLock()
+        self._files = {}
+        self._thread = None
+        self._waiter = None
+
+    def subscribe(self, path, exprs, from_mark=None, callback=None):
+        """
+        Registers and returns a LogSubscription for the given expressions.
+        """
+        return self.add([LogSubscription(path, exprs, from_mark=from_mark, callback=callback)])[0]
+
+    def add(self, subscriptions):
+        """
+        Registers a batch of subscriptions. A file that is not tailed yet
+        starts being read from the lowest mark of the batch on it, so that
+        subscribing to many patterns at once reads each file only once.
+        """
+        with self._lock:
+            touched = {}
+            for sub in subscriptions:
+                tailed = self._files.get(sub.path)
+                if tailed is None:
+                    tailed = touched.get(sub.path)
+                    if tailed is None:
+                        tailed = _TailedFile(sub.path, None)
+                    tailed.catch_up_rolled(sub)
+                    tailed.position = sub.from_mark if tailed.position is None else min(tailed.position, sub.from_mark)
+                else:
+                    tailed.catch_up_rolled(sub)
+                    if sub.from_mark < tailed.position:
+                        tailed.catch_up(sub)
+                tailed.subscriptions.append(sub)
+                touched[sub.path] = tailed
+            self._files.update(touched)
+            # Lines that are already in the file are found right away.
+            for tailed in touched.values():
+                tailed.poll()
+                tailed.prune()
+            self.__ensure_running()
+        return subscriptions
+
+    def remove(self, subscription):
+        with self._lock:
+            tailed = self._files.get(subscription.path)
+            if tailed is None:
+                return
+            if subscription in tailed.subscriptions:
+                tailed.subscriptions.remove(subscription)
+            if not tailed.subscriptions:
+                tailed.close()
+                del self._files[subscription.path]
+
+    def poll(self, paths=None):
+        """
+        Synchronously reads what was appended to the tailed files (or to the
+        given ones only), without waiting for the background thread.
+        """
+        with self._lock:
+            for path, tailed in list(self._files.items()):
+                if paths is None or path in paths:
+                    tailed.poll()
+                    tailed.prune()
+
+    def __ensure_running(self):
+        if self._thread is None:
+            if not self._files:
+                return
+            self._waiter = log_reader.change_waiter()
+            self._thread = threading.Thread(target=self.__run, args=(self._waiter,), name='ccm-log-tailer')
+            self._thread.daemon = True
+            self._thread.start()
+        else:
+            self._waiter.wakeup()
+
+    def __run(self, waiter):
+        watched = set()
+        try:
+            while True:
+                found = False
+                with self._lock:
+                    if not self._files:
+                        self._thread = None
+                        self._waiter = None
+                        return
+                    for path in self._files:
+                        if path not in watched:
+                            waiter.add_file(path)
+                            watched.add(path)
+                    for tailed in list(self._files.values()):
+                        if tailed.poll():
+                            found = True
+                        tailed.prune()
+                if found:
+                    waiter.reset()
+                else:
+                    waiter.wait(self.max_wait)
+        except Exception as e:
+            common.error("Log tailer failed: {}".format(e))
+            with self._lock:
+                self._thread = None
+                self._waiter = None
+                # Nothing polls the files anymore: don't leave their
+                # subscriptions waiting out their timeouts
+                for tailed in self._files.values():
+                    for sub in tailed.subscriptions:
+                        sub.fail(e)
+                    tailed.close()
+                self._files.clear()
+        finally:
+            waiter.close()
@@ -1,7 +1,6 @@
 # ccm node
 from __future__ import absolute_import, with_statement
 
-import errno
 import glob
 import os
 import re
@@ -17,14 +16,23 @@ from collections import namedtuple
 from datetime import datetime
 from distutils.version import LooseVersion  #pylint: disable=import-error, no-name-in-module
 
-import yaml
 from six import iteritems, print_, string_types
 
-from ccmlib import common, extension
+from ccmlib import cds, common, compaction_log, config_session, extension, gc_log, gossip, log_index, readiness, timings
 from ccmlib.cli_session import CliSession
+from ccmlib.log_errors import extract_errors, iter_errors
+from ccmlib.log_index import LogIndex
+from ccmlib.log_reader import RotatingLog
+from ccmlib.log_store import LogStore
+from ccmlib.process import ProcessHandle, start_time, wait_for_pidfiles
 from ccmlib.repository import setup
+from ccmlib.timings import Timings
 from six.moves import xrange
 
+# Seconds for a stopped node to exit, and then to die once killed
+STOP_TIMEOUT = 127
+KILL_TIMEOUT = 10
+
 
 class Status():
     UNINITIALIZED = "UNINITIALIZED"
@@ -100,6 +108,10 @@ class Node(object):
         self.byteman_port = byteman_port
         self.initial_token = initial_token
         self.pid = None
+        self.pid_start_time = None
+        self._process = None
+        # Where the running node dumps its class data sharing archive, if it does
+        self._cds_dump = None
         self.data_center = None
         self.workloads = []
         self._dse_config_options = {}
@@ -109,6 +121,10 @@ class Node(object):
         self.__classes_log_level = {}
         self.__environment_variables = environment_variables or {}
         self.__conf_updated = False
+        self._log_indexes = {}
+        self._log_stores = {}
+        # Phase timings of the last start and stop, by operation
+        self.timings = {}
         if save:
             self.import_config_files()
             self.import_bin_files()
@@ -124,7 +140,7 @@ class Node(object):
         node_path = os.path.join(path, name)
         filename = os.path.join(node_path, 'node.conf')
         with open(filename, 'r') as f:
-            data = yaml.load(f)
+            data = common.load_yaml(f)
         try:
             itf = data['interfaces']
             initial_token = None
@@ -143,6 +159,8 @@ class Node(object):
             node.status = data['status']
             if 'pid' in data:
                 node.pid = int(data['pid'])
+            if 'pid_start_time' in data:
+                node.pid_start_time = data['pid_start_time']
             if 'install_dir' in data:
                 node.__install_dir = data['install_dir']
             if 'config_options' in data:
@@ -182,6 +200,13 @@ class Node(object):
         if update_conf:
             self.__conf_updated = True
         env = common.make_cassandra_env(self.get_install_dir(), self.get_path(), update_conf)
+        plan = self.cluster.resource_plan
+        if plan is not None and 'max_heap_size' in plan:
+            # Unless set explicitly
+            if 'CCM_MAX_HEAP_SIZE' not in os.environ:
+                env['MAX_HEAP_SIZE'] = plan['max_heap_size']
+            if 'CCM_HEAP_NEWSIZE' not in os.environ:
+                env['HEAP_NEWSIZE'] = plan['heap_newsize']
         for (key, value) in self.__environment_variables.items():
             env[key] = value
         return env
@@ -342,9 +367,34 @@ class Node(object):
     def gclogfilename(self):
         return os.path.join(self.get_path(), 'logs', 'gc.log.0.current')
 
+    def mark_gc_log(self):
+        """
+        Returns a mark to the current end of the GC log of this node, for use
+        as the from_mark parameter of gc_stats.
+        """
+        return gc_log.GcLog(self.gclogfilename()).mark()
+
+    def gc_stats(self, since=None, until=None, from_mark=None):
+        """
+        Returns the GcStats (pause time percentiles and histogram, worst
+        pauses, allocation and promotion rates) of the GC log of this node,
+        optionally limited to a time window (datetimes, since inclusive and
+        until exclusive) or to what was logged after from_mark.
+        """
+        return gc_log.analyze(self.gclogfilename(), since=since, until=until, from_mark=from_mark)
+
     def compactionlogfilename(self):
         return os.path.join(self.get_path(), 'logs', 'compaction.log')
 
+    def compaction_stats(self, since=None, until=None, from_mark=None):
+        """
+        Returns the TableCompactionStats of each table that logs its
+        compactions (with the 'log_all' compaction option), by (keyspace,
+        table), optionally limited to a time window (naive UTC datetimes) or
+        to what was logged after from_mark (see mark_log('compaction.log')).
+        """
+        return compaction_log.analyze(self.compactionlogfilename(), since=since, until=until, from_mark=from_mark)
+
     def envfilename(self):
         return os.path.join(
             self.get_conf_dir(),
@@ -354,16 +404,10 @@ class Node(object):
     def grep_log(self, expr, filename='system.log'):
         """
         Returns a list of lines matching the regular expression in parameter
-        in the Cassandra log of this node
+        in the Cassandra log of this node, including the archives it was
+        rolled into
         """
-        matchings = []
-        pattern = re.compile(expr)
-        with open(os.path.join(self.get_path(), 'logs', filename)) as f:
-            for line in f:
-                m = pattern.search(line)
-                if m:
-                    matchings.append((line, m))
-        return matchings
+        return self._log_index(filename).grep(expr)
 
     def grep_log_for_errors(self, filename='system.log'):
         """
@@ -373,9 +417,46 @@ class Node(object):
         return self.grep_log_for_errors_from(seek_start=getattr(self, 'error_mark', 0))
 
     def grep_log_for_errors_from(self, filename='system.log', seek_start=0):
-        with open(os.path.join(self.get_path(), 'logs', filename)) as f:
-            f.seek(seek_start)
-            return _grep_log_for_errors(f.read())
+        log = RotatingLog(os.path.join(self.get_path(), 'logs', filename))
+        generation = getattr(seek_start, 'generation', None)
+        if generation is not None and generation != log.generation():
+            # The log was rolled since the mark was taken
+            lines = ((start, end, line) for _, start, end, line in log.lines(seek_start))
+            return [record.lines for record in extract_errors(lines)]
+
+        # Skip straight to the first indexed error, if any
+        index = self._log_index(filename)
+        index.update()
+        errors = index.level_offsets('ERROR', seek_start)
+        start = errors[0] if errors else max(seek_start, index.scanned())
+        with open(os.path.join(self.get_path(), 'logs', filename), 'rb') as f:
+            return [record.lines for record in iter_errors(f, start)]
+
+    def _log_index(self, filename):
+        log_file = os.path.join(self.get_path(), 'logs', filename)
+        index = self._log_indexes.get(log_file)
+        if index is None:
+            index = self._log_indexes.setdefault(log_file, LogIndex.for_log(log_file))
+        return index
+
+    def log_store(self, filename='system.log'):
+        """
+        Returns the LogStore holding the parsed entries of the given log of
+        this node, brought up to date on each query.
+        """
+        log_file = os.path.join(self.get_path(), 'logs', filename)
+        store = self._log_stores.get(log_file)
+        if store is None:
+            store = self._log_stores.setdefault(log_file, LogStore.for_log(log_file))
+        return store
+
+    def query_log(self, level=None, since=None, until=None, logger=None, regex=None, filename='system.log'):
+        """
+        Returns the entries of the Cassandra log of this node (as LogRecords
+        with level, thread, timestamp, file, line and message) matching all
+        the given filters. See LogStore.query.
+        """
+        return self.log_store(filename).query(level=level, since=since, until=until, logger=logger, regex=regex)
 
     def mark_log_for_errors(self, filename='system.log'):
         """
@@ -389,13 +470,9 @@ class Node(object):
         Returns "a mark" to the current position of this node Cassandra log.
         This is for use with the from_mark parameter of watch_log_for_* methods,
         allowing to watch the log from the position when this method was called.
+        The mark remains valid after the log is rolled into an archive.
         """
-        log_file = os.path.join(self.get_path(), 'logs', filename)
-        if not os.path.exists(log_file):
-            return 0
-        with open(log_file) as f:
-            f.seek(0, os.SEEK_END)
-            return f.tell()
+        return RotatingLog(os.path.join(self.get_path(), 'logs', filename)).mark()
 
     def print_process_output(self, name, proc, verbose=False):
         # If stderr_file exists on the process, we opted to
@@ -420,67 +497,60 @@ class Node(object):
         timeouts (a TimeoutError is then raised). On successful completion,
         a list of pair (line matched, match object) is returned.
         """
-        elapsed = 0
+        deadline = time.time() + timeout
         tofind = [exprs] if isinstance(exprs, string_types) else exprs
-        tofind = [re.compile(e) for e in tofind]
-        matchings = []
-        reads = ""
         if len(tofind) == 0:
             return None
 
         log_file = os.path.join(self.get_path(), 'logs', filename)
         output_read = False
-        while not os.path.exists(log_file):
-            time.sleep(.5)
-            if process and not output_read:
-                process.poll()
-                if process.returncode is not None:
-                    self.print_process_output(self.name, process, verbose)
-                    output_read = True
-                    if process.returncode != 0:
-                        raise RuntimeError()  # Shouldn't reuse RuntimeError but I'm lazy
-
-        with open(log_file) as f:
-            if from_mark:
-                f.seek(from_mark)
-
-            while True:
-                # First, if we have a process to check, then check it.
-                # Skip on Windows - stdout/stderr is cassandra.bat
-                if not common.is_win() and not output_read:
-                    if process:
-                        process.poll()
-                        if process.returncode is not None:
-                            self.print_process_output(self.name, process, verbose)
-                            output_read = True
-                            if process.returncode != 0:
-                                raise RuntimeError()  # Shouldn't reuse RuntimeError but I'm lazy
-
-                line = f.readline()
-                if line:
-                    reads = reads + line
-                    for e in tofind:
-                        m = e.search(line)
-                        if m:
-                            matchings.append((line, m))
-                            tofind.remove(e)
-                            if len(tofind) == 0:
-                                return matchings[0] if isinstance(exprs, string_types) else matchings
-                else:
-                    # yep, it's ugly
-                    time.sleep(1)
-                    elapsed = elapsed + 1
-                    if elapsed > timeout:
-                        raise TimeoutError(time.strftime("%d %b %Y %H:%M:%S", time.gmtime()) + " [" + self.name + "] Missing: " + str([e.pattern for e in tofind]) + ":\n" + reads[:50] + ".....\nSee {} for remainder".format(filename))
+        tailer = self.cluster.log_tailer()
+        subscription = tailer.subscribe(log_file, tofind, from_mark=from_mark)
+        try:
+            # Wake up at least every second to check on the process
+            while not subscription.wait(max(0, min(deadline - time.time(), 1))):
+                output_read, exited = self._check_watched_process(process, verbose, output_read)
+                if time.time() >= deadline:
+                    raise self._log_watch_timeout(subscription, filename)
+                if exited:
+                    return None
+        finally:
+            tailer.remove(subscription)
+
+        matchings = subscription.matchings
+        return matchings[0] if isinstance(exprs, string_types) else matchings
+
+    def watch_log_for_async(self, exprs, from_mark=None, timeout=600, process=None, verbose=False, filename='system.log'):
+        """
+        Coroutine version of watch_log_for, for use from an asyncio event
+        loop: waiting doesn't block a thread, and the wait can be cancelled.
+        Requires Python 3.5 or later.
+        """
+        from ccmlib import aio
+        return aio.watch_log_for(self, exprs, from_mark=from_mark, timeout=timeout, process=process, verbose=verbose, filename=filename)
 
-                if process:
-                    if common.is_win():
-                        if not self.is_running():
-                            return None
-                    else:
-                        process.poll()
-                        if process.returncode == 0:
-                            return None
+    def _check_watched_process(self, process, verbose, output_read):
+        """
+        Checks on the process given to a log watch. Returns whether its output
+        has been printed and whether it exited successfully, and raises
+        RuntimeError if it failed.
+        """
+        if not process:
+            return output_read, False
+        # Skip on Windows - stdout/stderr is cassandra.bat
+        if common.is_win():
+            return output_read, not self.is_running()
+        process.poll()
+        if process.returncode is not None and not output_read:
+            self.print_process_output(self.name, process, verbose)
+            output_read = True
+            if process.returncode != 0:
+                raise RuntimeError()  # Shouldn't reuse RuntimeError but I'm lazy
+        return output_read, process.returncode == 0
+
+    def _log_watch_timeout(self, subscription, filename):
+        reads = "".join(subscription.reads)
+        return TimeoutError(time.strftime("%d %b %Y %H:%M:%S", time.gmtime()) + " [" + self.name + "] Missing: " + str([e.pattern for e in subscription.pending]) + ":\n.....\n" + reads + "See {} for remainder".format(filename))
 
     def watch_log_for_death(self, nodes, from_mark=None, timeout=600, filename='system.log'):
         """
@@ -507,19 +577,23 @@ class Node(object):
 
     def wait_for_binary_interface(self, **kwargs):
         """
-        Waits for the Binary CQL interface to be listening.  If > 1.2 will check
-        log for 'Starting listening for CQL clients' before checking for the
-        interface to be listening.
+        Waits for the Binary CQL interface to serve clients.  If > 1.2 will check
+        log for 'Starting listening for CQL clients' before completing a native
+        protocol handshake with the interface.
 
-        Emits a warning if not listening after 30 seconds.
+        Emits a warning if not serving CQL after 30 seconds.
         """
         if self.cluster.version() >= '1.2':
             self.watch_log_for("Starting listening for CQL clients", **kwargs)
 
-        binary_itf = self.network_interfaces['binary']
-        if not common.check_socket_listening(binary_itf, timeout=30):
-            warnings.warn("Binary interface %s:%s is not listening after 30 seconds, node may have failed to start."
-                          % (binary_itf[0], binary_itf[1]))
+        readiness.wait_for_native_transport([self], timeout=30)
+
+    def wait_for_binary_interface_async(self, **kwargs):
+        """
+        Coroutine version of wait_for_binary_interface.
+        """
+        from ccmlib import aio
+        return aio.wait_for_binary_interface(self, **kwargs)
 
     def wait_for_thrift_interface(self, **kwargs):
         """
@@ -540,7 +614,7 @@ class Node(object):
         cdir = self.get_install_dir()
         launch_bin = common.join_bin(cdir, 'bin', 'cassandra')
         # Copy back the cassandra scripts since profiling may have modified it the previous time
-        shutil.copy(launch_bin, self.get_bin_dir())
+        common.materialize_file(launch_bin, self.get_bin_dir())
         return common.join_bin(self.get_path(), 'bin', 'cassandra')
 
     def add_custom_launch_arguments(self, args):
@@ -571,9 +645,12 @@ class Node(object):
           - replace_token: start the node with the -Dcassandra.replace_token option.
           - replace_address: start the node with the -Dcassandra.replace_address option.
         """
+        timer = Timings('start', self.name)
         if jvm_args is None:
             jvm_args = []
 
+        self.cluster.flush_config()
+
         if set_migration_task and self.cluster.cassandra_version() >= '3.0.1':
             jvm_args += ['-Dcassandra.migration_task_wait_in_seconds={}'.format(len(self.cluster.nodes) * 2)]
 
@@ -590,6 +667,7 @@ class Node(object):
         for itf in list(self.network_interfaces.values()):
             if itf is not None and replace_address is None:
                 common.assert_socket_available(itf)
+        timer.mark('checks')
 
         if wait_other_notice:
             marks = [(node, node.mark_log()) for node in list(self.cluster.nodes.values()) if node.is_live()]
@@ -639,11 +717,13 @@ class Node(object):
             args.append('-Dcassandra.boot_without_jna=true')
         if allow_root:
             args.append('-R')
+        jvm_args = jvm_args + cds.jvm_options(self, env)
         env['JVM_EXTRA_OPTS'] = env.get('JVM_EXTRA_OPTS', "") + " " + " ".join(jvm_args)
 
         # In case we are restarting a node
         # we risk reading the old cassandra.pid file
         self._delete_old_pid()
+        timer.mark('prepare')
 
         process = None
         FNULL = open(os.devnull, 'w')
@@ -664,6 +744,8 @@ class Node(object):
             process = subprocess.Popen(args, env=env, stdout=stdout_sink, stderr=stderr)
 
         process.stderr_file = stderr
+        process.timings = timer
+        self.timings['start'] = timer
 
         # Our modified batch file writes a dirty output with more than just the pid - clean it to get in parity
         # with *nix operation here.
@@ -672,12 +754,15 @@ class Node(object):
             print_(stdout)
             print_(stderr)
 
+        timer.mark('spawn')
         if common.is_win():
             self.__clean_win_pid()
             self._update_pid(process)
             print_("Started: {0} with pid: {1}".format(self.name, self.pid), file=sys.stderr, flush=True)
+            timer.mark('pidfile')
         elif update_pid:
             self._update_pid(process)
+            timer.mark('pidfile')
 
             if not self.is_running():
                 raise NodeError("Error starting node %s" % self.name, process)
@@ -685,22 +770,25 @@ class Node(object):
         # If wait_other_notice is a bool, we don't want to treat it as a
         # timeout. Other intlike types, though, we want to use.
         if common.is_intlike(wait_other_notice) and not isinstance(wait_other_notice, bool):
-            for node, mark in marks:
-                node.watch_log_for_alive(self, from_mark=mark, timeout=wait_other_notice)
+            self._wait_for_gossip(marks, 'UP', timeout=wait_other_notice)
+            timer.mark('gossip')
         elif wait_other_notice:
-            for node, mark in marks:
-                node.watch_log_for_alive(self, from_mark=mark)
+            self._wait_for_gossip(marks, 'UP', timeout=120)
+            timer.mark('gossip')
 
         # If wait_for_binary_proto is a bool, we don't want to treat it as a
         # timeout. Other intlike types, though, we want to use.
         if common.is_intlike(wait_for_binary_proto) and not isinstance(wait_for_binary_proto, bool):
             self.wait_for_binary_interface(from_mark=self.mark, timeout=wait_for_binary_proto)
+            timer.mark('binary_interface')
         elif wait_for_binary_proto:
             self.wait_for_binary_interface(from_mark=self.mark)
+            timer.mark('binary_interface')
 
+        self._record_timings(timer)
         return process
 
-    def stop(self, wait=True, wait_other_notice=False, signal_event=signal.SIGTERM, **kwargs):
+    def stop(self, wait=True, wait_other_notice=False, signal_event=signal.SIGTERM, grace_period=None, **kwargs):
         """
         Stop the node.
           - wait: if True (the default), wait for the Cassandra process to be
@@ -709,11 +797,14 @@ class Node(object):
             cluster have marked this node has dead.
           - signal_event: Signal event to send to Cassandra; default is to
             let Cassandra clean up and shut down properly (SIGTERM [15])
+          - grace_period: when waiting, kill the process (SIGKILL) if it is
+            still running this many seconds after signal_event was sent.
           - Optional:
              + gently: Let Cassandra clean up and shut down properly; unless
                        false perform a 'kill -9' which shuts down faster.
         """
         if self.is_running():
+            timer = Timings('stop', self.name)
             if wait_other_notice:
                 marks = [(node, node.mark_log()) for node in list(self.cluster.nodes.values()) if node.is_live() and node is not self]
 
@@ -743,29 +834,110 @@ class Node(object):
                     signal_event = signal.SIGKILL
 
                 os.kill(self.pid, signal_event)
+            timer.mark('signal')
 
             if wait_other_notice:
-                for node, mark in marks:
-                    node.watch_log_for_death(self, from_mark=mark)
-            else:
-                time.sleep(.1)
+                self._wait_for_gossip(marks, 'DOWN', timeout=600)
+                timer.mark('gossip')
 
             still_running = self.is_running()
             if still_running and wait:
-                wait_time_sec = 1
-                for i in xrange(0, 7):
-                    # we'll double the wait time each try and cassandra should
-                    # not take more than 1 minute to shutdown
-                    time.sleep(wait_time_sec)
-                    if not self.is_running():
-                        return True
-                    wait_time_sec = wait_time_sec * 2
-                raise NodeError("Problem stopping node %s" % self.name)
+                # cassandra should not take more than 2 minutes to shutdown
+                stopped = self.wait_for_exit(STOP_TIMEOUT if grace_period is None else grace_period)
+                timer.mark('exit')
+                if not stopped and grace_period is not None and not common.is_win():
+                    pid = self.pid
+                    common.warning("{} did not stop within {} seconds, killing it".format(self.name, grace_period))
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except (OSError, TypeError):
+                        # Exited in the meantime
+                        pass
+                    stopped = self.wait_for_exit(KILL_TIMEOUT)
+                    timer.mark('kill')
+                self._record_timings(timer)
+                if not stopped:
+                    raise NodeError("Problem stopping node %s" % self.name)
+                self._adopt_cds_archive()
             else:
-                return True
+                self._record_timings(timer)
+                if not still_running:
+                    self._adopt_cds_archive()
+            return True
         else:
             return False
 
+    def _adopt_cds_archive(self):
+        """
+        Moves the class data sharing archive the node dumped on exit, if any,
+        where the next nodes to start will use it (see cds.jvm_options).
+        """
+        if self._cds_dump is not None:
+            try:
+                cds.adopt(*self._cds_dump)
+            except OSError as e:
+                common.warning("Could not save the class data sharing archive of {}: {}".format(self.name, e))
+            self._cds_dump = None
+
+    def _record_timings(self, timer):
+        """
+        Keeps the phase timings of the last start or stop of the node, and
+        saves them in the node directory (see timings.load).
+        """
+        self.timings[timer.operation] = timer
+        try:
+            timings.record(self.get_path(), timer)
+        except (IOError, OSError) as e:
+            common.warning("Could not save the {} timings of {}: {}".format(timer.operation, self.name, e))
+
+    def _wait_for_gossip(self, marks, state, timeout):
+        """
+        Waits for the nodes of a list of (node, mark) pairs to all see this
+        node in the given gossip state (UP or DOWN), reading their logs
+        from their marks on.
+        """
+        missing = gossip.wait_for([node for node, _ in marks], [self], state=state,
+                                  marks=dict((node.name, mark) for node, mark in marks), timeout=timeout)
+        if missing:
+            raise TimeoutError(time.strftime("%d %b %Y %H:%M:%S", time.gmtime()) + " [" + self.name + "] " + gossip.describe(missing, state))
+
+    def wait_for_exit(self, timeout):
+        """
+        Waits up to timeout seconds for the node process to exit, returning
+        as soon as it does. Returns whether it did.
+        """
+        if common.is_win():
+            deadline = time.time() + timeout
+            while self.is_running():
+                if time.time() >= deadline:
+                    return False
+                time.sleep(0.1)
+            return True
+        handle = self._process_handle()
+        if handle is not None:
+            handle.wait_for_exit(timeout)
+        return not self.is_running()
+
+    def wait_for_exit_async(self, timeout):
+        """
+        Coroutine version of wait_for_exit.
+        """
+        from ccmlib import aio
+        return aio.wait_for_exit(self, timeout)
+
+    def _process_handle(self):
+        """
+        Returns the ProcessHandle of the node process, or None if it has no
+        pid.
+        """
+        if self.pid is None:
+            return None
+        if self._process is None or self._process.pid != self.pid:
+            if self._process is not None:
+                self._process.close()
+            self._process = ProcessHandle(self.pid, self.pid_start_time)
+        return self._process
+
     def wait_for_compactions(self, timeout=120):
         """
         Wait for all compactions to finish on this node.
@@ -777,7 +949,16 @@ class Node(object):
             if pattern.search(output):
                 return
             time.sleep(1)
-        raise TimeoutError("{} [{}] Compactions did not finish in {} seconds".format(time.strftime("%d %b %Y %H:%M:%S", time.gmtime()), self.name, timeout))
+        message = "{} [{}] Compactions did not finish in {} seconds".format(time.strftime("%d %b %Y %H:%M:%S", time.gmtime()), self.name, timeout)
+        try:
+            backlog = compaction_log.describe_backlog(self.compaction_stats())
+        except Exception as e:
+            # Only a diagnostic: the timeout is what callers expect
+            common.debug("Could not read the compaction log of {}: {}".format(self.name, e))
+            backlog = None
+        if backlog:
+            message += " ({})".format(backlog)
+        raise TimeoutError(message)
 
     def nodetool_process(self, cmd):
         env = self.get_env()
@@ -919,11 +1100,8 @@ class Node(object):
             self.__classes_log_level[class_name] = new_level
         else:
             self.__global_log_level = new_level
-        # loggers changed > 2.1
-        if self.get_base_cassandra_version() < 2.1:
-            self._update_log4j()
-        else:
-            self.__update_logback()
+        if not self._defer_config(config_session.LOGGING):
+            self.__update_logging()
         return self
 
     #
@@ -963,6 +1141,14 @@ class Node(object):
                 common.rmdirs(full_dir)
                 os.mkdir(full_dir)
 
+        if clear_all:
+            # The indexes of the logs go with them
+            index_dir = os.path.join(self.get_path(), log_index.INDEX_DIR)
+            if os.path.exists(index_dir):
+                common.rmdirs(index_dir)
+            self._log_indexes.clear()
+            self._log_stores.clear()
+
         # Needed for any subdirs stored underneath a data directory.
         # Common for hints post CASSANDRA-6230
         for dir in self._get_directories():
@@ -1335,13 +1521,11 @@ class Node(object):
 
     def import_config_files(self):
         self._update_config()
+        if self._defer_config(config_session.COPY, config_session.YAML, config_session.LOGGING, config_session.ENV):
+            return
         self.copy_config_files()
         self.__update_yaml()
-        # loggers changed > 2.1
-        if self.get_base_cassandra_version() < 2.1:
-            self._update_log4j()
-        else:
-            self.__update_logback()
+        self.__update_logging()
         self.__update_envfile()
 
     def import_dse_config_files(self):
@@ -1351,15 +1535,16 @@ class Node(object):
         conf_dir = os.path.join(self.get_install_dir(), 'conf')
         for name in os.listdir(conf_dir):
             filename = os.path.join(conf_dir, name)
-            if os.path.isfile(filename):
-                shutil.copy(filename, self.get_conf_dir())
+            # cassandra.yaml is rendered from the install's one by __update_yaml
+            if os.path.isfile(filename) and name != common.CASSANDRA_CONF:
+                common.materialize_file(filename, self.get_conf_dir())
 
     def import_bin_files(self):
         bin_dir = os.path.join(self.get_install_dir(), 'bin')
         for name in os.listdir(bin_dir):
             filename = os.path.join(bin_dir, name)
             if os.path.isfile(filename):
-                shutil.copy(filename, self.get_bin_dir())
+                common.materialize_file(filename, self.get_bin_dir())
                 common.add_exec_permission(bin_dir, name)
 
     def __clean_bat(self):
@@ -1371,53 +1556,85 @@ class Node(object):
         bin_dir = os.path.join(self.get_path(), 'bin')
         jmx_port_pattern = "-Dcom.sun.management.jmxremote.port="
         bat_file = os.path.join(bin_dir, "cassandra.bat")
-        common.replace_in_file(bat_file, jmx_port_pattern, " " + jmx_port_pattern + self.jmx_port + "^")
+        bat_edits = common.EditPlan(bat_file)
+        bat_edits.replace(jmx_port_pattern, " " + jmx_port_pattern + self.jmx_port + "^")
 
         # Split binaries from conf
         home_pattern = "if NOT DEFINED CASSANDRA_HOME set CASSANDRA_HOME=%CD%"
-        common.replace_in_file(bat_file, home_pattern, "set CASSANDRA_HOME=" + self.get_install_dir())
+        bat_edits.replace(home_pattern, "set CASSANDRA_HOME=" + self.get_install_dir())
 
         classpath_pattern = "set CLASSPATH=\\\"%CASSANDRA_HOME%\\\\conf\\\""
-        common.replace_in_file(bat_file, classpath_pattern, "set CCM_DIR=\"" + self.get_path() + "\"\nset CLASSPATH=\"%CCM_DIR%\\conf\"")
+        bat_edits.replace(classpath_pattern, "set CCM_DIR=\"" + self.get_path() + "\"\nset CLASSPATH=\"%CCM_DIR%\\conf\"")
 
         # escape the double quotes in name of the lib files in the classpath
         jar_file_pattern = "do call :append \"%%i\""
         for_statement = "for %%i in (\"%CASSANDRA_HOME%\lib\*.jar\")"
-        common.replace_in_file(bat_file, jar_file_pattern, for_statement + " do call :append \\\"%%i\\\"")
+        bat_edits.replace(jar_file_pattern, for_statement + " do call :append \\\"%%i\\\"")
 
         # escape double quotes in java agent path
         class_dir_pattern = "-javaagent:"
-        common.replace_in_file(bat_file, class_dir_pattern, " -javaagent:\\\"%CASSANDRA_HOME%\\lib\\jamm-0.2.5.jar\\\"^")
+        bat_edits.replace(class_dir_pattern, " -javaagent:\\\"%CASSANDRA_HOME%\\lib\\jamm-0.2.5.jar\\\"^")
 
         # escape the double quotes in name of the class directories
         class_dir_pattern = "set CASSANDRA_CLASSPATH="
         main_classes = "\\\"%CASSANDRA_HOME%\\build\\classes\\main\\\";"
         thrift_classes = "\\\"%CASSANDRA_HOME%\\build\\classes\\thrift\\\""
-        common.replace_in_file(bat_file, class_dir_pattern, "set CASSANDRA_CLASSPATH=%CLASSPATH%;" +
-                               main_classes + thrift_classes)
+        bat_edits.replace(class_dir_pattern, "set CASSANDRA_CLASSPATH=%CLASSPATH%;" +
+                          main_classes + thrift_classes)
 
         # background the server process and grab the pid
         run_text = "\\\"%JAVA_HOME%\\bin\\java\\\" %JAVA_OPTS% %CASSANDRA_PARAMS% -cp %CASSANDRA_CLASSPATH% \\\"%CASSANDRA_MAIN%\\\""
         run_pattern = ".*-cp.*"
-        common.replace_in_file(bat_file, run_pattern, "wmic process call create \"" + run_text + "\" > \"" +
-                               self.get_path() + "/dirty_pid.tmp\"\n")
+        bat_edits.replace(run_pattern, "wmic process call create \"" + run_text + "\" > \"" +
+                          self.get_path() + "/dirty_pid.tmp\"\n")
 
         # On Windows, remove the VerifyPorts check from cassandra.ps1
         if self.cluster.version() >= '2.1':
             common.replace_in_file(os.path.join(self.get_path(), 'bin', 'cassandra.ps1'), '        VerifyPortsAreAvailable', '')
 
         # Specifically call the .ps1 file in our node's folder
-        common.replace_in_file(bat_file, 'powershell /file .*', 'powershell /file "' + os.path.join(self.get_path(), 'bin', 'cassandra.ps1" %*'))
+        bat_edits.replace('powershell /file .*', 'powershell /file "' + os.path.join(self.get_path(), 'bin', 'cassandra.ps1" %*'))
+        bat_edits.apply()
 
     def _save(self):
-        self.__update_yaml()
+        if not self._defer_config(config_session.YAML, config_session.LOGGING, config_session.ENV):
+            self.__update_yaml()
+            self.__update_logging()
+            self.__update_envfile()
+        self._update_config()
+
+    def _defer_config(self, *parts):
+        """
+        Returns whether writing the given parts of the configuration (see
+        config_session) is deferred to the end of a config_session.
+        """
+        session = self.cluster._config_session
+        if session is None:
+            return False
+        session.defer(self, *parts)
+        return True
+
+    def _write_config(self, parts):
+        """
+        Writes the given parts of the configuration, for ConfigSession.flush.
+        """
+        if config_session.COPY in parts:
+            self.copy_config_files()
+        if config_session.YAML in parts:
+            self.__update_yaml()
+        if config_session.LOGGING in parts:
+            self.__update_logging()
+        if config_session.ENV in parts:
+            self.__update_envfile()
+        if config_session.CONF in parts:
+            self._update_config()
+
+    def __update_logging(self):
         # loggers changed > 2.1
         if self.get_base_cassandra_version() < 2.1:
             self._update_log4j()
         else:
             self.__update_logback()
-        self.__update_envfile()
-        self._update_config()
 
     def _update_config(self):
         dir_name = self.get_path()
@@ -1425,6 +1642,8 @@ class Node(object):
             os.mkdir(dir_name)
             for dir in self._get_directories():
                 os.mkdir(dir)
+        if self._defer_config(config_session.CONF):
+            return
 
         filename = os.path.join(dir_name, 'node.conf')
         values = {
@@ -1439,6 +1658,8 @@ class Node(object):
         }
         if self.pid:
             values['pid'] = self.pid
+            if self.pid_start_time is not None:
+                values['pid_start_time'] = self.pid_start_time
         if self.initial_token:
             values['initial_token'] = self.initial_token
         if self.__install_dir is not None:
@@ -1451,16 +1672,18 @@ class Node(object):
             values['data_center'] = self.data_center
         if self.workloads is not None:
             values['workloads'] = self.workloads
-        with open(filename, 'w') as f:
-            yaml.safe_dump(values, f)
+        common.write_if_changed(filename, common.dump_yaml(values))
+
+    def _cassandra_yaml_template(self):
+        """
+        Returns the path to the cassandra.yaml of the install directory, from
+        which the node's is rendered.
+        """
+        return os.path.join(self.get_install_dir(), common.CASSANDRA_CONF_DIR, common.CASSANDRA_CONF)
 
     def __update_yaml(self):
         conf_file = os.path.join(self.get_conf_dir(), common.CASSANDRA_CONF)
-        with open(conf_file, 'r') as f:
-            data = yaml.load(f)
-
-        with open(conf_file, 'r') as f:
-            yaml_text = f.read()
+        data, yaml_text = common.load_yaml_template(self._cassandra_yaml_template())
 
         data['cluster_name'] = self.cluster.name
         data['auto_bootstrap'] = self.auto_bootstrap
@@ -1492,39 +1715,47 @@ class Node(object):
         if self.cluster.partitioner:
             data['partitioner'] = self.cluster.partitioner
 
-        # Get a map of combined cluster and node configuration with the node
-        # configuration taking precedence.
+        # Get a map of combined resource plan, cluster and node configuration
+        # with the node configuration taking precedence.
+        plan = self.cluster.resource_plan
+        full_options = common.merge_configuration(
+            plan['config_options'] if plan is not None else {},
+            self.cluster._config_options, delete_empty=False)
         full_options = common.merge_configuration(
-            self.cluster._config_options,
+            full_options,
             self.__config_options, delete_empty=False)
 
         # Merge options with original yaml data.
         data = common.merge_configuration(data, full_options)
 
-        with open(conf_file, 'w') as f:
-            yaml.safe_dump(data, f, default_flow_style=False)
+        common.write_if_changed(conf_file, common.dump_yaml(data, default_flow_style=False))
 
     def _update_log4j(self):
-        append_pattern = 'log4j.appender.R.File='
         conf_file = os.path.join(self.get_conf_dir(), common.LOG4J_CONF)
+        edits = common.EditPlan(conf_file)
+        self._plan_log4j_edits(edits)
+        edits.apply()
+
+    def _plan_log4j_edits(self, edits):
+        append_pattern = 'log4j.appender.R.File='
         log_file = os.path.join(self.get_path(), 'logs', 'system.log')
         # log4j isn't partial to Windows \.  I can't imagine why not.
         if common.is_win():
             log_file = re.sub("\\\\", "/", log_file)
-        common.replace_in_file(conf_file, append_pattern, append_pattern + log_file)
+        edits.replace(append_pattern, append_pattern + log_file)
 
         # Setting the right log level
 
         # Replace the global log level
         if self.__global_log_level is not None:
             append_pattern = 'log4j.rootLogger='
-            common.replace_in_file(conf_file, append_pattern, append_pattern + self.__global_log_level + ',stdout,R')
+            edits.replace(append_pattern, append_pattern + self.__global_log_level + ',stdout,R')
 
         # Class specific log levels
         for class_name in self.__classes_log_level:
             logger_pattern = 'log4j.logger'
             full_logger_pattern = logger_pattern + '.' + class_name + '='
-            common.replace_or_add_into_file_tail(conf_file, full_logger_pattern, full_logger_pattern + self.__classes_log_level[class_name])
+            edits.replaces_or_add([(full_logger_pattern, full_logger_pattern + self.__classes_log_level[class_name])])
 
     def __update_logback(self):
         conf_file = os.path.join(self.get_conf_dir(), common.LOGBACK_CONF)
@@ -1535,6 +1766,7 @@ class Node(object):
         self.__update_logback_loglevel(tools_conf_file)
 
     def __update_logback_loglevel(self, conf_file):
+        edits = common.EditPlan(conf_file)
         # Setting the right log level - 2.2.2 introduced new debug log
         if self.get_cassandra_version() >= '2.2.2' and self.__global_log_level:
             if self.__global_log_level in ['DEBUG', 'TRACE']:
@@ -1547,26 +1779,28 @@ class Node(object):
                 root_log_level = 'INFO'
                 cassandra_log_level = 'DEBUG'
                 system_log_filter_pattern = '<level>.*</level>'
-                common.replace_in_file(conf_file, system_log_filter_pattern, '      <level>' + self.__global_log_level + '</level>')
+                edits.replace(system_log_filter_pattern, '      <level>' + self.__global_log_level + '</level>')
             elif self.__global_log_level == 'OFF':
                 root_log_level = self.__global_log_level
                 cassandra_log_level = self.__global_log_level
 
             cassandra_append_pattern = '<logger name="org.apache.cassandra" level=".*"/>'
-            common.replace_in_file(conf_file, cassandra_append_pattern, '  <logger name="org.apache.cassandra" level="' + cassandra_log_level + '"/>')
+            edits.replace(cassandra_append_pattern, '  <logger name="org.apache.cassandra" level="' + cassandra_log_level + '"/>')
         else:
             root_log_level = self.__global_log_level
 
         # Replace the global log level and org.apache.cassandra log level
         if self.__global_log_level is not None:
             root_append_pattern = '<root level=".*">'
-            common.replace_in_file(conf_file, root_append_pattern, '<root level="' + root_log_level + '">')
+            edits.replace(root_append_pattern, '<root level="' + root_log_level + '">')
 
         # Class specific log levels
         for class_name in self.__classes_log_level:
             logger_pattern = '\t<logger name="'
             full_logger_pattern = logger_pattern + class_name + '" level=".*"/>'
-            common.replace_or_add_into_file_tail(conf_file, full_logger_pattern, logger_pattern + class_name + '" level="' + self.__classes_log_level[class_name] + '"/>')
+            edits.replaces_or_add([(full_logger_pattern, logger_pattern + class_name + '" level="' + self.__classes_log_level[class_name] + '"/>')])
+
+        edits.apply()
 
     def __update_envfile(self):
         agentlib_setting = '-agentlib:jdwp=transport=dt_socket,server=y,suspend=n,address={}'.format(str(self.remote_debug_port))
@@ -1587,7 +1821,10 @@ class Node(object):
             if self.get_cassandra_version() < '3.2':
                 remote_debug_options = 'JVM_OPTS="$JVM_OPTS {}"'.format(agentlib_setting)
 
-        common.replace_in_file(conf_file, jmx_port_pattern, jmx_port_setting)
+        # The edits of each file are collected, then made in a single pass
+        conf_edits = common.EditPlan(conf_file)
+        jvm_edits = common.EditPlan(jvm_file)
+        conf_edits.replace(jmx_port_pattern, jmx_port_setting)
 
         if common.is_modern_windows_install(common.get_version_from_build(node_path=self.get_path())):
             dst = os.path.join(self.get_conf_dir(), common.CASSANDRA_WIN_ENV)
@@ -1596,32 +1833,33 @@ class Node(object):
                 ('env:CASSANDRA_CONF =', '    $env:CCM_DIR="' + self.get_path() + '\\conf"\n    $env:CASSANDRA_CONF="$env:CCM_DIR"'),
                 ('cp = ".*?env:CASSANDRA_HOME.conf', '    $cp = """$env:CASSANDRA_CONF"""')
             ]
-            common.replaces_in_file(dst, replacements)
+            if dst == conf_file:
+                conf_edits.replaces(replacements)
+            else:
+                common.replaces_in_file(dst, replacements)
 
         if self.remote_debug_port != '0':
             remote_debug_port_pattern = '((-Xrunjdwp:)|(-agentlib:jdwp=))transport=dt_socket,server=y,suspend=n,address='
             if self.get_cassandra_version() < '3.2':
-                common.replace_in_file(conf_file, remote_debug_port_pattern, remote_debug_options)
+                conf_edits.replace(remote_debug_port_pattern, remote_debug_options)
             else:
-                common.replace_in_file(jvm_file, remote_debug_port_pattern, remote_debug_options)
+                jvm_edits.replace(remote_debug_port_pattern, remote_debug_options)
 
+        byteman_agent = None
         if self.byteman_port != '0':
             byteman_jar = glob.glob(os.path.join(self.get_install_dir(), 'build', 'lib', 'jars', 'byteman-[0-9]*.jar'))[0]
             agent_string = "-javaagent:{}=listener:true,boot:{},port:{}".format(byteman_jar, byteman_jar, str(self.byteman_port))
             if common.is_modern_windows_install(self.get_base_cassandra_version()):
-                with open(conf_file, "r+") as conf_rewrite:
-                    conf_lines = conf_rewrite.readlines()
-                    # Remove trailing brace, will be replaced
-                    conf_lines = conf_lines[:-1]
-                    conf_lines.append("    $env:JVM_OPTS=\"$env:JVM_OPTS {}\"\n}}\n".format(agent_string))
-                    conf_rewrite.seek(0)
-                    conf_rewrite.truncate()
-                    conf_rewrite.writelines(conf_lines)
+                # Goes inside the closing brace, once the other edits are made
+                byteman_agent = agent_string
             else:
-                common.replaces_or_add_into_file_tail(conf_file, [('.*byteman.*', "JVM_OPTS=\"$JVM_OPTS {}\"".format(agent_string))], add_config_close=False)
+                conf_edits.replaces_or_add([('.*byteman.*', "JVM_OPTS=\"$JVM_OPTS {}\"".format(agent_string))], add_config_close=False)
+
+        if not common.is_win():
+            conf_edits.replaces_or_add([('.*' + cds.JARS_FIRST_ENV + '.*', cds.JARS_FIRST)], add_config_close=False)
 
         if self.get_cassandra_version() < '2.0.1':
-            common.replace_in_file(conf_file, "-Xss", '    JVM_OPTS="$JVM_OPTS -Xss228k"')
+            conf_edits.replace("-Xss", '    JVM_OPTS="$JVM_OPTS -Xss228k"')
 
         # gc.log was turned on by default in 2.2.5/3.0.3/3.3
         if self.get_cassandra_version() >= '2.2.5':
@@ -1632,24 +1870,32 @@ class Node(object):
             else:
                 gc_log_setting = 'JVM_OPTS="$JVM_OPTS -Xloggc:{}"'.format(gc_log_path)
 
-            common.replace_in_file(conf_file, gc_log_pattern, gc_log_setting)
+            conf_edits.replace(gc_log_pattern, gc_log_setting)
 
         for itf in list(self.network_interfaces.values()):
             if itf is not None and common.interface_is_ipv6(itf):
                 if self.get_cassandra_version() < '3.2':
                     if common.is_win():
-                        common.replace_in_file(conf_file,
-                                               '-Djava.net.preferIPv4Stack=true',
-                                               '\t$env:JVM_OPTS="$env:JVM_OPTS -Djava.net.preferIPv4Stack=false -Djava.net.preferIPv6Addresses=true"')
+                        conf_edits.replace('-Djava.net.preferIPv4Stack=true',
+                                           '\t$env:JVM_OPTS="$env:JVM_OPTS -Djava.net.preferIPv4Stack=false -Djava.net.preferIPv6Addresses=true"')
                     else:
-                        common.replace_in_file(conf_file,
-                                               '-Djava.net.preferIPv4Stack=true',
-                                               'JVM_OPTS="$JVM_OPTS -Djava.net.preferIPv4Stack=false -Djava.net.preferIPv6Addresses=true"')
+                        conf_edits.replace('-Djava.net.preferIPv4Stack=true',
+                                           'JVM_OPTS="$JVM_OPTS -Djava.net.preferIPv4Stack=false -Djava.net.preferIPv6Addresses=true"')
                     break
                 else:
-                    common.replace_in_file(jvm_file, '-Djava.net.preferIPv4Stack=true', '')
+                    jvm_edits.replace('-Djava.net.preferIPv4Stack=true', '')
                     break
 
+        if byteman_agent is not None:
+            conf_lines = conf_edits.render().splitlines(True)
+            # Remove trailing brace, will be replaced
+            conf_lines = conf_lines[:-1]
+            conf_lines.append("    $env:JVM_OPTS=\"$env:JVM_OPTS {}\"\n}}\n".format(byteman_agent))
+            common.write_if_changed(conf_file, ''.join(conf_lines))
+        else:
+            conf_edits.apply()
+        jvm_edits.apply()
+
     def __update_status(self):
         if self.pid is None:
             if self.status == Status.UP or self.status == Status.DECOMMISSIONED:
@@ -1662,20 +1908,10 @@ class Node(object):
         if common.is_win():
             self.__update_status_win()
         else:
-            try:
-                os.kill(self.pid, 0)
-            except OSError as err:
-                if err.errno == errno.ESRCH:
-                    # not running
-                    if self.status == Status.UP or self.status == Status.DECOMMISSIONED:
-                        self.status = Status.DOWN
-                elif err.errno == errno.EPERM:
-                    # no permission to signal this process
-                    if self.status == Status.UP or self.status == Status.DECOMMISSIONED:
-                        self.status = Status.DOWN
-                else:
-                    # some other error
-                    raise err
+            # Not running, reused by another process, or not ours to signal
+            if not self._process_handle().is_running():
+                if self.status == Status.UP or self.status == Status.DECOMMISSIONED:
+                    self.status = Status.DOWN
             else:
                 if self.status == Status.DOWN or self.status == Status.UNINITIALIZED:
                     self.status = Status.UP
@@ -1683,6 +1919,7 @@ class Node(object):
         if not old_status == self.status:
             if old_status == Status.UP and self.status == Status.DOWN:
                 self.pid = None
+                self.pid_start_time = None
             self._update_config()
 
     def __update_status_win(self):
@@ -1780,29 +2017,37 @@ class Node(object):
                 raise Exception('Error while parsing <node>/dirty_pid.tmp in path: ' + self.get_path())
 
     def _delete_old_pid(self):
-        pidfile = os.path.join(self.get_path(), 'cassandra.pid')
+        pidfile = self._pidfile()
         if os.path.isfile(pidfile):
             os.remove(pidfile)
 
-    def _update_pid(self, process):
-        pidfile = os.path.join(self.get_path(), 'cassandra.pid')
-
-        start = time.time()
-        while not (os.path.isfile(pidfile) and os.stat(pidfile).st_size > 0):
-            if (time.time() - start > 30.0):
-                common.error("Timed out waiting for pidfile to be filled (current time is {})".format(datetime.now()))
-                break
-            else:
-                time.sleep(0.1)
+    def _pidfile(self):
+        return os.path.join(self.get_path(), 'cassandra.pid')
 
+    def _read_pid(self, pidfile):
+        """
+        Returns the pid in the pidfile, or None while it is missing or empty.
+        """
         try:
             with open(pidfile, 'rb') as f:
                 if common.is_modern_windows_install(self.get_base_cassandra_version()):
-                    self.pid = int(f.readline().strip().decode('utf-16').strip())
-                else:
-                    self.pid = int(f.readline().strip())
-        except IOError as e:
-            raise NodeError('Problem starting node %s due to %s' % (self.name, e), process)
+                    return int(f.readline().strip().decode('utf-16').strip())
+                return int(f.readline().strip())
+        except (IOError, ValueError):
+            return None
+
+    def _update_pid(self, process, timeout=30):
+        """
+        Sets the pid of the node from its pidfile, waiting up to timeout
+        seconds for it to be written.
+        """
+        pidfile = self._pidfile()
+        pid = wait_for_pidfiles({pidfile: self._read_pid}, timeout=timeout)[pidfile]
+        if pid is None:
+            common.error("Timed out waiting for pidfile to be filled (current time is {})".format(datetime.now()))
+            raise NodeError('Problem starting node %s: no pid in %s' % (self.name, pidfile), process)
+        self.pid = pid
+        self.pid_start_time = start_time(self.pid)
         self.__update_status()
 
     def __gather_sstables(self, datafiles=None, keyspace=None, columnfamilies=None):
@@ -1848,19 +2093,20 @@ class Node(object):
         if self.get_base_cassandra_version() >= 2.1:
             sh_file = os.path.join(common.CASSANDRA_CONF_DIR, common.CASSANDRA_WIN_ENV)
             dst = os.path.join(self.get_path(), sh_file)
-            common.replace_in_file(dst, "^\s+\$JMX_PORT=", "    $JMX_PORT=\"" + self.jmx_port + "\"")
+            edits = common.EditPlan(dst)
+            edits.replace("^\s+\$JMX_PORT=", "    $JMX_PORT=\"" + self.jmx_port + "\"")
 
             # properly use single and double quotes to count for single quotes in the CASSANDRA_CONF path
-            common.replace_in_file(
-                dst,
+            edits.replace(
                 'CASSANDRA_PARAMS=', '    $env:CASSANDRA_PARAMS=\'-Dcassandra' +                        # -Dcassandra
                 ' -Dlogback.configurationFile=/"\' + "$env:CASSANDRA_CONF" + \'/logback.xml"\'' +       # -Dlogback.configurationFile=/"$env:CASSANDRA_CONF/logback.xml"
                 ' + \' -Dcassandra.config=file:"\' + "///$env:CASSANDRA_CONF" + \'/cassandra.yaml"\'')  # -Dcassandra.config=file:"///$env:CASSANDRA_CONF/cassandra.yaml"
+            edits.apply()
 
     def get_conf_option(self, option):
         conf_file = os.path.join(self.get_conf_dir(), common.CASSANDRA_CONF)
         with open(conf_file, 'r') as f:
-            data = yaml.load(f)
+            data = common.load_yaml(f)
 
         if option in data:
             return data[option]
@@ -1977,27 +2223,15 @@ def _get_load_from_info_output(info):
 
 
 def _grep_log_for_errors(log):
-    def log_line_category(line):
-        match = re.search(r'(INFO|DEBUG|WARN|ERROR)', line)
-        return match.group(0) if match else None
-
-    matches = []
-
-    loglines = log.splitlines()
-
-    for line_num, line in enumerate(loglines):
-        if log_line_category(line) == 'ERROR':
-            matches.append([line])
-
-            for next_line_num in range(line_num + 1, len(loglines)):
-                next_line = loglines[next_line_num]
-                # if a log line can't be identified, assume continuation of an ERROR message
-                if log_line_category(next_line) is None:
-                    matches[-1].append(next_line)
-                else:
-                    break
-
-    return matches
+    """
+    Returns the errors in a chunk of log text, as lists of lines.
+    """
+    def lines():
+        start = 0
+        for raw, line in zip(log.splitlines(True), log.splitlines()):
+            yield start, start + len(raw), line
+            start += len(raw)
+    return [record.lines for record in extract_errors(lines())]
 
 
 def handle_external_tool_process(process, cmd_args):
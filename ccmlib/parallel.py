@@ -0,0 +1,103 @@
+#
+# Running node operations concurrently
+#
+
+from __future__ import absolute_import
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from six import reraise
+
+from ccmlib.node import NodeError, TimeoutError
+
+
+class ParallelError(NodeError):
+
+    """
+    Raised when an operation failed on several nodes. errors maps the name
+    of each node that failed to its exception, and results holds what the
+    operation returned on the others.
+    """
+
+    def __init__(self, errors, results=None):
+        NodeError.__init__(self, "\n".join("[{}] {}: {}".format(name, type(e).__name__, e) for name, e in errors.items()))
+        self.errors = errors
+        self.results = results if results is not None else OrderedDict()
+
+
+class ParallelTimeoutError(ParallelError, TimeoutError):
+
+    """
+    A ParallelError where every failure is a TimeoutError.
+    """
+
+
+class Deadline(object):
+
+    """
+    A point in time that a series of waits must complete by.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.end = time.time() + timeout
+
+    def remaining(self):
+        return max(0, self.end - time.time())
+
+    def expired(self):
+        return time.time() >= self.end
+
+
+def run(tasks, concurrency=None):
+    """
+    Calls the functions of a list of (node, function) pairs, each in its own
+    thread, with at most concurrency of them running at a time (all at once
+    if None), in the order they are given. Returns what they returned by
+    node name once all have finished. If one failed, raises its exception;
+    if several did, a ParallelError (a ParallelTimeoutError if they all
+    timed out).
+    """
+    results = OrderedDict()
+    errors = OrderedDict()
+    lock = threading.Lock()
+    slots = threading.Semaphore(concurrency) if concurrency else None
+
+    def call(node, fn):
+        try:
+            result = fn()
+            with lock:
+                results[node.name] = result
+        except Exception:
+            with lock:
+                errors[node.name] = sys.exc_info()
+        finally:
+            if slots is not None:
+                slots.release()
+
+    threads = []
+    for node, fn in tasks:
+        if slots is not None:
+            # Start the tasks in order as slots free up
+            slots.acquire()
+        t = threading.Thread(target=call, args=(node, fn), name="ccm-{}".format(node.name))
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+    # Report in the order the tasks were given
+    order = [node.name for node, _ in tasks]
+    results = OrderedDict((name, results[name]) for name in order if name in results)
+    if len(errors) == 1:
+        reraise(*list(errors.values())[0])
+    if errors:
+        errors = OrderedDict((name, errors[name][1]) for name in order if name in errors)
+        if all(isinstance(e, TimeoutError) for e in errors.values()):
+            raise ParallelTimeoutError(errors, results)
+        raise ParallelError(errors, results)
+    return results
@@ -0,0 +1,186 @@
+#
+# Handles on (non child) processes, with exit notification
+#
+
+from __future__ import absolute_import
+
+import errno
+import os
+import select
+import time
+
+from ccmlib.log_reader import change_waiter
+
+
+def start_time(pid):
+    """
+    Returns the start time of a process, in an unspecified unit, or None if
+    it isn't running or can't be found out. Together with the pid, it
+    identifies a process even if its pid gets reused.
+    """
+    try:
+        with open('/proc/{}/stat'.format(pid), 'rb') as f:
+            stat = f.read()
+        # The command name is in parentheses and may contain anything
+        fields = stat[stat.rindex(b')') + 2:].split()
+        return int(fields[19])
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).create_time()
+    except ImportError:
+        return None
+    except Exception:
+        # psutil.NoSuchProcess, psutil.AccessDenied
+        return None
+
+
+def _is_zombie(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid), 'rb') as f:
+            stat = f.read()
+        return stat[stat.rindex(b')') + 2:].split()[0] == b'Z'
+    except (IOError, OSError, ValueError, IndexError):
+        return False
+
+
+class ProcessHandle(object):
+
+    """
+    A handle on a running process, given its pid. The process start time is
+    recorded along with the pid, so that a new process that reuses the pid
+    isn't mistaken for it. Exit is notified through a pidfd on Linux 5.3+
+    (Python 3.9+), which doesn't have to be the parent of the process, and
+    otherwise waited for with psutil if installed, or by polling.
+    """
+
+    def __init__(self, pid, started=None):
+        self.pid = pid
+        self.started = started if started is not None else start_time(pid)
+        self._exited = False
+        self._fd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                self._fd = os.pidfd_open(pid)
+            except OSError as e:
+                if e.errno == errno.ESRCH:
+                    self._exited = True
+        if self._fd is not None and not self.__same_process():
+            # The process we were after is gone: the pidfd is for another one
+            self.close()
+            self._exited = True
+
+    def __same_process(self):
+        if self.started is None:
+            return True
+        current = start_time(self.pid)
+        return current is None or current == self.started
+
+    def fileno(self):
+        """
+        Returns a file descriptor that becomes readable when the process
+        exits, or None if that isn't supported here.
+        """
+        return self._fd
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __reap(self):
+        # Don't leave a zombie behind if it was one of our children
+        try:
+            os.waitpid(self.pid, os.WNOHANG)
+        except OSError:
+            pass
+
+    def __exited(self):
+        self._exited = True
+        self.close()
+        self.__reap()
+        return False
+
+    def is_running(self):
+        if self._exited:
+            return False
+        if self._fd is not None:
+            if self.__poll(0):
+                return self.__exited()
+            return True
+        try:
+            os.kill(self.pid, 0)
+        except OSError as e:
+            if e.errno in (errno.ESRCH, errno.EPERM):
+                # Gone, or not a process we could stop anyway
+                return self.__exited()
+            raise
+        if _is_zombie(self.pid) or not self.__same_process():
+            return self.__exited()
+        return True
+
+    def __poll(self, timeout):
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        return bool(poller.poll(None if timeout is None else int(timeout * 1000)))
+
+    def wait_for_exit(self, timeout=None):
+        """
+        Waits up to timeout seconds (forever if None) for the process to
+        exit, returning as soon as it does. Returns whether it exited.
+        """
+        if self._exited:
+            return True
+        if self._fd is not None:
+            if self.__poll(timeout):
+                self.__exited()
+                return True
+            return False
+        try:
+            import psutil
+        except ImportError:
+            psutil = None
+        if psutil is not None and self.is_running():
+            try:
+                psutil.Process(self.pid).wait(timeout)
+                return not self.is_running()
+            except psutil.TimeoutExpired:
+                return False
+            except psutil.NoSuchProcess:
+                return not self.is_running()
+            except psutil.Error:
+                # Poll instead
+                pass
+        deadline = None if timeout is None else time.time() + timeout
+        interval = 0.01
+        while self.is_running():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(interval if deadline is None else max(0, min(interval, deadline - time.time())))
+            interval = min(interval * 2, 0.1)
+        return True
+
+
+def wait_for_pidfiles(readers, timeout=30):
+    """
+    Waits for pidfiles to be written, given a function for each pidfile
+    path that returns the pid it holds, or None while it's missing or empty.
+    Wakes up on changes to the pidfile directories (through inotify where
+    available) rather than polling. Returns the pid of each path, None for
+    those that weren't written within timeout seconds.
+    """
+    pids = dict((path, None) for path in readers)
+    deadline = time.time() + timeout
+    waiter = change_waiter(list(readers))
+    try:
+        while True:
+            for path in pids:
+                if pids[path] is None:
+                    pids[path] = readers[path](path)
+            remaining = deadline - time.time()
+            if all(pid is not None for pid in pids.values()) or remaining <= 0:
+                return pids
+            waiter.wait(remaining)
+    finally:
+        waiter.close()
@@ -0,0 +1,285 @@
+#
+# Readiness probes for the native transport (CQL) and storage ports
+#
+# The native transport probe completes an OPTIONS/SUPPORTED and
+# STARTUP/READY exchange of the CQL binary protocol, so a node is only
+# reported ready once it actually serves CQL clients. Nodes that require
+# client encryption only get a connect check. Many endpoints are probed at
+# once from a single thread, over non-blocking sockets.
+#
+
+from __future__ import absolute_import
+
+import errno
+import os
+import select
+import socket
+import struct
+import time
+import warnings
+from collections import OrderedDict, namedtuple
+
+# What to probe: name is only used to report results, address is a (host,
+# port) pair, kind is 'cql' or 'tcp' (just connect), and version is the
+# native protocol version to start with
+Target = namedtuple('Target', 'name address kind version')
+
+# Opcodes
+_ERROR, _STARTUP, _READY, _AUTHENTICATE, _OPTIONS, _SUPPORTED = 0x00, 0x01, 0x02, 0x03, 0x05, 0x06
+_PROTOCOL_ERROR = 0x000A
+
+# Seconds before giving up on a connection attempt, and between attempts
+ATTEMPT_TIMEOUT = 5
+MIN_BACKOFF = 0.05
+MAX_BACKOFF = 1
+
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, getattr(errno, 'WSAEWOULDBLOCK', 10035))
+
+
+def native_protocol_version(cassandra_version):
+    """
+    Returns the highest native protocol version that a Cassandra version
+    supports without beta flags.
+    """
+    if cassandra_version >= '2.2':
+        return 4
+    if cassandra_version >= '2.1':
+        return 3
+    if cassandra_version >= '2.0':
+        return 2
+    return 1
+
+
+def _frame(version, opcode, body=b''):
+    if version >= 3:
+        return struct.pack('>BBhBi', version, 0, 0, opcode, len(body)) + body
+    return struct.pack('>BBbBi', version, 0, 0, opcode, len(body)) + body
+
+
+def _string(s):
+    s = s.encode('utf-8')
+    return struct.pack('>H', len(s)) + s
+
+
+def _read_string(body, pos):
+    length = struct.unpack_from('>H', body, pos)[0]
+    pos += 2
+    return body[pos:pos + length].decode('utf-8'), pos + length
+
+
+def _read_string_multimap(body):
+    result = {}
+    pos = 2
+    for _ in range(struct.unpack_from('>H', body, 0)[0]):
+        key, pos = _read_string(body, pos)
+        values = []
+        count = struct.unpack_from('>H', body, pos)[0]
+        pos += 2
+        for _ in range(count):
+            value, pos = _read_string(body, pos)
+            values.append(value)
+        result[key] = values
+    return result
+
+
+class _Probe(object):
+
+    def __init__(self, target):
+        self.target = target
+        self.version = target.version
+        self.sock = None
+        self.connecting = False
+        self.out = b''
+        self.buffer = b''
+        self.ready = False
+        self.error = None
+        self.retry_at = 0
+        self.give_up_at = None
+        self.backoff = MIN_BACKOFF
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def fail(self, error, retry_now=False):
+        self.close()
+        self.error = error
+        if retry_now:
+            self.retry_at = 0
+        else:
+            self.retry_at = time.time() + self.backoff
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+    def succeed(self):
+        self.close()
+        self.ready = True
+        self.error = None
+
+    def connect(self):
+        try:
+            family, socktype, proto, _, address = socket.getaddrinfo(self.target.address[0], self.target.address[1],
+                                                                     socket.AF_UNSPEC, socket.SOCK_STREAM)[0]
+            self.sock = socket.socket(family, socktype, proto)
+            self.sock.setblocking(False)
+            err = self.sock.connect_ex(address)
+        except socket.error as e:
+            self.fail(str(e))
+            return
+        if err not in (0,) + _IN_PROGRESS:
+            self.fail(os.strerror(err))
+            return
+        self.connecting = True
+        self.out, self.buffer = b'', b''
+        self.give_up_at = time.time() + ATTEMPT_TIMEOUT
+
+    def wants_write(self):
+        return self.connecting or bool(self.out)
+
+    def on_writable(self):
+        if self.connecting:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                self.fail(os.strerror(err))
+                return
+            self.connecting = False
+            if self.target.kind == 'tcp':
+                self.succeed()
+                return
+            self.out = _frame(self.version, _OPTIONS)
+        try:
+            sent = self.sock.send(self.out)
+        except socket.error as e:
+            self.fail(str(e))
+            return
+        self.out = self.out[sent:]
+
+    def on_readable(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error as e:
+            self.fail(str(e))
+            return
+        if not data:
+            self.fail('connection closed')
+            return
+        self.buffer += data
+        while self.sock is not None:
+            version = ord(self.buffer[0:1]) & 0x7f if self.buffer else None
+            header_size = 9 if version is None or version >= 3 else 8
+            if len(self.buffer) < header_size:
+                return
+            opcode, length = struct.unpack_from('>Bi', self.buffer, header_size - 5)
+            if len(self.buffer) < header_size + length:
+                return
+            body = self.buffer[header_size:header_size + length]
+            self.buffer = self.buffer[header_size + length:]
+            self.on_response(version, opcode, body)
+
+    def on_response(self, version, opcode, body):
+        if opcode == _SUPPORTED:
+            cql_versions = _read_string_multimap(body).get('CQL_VERSION') or ['3.0.0']
+            self.out += _frame(self.version, _STARTUP, struct.pack('>H', 1) + _string('CQL_VERSION') + _string(cql_versions[0]))
+        elif opcode in (_READY, _AUTHENTICATE):
+            self.succeed()
+        elif opcode == _ERROR:
+            code = struct.unpack_from('>i', body, 0)[0]
+            message = _read_string(body, 4)[0]
+            if code == _PROTOCOL_ERROR and self.version > 1 and 'version' in message.lower():
+                # Negotiate down, as the drivers do
+                self.version = min(self.version - 1, version)
+                self.fail(message, retry_now=True)
+            else:
+                self.fail(message)
+        else:
+            self.fail('unexpected response opcode {}'.format(opcode))
+
+
+def probe(targets, timeout=30):
+    """
+    Probes all the targets concurrently until they are ready or timeout
+    seconds have passed, retrying each with exponential backoff. Returns,
+    by target name, None for those that are ready and the last error of
+    the others.
+    """
+    deadline = time.time() + timeout
+    probes = [_Probe(target) for target in targets]
+    try:
+        while True:
+            now = time.time()
+            pending = [p for p in probes if not p.ready]
+            if not pending or now >= deadline:
+                break
+            for p in pending:
+                if p.sock is None and now >= p.retry_at:
+                    p.connect()
+                elif p.sock is not None and now >= p.give_up_at:
+                    p.fail('no response after {} seconds'.format(ATTEMPT_TIMEOUT))
+            pending = [p for p in pending if not p.ready]
+            connected = [p for p in pending if p.sock is not None]
+            wake_up = min([deadline] + [p.retry_at for p in pending if p.sock is None] + [p.give_up_at for p in connected])
+            readable, writable, _ = select.select([p for p in connected if not p.connecting],
+                                                  [p for p in connected if p.wants_write()],
+                                                  [], max(0, wake_up - time.time()))
+            for p in writable:
+                if p.sock is not None:
+                    p.on_writable()
+            for p in readable:
+                if p.sock is not None:
+                    p.on_readable()
+    finally:
+        for p in probes:
+            p.close()
+    return OrderedDict((p.target.name, None if p.ready else p.error or 'not probed') for p in probes)
+
+
+def client_encryption_enabled(node):
+    """
+    Returns whether the native transport of a node requires TLS
+    (client_encryption_options in its cassandra.yaml).
+    """
+    try:
+        options = node.get_conf_option('client_encryption_options')
+    except (IOError, OSError):
+        return False
+    if not isinstance(options, dict):
+        return False
+    return str(options.get('enabled', False)).lower() == 'true'
+
+
+def native_transport(node):
+    """
+    Returns the Target that probes the native transport of a node. The
+    handshake is plaintext, so when client encryption is on, the probe only
+    checks that the port accepts connections.
+    """
+    if client_encryption_enabled(node):
+        return Target(node.name, node.network_interfaces['binary'], 'tcp', None)
+    return Target(node.name, node.network_interfaces['binary'], 'cql', native_protocol_version(node.get_cassandra_version()))
+
+
+def storage(node):
+    """
+    Returns the Target that checks that the storage port of a node accepts
+    connections.
+    """
+    return Target(node.name, node.network_interfaces['storage'], 'tcp', None)
+
+
+def wait_for_native_transport(nodes, timeout=30):
+    """
+    Waits for the native transport of all the nodes to serve CQL, emitting a
+    warning for each node that doesn't within timeout seconds. Returns
+    whether they all do.
+    """
+    results = probe([native_transport(node) for node in nodes], timeout)
+    for node in nodes:
+        error = results[node.name]
+        if error is not None:
+            binary_itf = node.network_interfaces['binary']
+            warnings.warn("Binary interface %s:%s is not serving CQL after %s seconds (%s), node may have failed to start."
+                          % (binary_itf[0], binary_itf[1], timeout, error))
+    return all(error is None for error in results.values())
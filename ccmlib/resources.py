@@ -0,0 +1,122 @@
+#
+# Resource plans: splitting the memory and CPUs of the host between nodes
+#
+
+from __future__ import absolute_import
+
+import multiprocessing
+import os
+
+from ccmlib.common import ArgumentError
+
+# Fraction of the host memory the nodes get by default
+DEFAULT_BUDGET = 0.5
+
+# Bounds of the heap of a node, in MB
+MIN_HEAP_MB = 256
+MAX_HEAP_MB = 8192
+
+# Compaction throughput shared by all the nodes, in MB/s
+TOTAL_COMPACTION_THROUGHPUT_MB = 256
+
+
+def host_memory():
+    """
+    Returns the total memory of the host in MB, from /proc/meminfo, or None
+    if it can't be read.
+    """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def host_cpus():
+    """
+    Returns the number of CPUs available to ccm: those it is allowed to run
+    on if that is known, or else those listed in /proc/cpuinfo.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            count = sum(1 for line in f if line.startswith('processor'))
+        if count:
+            return count
+    except (IOError, OSError):
+        pass
+    return multiprocessing.cpu_count()
+
+
+def plan(nodes, cassandra_version, budget=DEFAULT_BUDGET, memory=None, cpus=None):
+    """
+    Splits budget (a fraction) of the host memory, and the host CPUs, evenly
+    between the given number of nodes. Returns the plan as a dict, with the
+    heap settings of the nodes (max_heap_size and heap_newsize) and the
+    cassandra.yaml options that go with them (config_options). memory (in
+    MB) and cpus default to those of the host.
+    """
+    if nodes < 1:
+        raise ArgumentError("Cannot plan resources for {} nodes".format(nodes))
+    if not 0 < budget <= 1:
+        raise ArgumentError("The memory budget must be a fraction of the host memory, got {}".format(budget))
+    memory = memory if memory is not None else host_memory()
+    if memory is None:
+        raise ArgumentError("Cannot find out how much memory the host has")
+    cpus = cpus if cpus is not None else host_cpus()
+
+    node_memory = int(memory * budget) // nodes
+    node_cpus = max(1, cpus // nodes)
+    # Leave as much again off heap, for memtables, caches, and the JVM itself
+    heap = max(MIN_HEAP_MB, min(MAX_HEAP_MB, node_memory // 2))
+    # What cassandra-env.sh picks: the lesser of 100MB per core and a quarter of the heap
+    newsize = max(32, min(100 * node_cpus, heap // 4))
+    concurrency = max(2, min(32, 8 * node_cpus))
+    memtable_space = heap // 4
+    compaction_throughput = max(8, TOTAL_COMPACTION_THROUGHPUT_MB // nodes)
+
+    config_options = {
+        'concurrent_reads': concurrency,
+        'concurrent_writes': concurrency,
+        'concurrent_compactors': min(node_cpus, 4),
+    }
+    # Cassandra refuses the options it doesn't know
+    if cassandra_version >= '4.1':
+        config_options['concurrent_counter_writes'] = concurrency
+        config_options['memtable_heap_space'] = '{}MiB'.format(memtable_space)
+        config_options['compaction_throughput'] = '{}MiB/s'.format(compaction_throughput)
+    elif cassandra_version >= '2.1':
+        config_options['concurrent_counter_writes'] = concurrency
+        config_options['memtable_heap_space_in_mb'] = memtable_space
+        config_options['compaction_throughput_mb_per_sec'] = compaction_throughput
+    else:
+        config_options['compaction_throughput_mb_per_sec'] = compaction_throughput
+
+    return {
+        'budget': budget,
+        'nodes': nodes,
+        'host_memory_mb': memory,
+        'host_cpus': cpus,
+        'max_heap_size': '{}M'.format(heap),
+        'heap_newsize': '{}M'.format(newsize),
+        'config_options': config_options,
+    }
+
+
+def describe(plan):
+    """
+    Returns the lines describing a plan.
+    """
+    lines = ['{} nodes sharing {:.0%} of {}MB and {} CPUs'.format(plan['nodes'], plan['budget'], plan['host_memory_mb'], plan['host_cpus']),
+             '  MAX_HEAP_SIZE={}'.format(plan['max_heap_size']),
+             '  HEAP_NEWSIZE={}'.format(plan['heap_newsize'])]
+    for key in sorted(plan['config_options']):
+        lines.append('  {}: {}'.format(key, plan['config_options'][key]))
+    return lines
@@ -0,0 +1,103 @@
+#
+# Cross-node log timeline, merged by timestamp
+#
+
+from __future__ import absolute_import
+
+import heapq
+import re
+from collections import namedtuple
+
+from ccmlib import gc_log
+from ccmlib.log_reader import RotatingLog
+from ccmlib.log_store import LogRecord, parse_log
+
+# Log kind -> Node method returning the log file path
+LOG_KINDS = {'system': 'logfilename',
+             'debug': 'debuglogfilename',
+             'gc': 'gclogfilename'}
+
+# A log entry of one of the nodes
+TimelineEntry = namedtuple('TimelineEntry', 'timestamp node log record')
+
+_gc_entry = re.compile(r'\[?\d{4}-\d\d-\d\dT[\d:.]+[+-]\d{4}\]?:?\s*(.*)$')
+_gc_level = re.compile(r'\[(trace|debug|info|warning|error)\s*\]')
+_GC_LEVELS = {'trace': 'TRACE', 'debug': 'DEBUG', 'info': 'INFO', 'warning': 'WARN', 'error': 'ERROR'}
+
+
+def parse_gc_log(lines):
+    """
+    Yields a LogRecord for each date stamped entry of a GC log (JDK 8 or
+    unified logging), with the continuation lines folded into its message.
+    Timestamps are converted to local time, like those of system.log.
+    """
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        m = _gc_entry.match(line)
+        if m is None:
+            if current is not None:
+                current = current._replace(message=current.message + '\n' + line)
+            continue
+        if current is not None:
+            yield current
+        level = _gc_level.search(m.group(1))
+        current = LogRecord(_GC_LEVELS[level.group(1)] if level else None, None, gc_log.local_time(line), None, None, m.group(1))
+    if current is not None:
+        yield current
+
+
+def _records(path, kind):
+    if kind == 'gc':
+        lines = (line for segment in gc_log.gc_log_segments(gc_log.find_gc_log(path)) for _, _, line in segment.lines())
+        return parse_gc_log(lines)
+    return parse_log(line for _, _, _, line in RotatingLog(path).lines())
+
+
+def node_entries(node, kind='system', since=None, until=None, levels=None):
+    """
+    Yields the TimelineEntries of one log of a node (including its rolled
+    archives) in the order they were written, restricted to the given time
+    window (since inclusive, until exclusive) and levels.
+    """
+    path = getattr(node, LOG_KINDS[kind])()
+    for record in _records(path, kind):
+        if since is not None and record.timestamp < since:
+            continue
+        if until is not None and record.timestamp >= until:
+            continue
+        if levels is not None and record.level not in levels:
+            continue
+        yield TimelineEntry(record.timestamp, node.name, kind, record)
+
+
+def merge(streams):
+    """
+    Lazily merges streams of TimelineEntries that are each in timestamp
+    order, holding a single entry per stream in memory.
+    """
+    def keyed(i, stream):
+        for seq, entry in enumerate(stream):
+            # The stream index and sequence number break timestamp ties,
+            # so that entries are never compared themselves
+            yield entry.timestamp, i, seq, entry
+    for _, _, _, entry in heapq.merge(*[keyed(i, s) for i, s in enumerate(streams)]):
+        yield entry
+
+
+def timeline(nodes, kinds=('system',), since=None, until=None, levels=None):
+    """
+    Returns an iterator over the entries of the given logs of all the nodes,
+    interleaved by timestamp.
+    """
+    if levels is not None:
+        levels = set(levels)
+    return merge([node_entries(node, kind, since, until, levels) for node in nodes for kind in kinds])
+
+
+def format_entry(entry):
+    record = entry.record
+    source = ' {}:{}'.format(record.file, record.line) if record.file else ''
+    thread = ' [{}]'.format(record.thread) if record.thread else ''
+    return '{} {} {:<5}{}{} - {}'.format(entry.timestamp.strftime('%Y-%m-%d %H:%M:%S,%f')[:-3], entry.node,
+                                         record.level or entry.log, thread, source, record.message)
@@ -0,0 +1,135 @@
+#
+# Per-phase timings of node and cluster starts and stops
+#
+
+from __future__ import absolute_import
+
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+# Where timings are kept, in the node and cluster directories
+TIMINGS_FILE = 'timings.json'
+
+# How many runs of each operation are kept
+HISTORY = 20
+
+
+class Timings(object):
+
+    """
+    The phases of one start or stop of a node or cluster, in the order they
+    ran, each with its offset from the beginning of the operation and its
+    duration, in seconds.
+    """
+
+    def __init__(self, operation, name, started=None):
+        self.operation = operation
+        self.name = name
+        self.started = started if started is not None else time.time()
+        self.phases = OrderedDict()
+
+    def add(self, phase, start, end):
+        """
+        Records a phase that ran from start to end (as time.time() values).
+        """
+        self.phases[phase] = (start - self.started, end - start)
+
+    def mark(self, phase):
+        """
+        Records a phase that ran from the end of the previous one (or the
+        beginning of the operation) until now.
+        """
+        self.add(phase, self.started + self.total(), time.time())
+
+    @contextmanager
+    def phase(self, phase):
+        """
+        Records the time spent in the body of a with statement.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(phase, start, time.time())
+
+    def total(self):
+        return max([offset + duration for offset, duration in self.phases.values()] or [0])
+
+    def to_dict(self):
+        return {'operation': self.operation,
+                'name': self.name,
+                'started': self.started,
+                'phases': [[phase, offset, duration] for phase, (offset, duration) in self.phases.items()]}
+
+    @staticmethod
+    def from_dict(data):
+        timings = Timings(data['operation'], data['name'], data['started'])
+        for phase, offset, duration in data['phases']:
+            timings.phases[phase] = (offset, duration)
+        return timings
+
+
+def load(path, operation=None):
+    """
+    Returns the Timings recorded in a node or cluster directory, oldest
+    first, optionally only those of the given operation (start or stop).
+    """
+    try:
+        with open(os.path.join(path, TIMINGS_FILE), 'r') as f:
+            runs = [Timings.from_dict(data) for data in json.load(f)]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return []
+    return [t for t in runs if operation is None or t.operation == operation]
+
+
+def record(path, timings):
+    """
+    Saves timings in a node or cluster directory, replacing an earlier save
+    of the same run, and keeping the last HISTORY runs of each operation.
+    """
+    runs = [t for t in load(path) if (t.operation, t.started) != (timings.operation, timings.started)]
+    runs.append(timings)
+    kept = []
+    for t in reversed(runs):
+        if sum(1 for k in kept if k.operation == t.operation) < HISTORY:
+            kept.append(t)
+    filename = os.path.join(path, TIMINGS_FILE)
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump([t.to_dict() for t in reversed(kept)], f)
+    os.rename(tmp, filename)
+
+
+def format_runs(runs):
+    """
+    Returns the lines of a table with the phases of the given runs (of the
+    same operation) as rows and the runs as columns, oldest first, with the
+    difference between the last two runs if there are several.
+    """
+    if not runs:
+        return []
+    phases = []
+    for run in runs:
+        for phase in run.phases:
+            if phase not in phases:
+                phases.append(phase)
+    width = max(len(phase) for phase in phases + ['total'])
+    header = ' ' * (width + 2) + ''.join('{:>21}'.format(datetime.fromtimestamp(run.started).strftime('%Y-%m-%d %H:%M:%S'))
+                                         for run in runs)
+    if len(runs) > 1:
+        header += '{:>10}'.format('diff')
+    lines = ['{} {}'.format(runs[-1].name, runs[-1].operation), header]
+
+    def row(label, values):
+        line = '  {:<{}}'.format(label, width) + ''.join('{:>21}'.format('-' if v is None else '{:.3f}s'.format(v)) for v in values)
+        if len(values) > 1:
+            line += '{:>10}'.format('-' if None in values[-2:] else '{:+.3f}s'.format(values[-1] - values[-2]))
+        return line
+    for phase in phases:
+        lines.append(row(phase, [run.phases[phase][1] if phase in run.phases else None for run in runs]))
+    lines.append(row('total', [run.total() for run in runs]))
+    return lines
@@ -0,0 +1,67 @@
+import os
+
+from ccmlib.cluster import Cluster
+from ccmlib.node import Node
+
+
+CASSANDRA_YAML = """\
+cluster_name: Test Cluster
+num_tokens: 256
+seed_provider:
+    - class_name: org.apache.cassandra.locator.SimpleSeedProvider
+      parameters:
+          - seeds: "127.0.0.1"
+listen_address: localhost
+storage_port: 7000
+rpc_address: localhost
+native_transport_port: 9042
+concurrent_writes: 32
+"""
+
+LOGBACK_XML = """\
+<configuration scan="true">
+  <logger name="org.apache.cassandra" level="DEBUG"/>
+  <root level="INFO">
+  </root>
+</configuration>
+"""
+
+
+def make_install_dir(path, version='3.11.4'):
+    """
+    Lays out the few install files that creating and populating a cluster
+    read.
+    """
+    os.makedirs(os.path.join(path, 'bin'))
+    os.makedirs(os.path.join(path, 'conf'))
+    files = {os.path.join('conf', 'cassandra.yaml'): CASSANDRA_YAML,
+             os.path.join('conf', 'logback.xml'): LOGBACK_XML,
+             os.path.join('conf', 'logback-tools.xml'): LOGBACK_XML,
+             os.path.join('conf', 'cassandra-env.sh'): 'JMX_PORT="7199"\nJVM_OPTS="$JVM_OPTS -Xloggc:${CASSANDRA_HOME}/logs/gc.log"\n',
+             os.path.join('conf', 'jvm.options'): '-ea\n',
+             os.path.join('bin', 'cassandra'): '#!/bin/sh\n',
+             '0.version.txt': version}
+    for name, content in files.items():
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(content)
+    return path
+
+
+def make_cluster(path):
+    """
+    Returns a cluster whose nodes live under path, without an install
+    directory or anything written to disk.
+    """
+    path = os.path.abspath(path)
+    return Cluster(os.path.dirname(path), os.path.basename(path), create_directory=False)
+
+
+def make_node(path, name='node1'):
+    """
+    Returns a node of a cluster made by make_cluster, with only its logs
+    directory created.
+    """
+    cluster = make_cluster(path)
+    node = Node(name, cluster, False, None, ('127.0.0.1', 7000), '7199', '2000', None, save=False, binary_interface=('127.0.0.1', 9042))
+    os.makedirs(os.path.join(path, name, 'logs'))
+    return node
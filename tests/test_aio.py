@@ -0,0 +1,79 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from ccmlib.node import Status, TimeoutError
+
+from . import ccmtest
+from .fakes import make_node
+from .test_log_reader import append_later
+from .test_process import spawn
+
+
+class TestAsyncLogWaits(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+        self.nodes = [make_node(self.dir, 'node%d' % i) for i in (1, 2, 3)]
+        for node in self.nodes:
+            node.cluster = self.nodes[0].cluster
+            open(node.logfilename(), 'w').close()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.dir)
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_many_concurrent_watches(self):
+        for i, node in enumerate(self.nodes):
+            append_later(node.logfilename(), 'INFO node %d is now UP\n' % i, delay=0.1 * (i + 1))
+
+        async def watch_all():
+            return await asyncio.gather(*[node.watch_log_for_async('now UP', timeout=10) for node in self.nodes])
+        start = time.time()
+        results = self.run_async(watch_all())
+        self.assertLess(time.time() - start, 3)
+        self.assertEqual([line for line, _ in results], ['INFO node %d is now UP\n' % i for i in range(3)])
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            self.run_async(self.nodes[0].watch_log_for_async('never', timeout=0.3))
+        self.assertEqual(self.nodes[0].cluster.log_tailer()._files, {})
+
+    def test_cancellation_removes_subscription(self):
+        async def cancel_watch():
+            task = asyncio.ensure_future(self.nodes[0].watch_log_for_async('never', timeout=10))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+        self.assertTrue(self.run_async(cancel_watch()))
+        self.assertEqual(self.nodes[0].cluster.log_tailer()._files, {})
+
+    def test_wait_for_any_log(self):
+        from ccmlib import aio
+        append_later(self.nodes[1].logfilename(), 'INFO compaction done\n')
+        node = self.run_async(aio.wait_for_any_log(self.nodes, 'compaction done', 10))
+        self.assertIs(node, self.nodes[1])
+        with self.assertRaises(TimeoutError):
+            self.run_async(aio.wait_for_any_log(self.nodes, 'never', 0.2))
+
+    def test_wait_for_exit(self):
+        p = spawn()
+        node = self.nodes[0]
+        node.pid, node.status = p.pid, Status.UP
+        node._update_config = lambda: None
+        self.assertFalse(self.run_async(node.wait_for_exit_async(0.05)))
+        self.loop.call_later(0.1, p.terminate)
+        start = time.time()
+        self.assertTrue(self.run_async(node.wait_for_exit_async(10)))
+        self.assertLess(time.time() - start, 1)
+        p.wait()
+        p.stdout.close()
@@ -0,0 +1,168 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from distutils.spawn import find_executable
+
+from ccmlib import cds
+
+from . import ccmtest
+from .fakes import make_node
+
+JDK_17 = 'openjdk version "17.0.2" 2022-01-18\nOpenJDK Runtime Environment (build 17.0.2+8-86)\n'
+JDK_8 = 'java version "1.8.0_292"\nJava(TM) SE Runtime Environment (build 1.8.0_292-b10)\n'
+
+MAIN_JAVA = """\
+public class Main {
+    public static void main(String[] args) {
+        System.out.println(Main.class.getResource("/logback.xml") != null);
+    }
+}
+"""
+
+
+def find_jdk():
+    """
+    Returns the home of a JDK recent enough for class data sharing, or None.
+    """
+    javac = find_executable('javac')
+    if javac is None:
+        return None
+    home = os.path.dirname(os.path.dirname(os.path.realpath(javac)))
+    output = cds.java_version({'JAVA_HOME': home})
+    if output is None or (cds.parse_java_version(output) or 0) < cds.MIN_JDK:
+        return None
+    return home
+
+
+class TestCds(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved_env = dict((key, os.environ.get(key)) for key in (cds.ENABLED_ENV, 'CCM_CONFIG_DIR'))
+        os.environ[cds.ENABLED_ENV] = 'true'
+        os.environ['CCM_CONFIG_DIR'] = os.path.join(self.dir, 'ccm')
+        self.saved_versions = dict(cds._java_versions)
+        self.env = {'JAVA_HOME': os.path.join(self.dir, 'jdk')}
+        cds._java_versions[os.path.join(self.dir, 'jdk', 'bin', 'java')] = JDK_17
+
+        self.install_dir = os.path.join(self.dir, 'cassandra')
+        os.makedirs(os.path.join(self.install_dir, 'lib'))
+        self.jar = os.path.join(self.install_dir, 'lib', 'guava.jar')
+        with open(self.jar, 'w') as f:
+            f.write('classes')
+        self.node = make_node(os.path.join(self.dir, 'test'))
+        self.node.cluster.name = 'test'
+        self.node.get_install_dir = lambda: self.install_dir
+        self.node.get_cassandra_version = lambda: '4.0.1'
+
+    def tearDown(self):
+        for key, value in self.saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        cds._java_versions.clear()
+        cds._java_versions.update(self.saved_versions)
+        shutil.rmtree(self.dir)
+
+    def test_parse_java_version(self):
+        self.assertEqual(cds.parse_java_version(JDK_17), 17)
+        self.assertEqual(cds.parse_java_version(JDK_8), 8)
+        self.assertEqual(cds.parse_java_version('openjdk version "21" 2023-09-19'), 21)
+        self.assertIsNone(cds.parse_java_version('command not found'))
+
+    def test_dump_then_share(self):
+        options = cds.jvm_options(self.node, self.env)
+        self.assertEqual(len(options), 1)
+        self.assertTrue(options[0].startswith('-XX:ArchiveClassesAtExit='))
+        dumped, path = self.node._cds_dump
+        self.assertEqual(options[0].split('=', 1)[1], dumped)
+
+        # The JVM dumps the archive on exit
+        with open(dumped, 'w') as f:
+            f.write('archive')
+        self.node._adopt_cds_archive()
+        self.assertIsNone(self.node._cds_dump)
+        self.assertFalse(os.path.exists(dumped))
+        self.assertEqual(cds.jvm_options(self.node, self.env), ['-XX:SharedArchiveFile={}'.format(path)])
+
+    def test_dump_adopted_on_next_start(self):
+        cds.jvm_options(self.node, self.env)
+        dumped, path = self.node._cds_dump
+        with open(dumped, 'w') as f:
+            f.write('archive')
+        self.assertEqual(cds.jvm_options(self.node, self.env), ['-XX:SharedArchiveFile={}'.format(path)])
+
+    def test_invalidated_when_jars_change(self):
+        cds.jvm_options(self.node, self.env)
+        dumped, path = self.node._cds_dump
+        with open(dumped, 'w') as f:
+            f.write('archive')
+        cds.adopt(dumped, path)
+
+        later = time.time() + 10
+        os.utime(self.jar, (later, later))
+        options = cds.jvm_options(self.node, self.env)
+        self.assertTrue(options[0].startswith('-XX:ArchiveClassesAtExit='))
+        self.assertFalse(os.path.exists(path))
+
+    def test_disabled(self):
+        cds._java_versions[os.path.join(self.dir, 'jdk', 'bin', 'java')] = JDK_8
+        self.assertEqual(cds.jvm_options(self.node, self.env), [])
+        cds._java_versions[os.path.join(self.dir, 'jdk', 'bin', 'java')] = JDK_17
+        os.environ[cds.ENABLED_ENV] = ''
+        self.assertEqual(cds.jvm_options(self.node, self.env), [])
+        self.assertIsNone(self.node._cds_dump)
+
+    def classpath(self, env):
+        script = 'CLASSPATH="$CASSANDRA_CONF:/lib/a.jar"\n{}\necho "$CLASSPATH"'.format(cds.JARS_FIRST)
+        return subprocess.check_output(['sh', '-c', script], env=env).decode('utf-8').strip()
+
+    def test_jars_first(self):
+        env = dict(os.environ, CASSANDRA_CONF='/node1/conf', **self.env)
+        self.assertEqual(self.classpath(env), '/node1/conf:/lib/a.jar')
+        cds.jvm_options(self.node, env)
+        self.assertEqual(self.classpath(env), '/lib/a.jar:/node1/conf')
+
+    def test_archive_mapped_by_other_node(self):
+        jdk = find_jdk()
+        if jdk is None:
+            self.skipTest('Needs a JDK {}+'.format(cds.MIN_JDK))
+        src = os.path.join(self.dir, 'src')
+        os.makedirs(src)
+        with open(os.path.join(src, 'Main.java'), 'w') as f:
+            f.write(MAIN_JAVA)
+        subprocess.check_call([os.path.join(jdk, 'bin', 'javac'), '-d', src, os.path.join(src, 'Main.java')])
+        os.remove(self.jar)
+        jar = os.path.join(self.install_dir, 'lib', 'main.jar')
+        subprocess.check_call([os.path.join(jdk, 'bin', 'jar'), 'cf', jar, '-C', src, 'Main.class'])
+
+        def run(node, *args):
+            # What bin/cassandra does, with the node's own conf directory
+            conf = os.path.join(node.get_path(), 'conf')
+            os.makedirs(conf)
+            with open(os.path.join(conf, 'logback.xml'), 'w') as f:
+                f.write('<configuration/>\n')
+            env = dict(os.environ, JAVA_HOME=jdk, CASSANDRA_CONF=conf)
+            options = cds.jvm_options(node, env)
+            script = 'CLASSPATH="$CASSANDRA_CONF:{}"\n{}\nexec "$JAVA_HOME/bin/java" "$@" -cp "$CLASSPATH" Main'.format(jar, cds.JARS_FIRST)
+            output = subprocess.check_output(['sh', '-c', script, 'sh'] + options + list(args), env=env, stderr=subprocess.STDOUT)
+            node._adopt_cds_archive()
+            return options, output.decode('utf-8')
+
+        options, output = run(self.node)
+        self.assertTrue(options[0].startswith('-XX:ArchiveClassesAtExit='))
+        self.assertIn('true', output.splitlines())
+
+        other = make_node(os.path.join(self.dir, 'test'), 'node2')
+        other.cluster.name = 'test'
+        other.get_install_dir = lambda: self.install_dir
+        other.get_cassandra_version = lambda: '4.0.1'
+        # -Xshare:on fails rather than run without the archive
+        options, output = run(other, '-Xshare:on', '-Xlog:class+load=info')
+        self.assertTrue(options[0].startswith('-XX:SharedArchiveFile='))
+        self.assertIn('Main source: shared objects file', output)
+        # The node's conf directory is still on the class path
+        self.assertIn('true', output.splitlines())
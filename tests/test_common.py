@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 from mock import patch
 
@@ -59,5 +62,155 @@ class TestCommon(ccmtest.Tester):
 
         self.assertEqual(common.merge_configuration(dict1, dict2), dict0)
 
+    def test_skip_unchanged_writes(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            conf = os.path.join(tmp, 'cassandra-env.sh')
+            self.assertTrue(common.write_if_changed(conf, 'JMX_PORT="7199"\nMAX_HEAP_SIZE=1G\n'))
+            inode = os.stat(conf).st_ino
+            self.assertFalse(common.write_if_changed(conf, 'JMX_PORT="7199"\nMAX_HEAP_SIZE=1G\n'))
+            common.replace_in_file(conf, 'JMX_PORT=', 'JMX_PORT="7199"')
+            self.assertEqual(os.stat(conf).st_ino, inode)
+            common.replace_in_file(conf, 'JMX_PORT=', 'JMX_PORT="7100"')
+            self.assertNotEqual(os.stat(conf).st_ino, inode)
+            with open(conf) as f:
+                self.assertEqual(f.read(), 'JMX_PORT="7100"\nMAX_HEAP_SIZE=1G\n')
+
+            dst = os.path.join(tmp, 'node1')
+            os.mkdir(dst)
+            self.assertTrue(common.copy_if_changed(conf, dst))
+            self.assertFalse(common.copy_if_changed(conf, dst))
+            self.assertFalse(common.copy_if_changed(conf, os.path.join(dst, 'cassandra-env.sh')))
+            # No temporary files left behind
+            self.assertEqual(sorted(os.listdir(tmp)), ['cassandra-env.sh', 'node1'])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_yaml_template_cache(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'cassandra.yaml')
+            with open(path, 'w') as f:
+                f.write('cluster_name: Test Cluster\nseeds: [127.0.0.1]\n')
+            data, text = common.load_yaml_template(path)
+            self.assertEqual(data, {'cluster_name': 'Test Cluster', 'seeds': ['127.0.0.1']})
+            self.assertIn('cluster_name', text)
+            # Callers get their own copy
+            data['seeds'].append('127.0.0.2')
+            self.assertEqual(common.load_yaml_template(path)[0]['seeds'], ['127.0.0.1'])
+            # Parsed again when the file changes
+            with open(path, 'w') as f:
+                f.write('cluster_name: Other Cluster\n')
+            os.utime(path, (0, 0))
+            self.assertEqual(common.load_yaml_template(path)[0], {'cluster_name': 'Other Cluster'})
+            self.assertEqual(common.load_yaml(common.dump_yaml({'a': [1, 2]})), {'a': [1, 2]})
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_edit_plan(self):
+        logback = ('<configuration scan="true">\n'
+                   '  <logger name="org.apache.cassandra" level="DEBUG"/>\n'
+                   '  <root level="INFO">\n'
+                   '  </root>\n'
+                   '</configuration>\n')
+        env = 'JMX_PORT="7199"\nJVM_OPTS="$JVM_OPTS -Xloggc:/var/log/gc.log"\n'
+        tmp = tempfile.mkdtemp()
+        try:
+            def apply(content, edits):
+                path = os.path.join(tmp, 'conf')
+                with open(path, 'w') as f:
+                    f.write(content)
+                plan = common.EditPlan(path)
+                for edit in edits:
+                    if edit[0] == 'replace':
+                        plan.replace(edit[1], edit[2])
+                    else:
+                        plan.replaces_or_add([(edit[1], edit[2])], *edit[3:])
+                self.assertTrue(plan.apply())
+                with open(path) as f:
+                    return f.read()
+
+            # The expected contents are what the replace_in_file and
+            # replaces_or_add_into_file_tail calls gave, one after the other,
+            # before they were made in a single pass
+
+            # Later edits see each line of a multi-line replacement
+            self.assertEqual(apply(logback, [('replace', 'org.apache.cassandra', '  <logger name="org.apache.cassandra" level="INFO"/>\n'
+                                                                                 '  <logger name="org.bar" level="OFF"/>'),
+                                             ('replace', 'org.bar', '  <logger name="org.bar" level="ERROR"/>')]),
+                             '<configuration scan="true">\n'
+                             '  <logger name="org.apache.cassandra" level="INFO"/>\n'
+                             '  <logger name="org.bar" level="ERROR"/>\n'
+                             '  <root level="INFO">\n'
+                             '  </root>\n'
+                             '</configuration>\n')
+
+            # Additions go before the closing </configuration> tag, and later
+            # edits apply to them
+            self.assertEqual(apply(logback, [('add', '\t<logger name="org.foo" level=".*"/>', '\t<logger name="org.foo" level="TRACE"/>'),
+                                             ('add', '\t<logger name="org.apache.cassandra" level=".*"/>', '\t<logger name="org.apache.cassandra" level="INFO"/>'),
+                                             ('replace', 'TRACE', '\t<logger name="org.foo" level="ALL"/>'),
+                                             ('add', '<root level=".*">', '<root level="WARN">')]),
+                             '<configuration scan="true">\n'
+                             '  <logger name="org.apache.cassandra" level="DEBUG"/>\n'
+                             '<root level="WARN">\n'
+                             '  </root>\n'
+                             '\n'
+                             '\t<logger name="org.foo" level="ALL"/>\n'
+                             '\n'
+                             '\t<logger name="org.apache.cassandra" level="INFO"/>\n'
+                             '</configuration>\n')
+
+            # Without add_config_close, as for cassandra-env.sh
+            self.assertEqual(apply(env, [('add', '.*byteman.*', 'JVM_OPTS="$JVM_OPTS -javaagent:byteman.jar"', False),
+                                         ('replace', '-Xloggc', 'JVM_OPTS="$JVM_OPTS -Xloggc:/node1/logs/gc.log"')]),
+                             'JMX_PORT="7199"\n'
+                             'JVM_OPTS="$JVM_OPTS -Xloggc:/node1/logs/gc.log"\n'
+                             '\n'
+                             'JVM_OPTS="$JVM_OPTS -javaagent:byteman.jar"\n')
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_link_install_files(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            install = os.path.join(tmp, 'install')
+            os.makedirs(os.path.join(install, 'conf', 'triggers'))
+            src = os.path.join(install, 'conf', 'cassandra-env.sh')
+            with open(src, 'w') as f:
+                f.write('JMX_PORT="7199"\n')
+            with open(os.path.join(install, 'conf', 'triggers', 'README.txt'), 'w') as f:
+                f.write('triggers\n')
+
+            for mode in ('hardlink', 'symlink'):
+                node = os.path.join(tmp, mode)
+                with patch.dict(os.environ, {common.LINK_INSTALL_FILES: mode}):
+                    common.materialize_tree(os.path.join(install, 'conf'), node)
+                    dst = os.path.join(node, 'cassandra-env.sh')
+                    self.assertTrue(common.is_shared(dst))
+                    self.assertTrue(os.path.samefile(src, dst))
+                    self.assertTrue(common.is_shared(os.path.join(node, 'triggers', 'README.txt')))
+                    self.assertFalse(common.materialize_file(src, node))
+                    # Edits don't go through to the install
+                    common.replace_in_file(dst, 'JMX_PORT=', 'JMX_PORT="7100"')
+                    self.assertFalse(common.is_shared(dst))
+                    with open(src) as f:
+                        self.assertEqual(f.read(), 'JMX_PORT="7199"\n')
+                    self.assertTrue(common.materialize_file(src, node))
+                    self.assertTrue(common.copy_on_write(dst))
+                    with open(dst, 'a') as f:
+                        f.write('MAX_HEAP_SIZE=1G\n')
+                    with open(src) as f:
+                        self.assertEqual(f.read(), 'JMX_PORT="7199"\n')
+
+            self.assertEqual(common.link_mode(), 'copy')
+            common.materialize_file(src, os.path.join(tmp, 'copy.sh'))
+            self.assertFalse(common.is_shared(os.path.join(tmp, 'copy.sh')))
+            with patch.dict(os.environ, {common.LINK_INSTALL_FILES: 'reflink'}):
+                with self.assertRaises(common.ArgumentError):
+                    common.link_mode()
+        finally:
+            shutil.rmtree(tmp)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from ccmlib import compaction_log
+from ccmlib.compaction_log import CompactionEvent, PendingCompactions, parse_events
+from ccmlib.node import TimeoutError
+
+from . import ccmtest
+from .fakes import make_node
+
+
+def sstable(generation, size, level=None):
+    table = {'generation': generation, 'version': 'mc', 'size': size}
+    if level is not None:
+        table['details'] = {'level': level}
+    return {'strategyId': '0', 'table': table}
+
+
+def entry(kind, time, **fields):
+    fields.update({'type': kind, 'keyspace': 'ks', 'table': 'cf', 'time': time})
+    return json.dumps(fields) + '\n'
+
+
+LOG = ''.join([
+    entry('enable', 1000, strategies=[]),
+    entry('flush', 2000, tables=[sstable(1, 10 << 20, 0)]),
+    entry('flush', 3000, tables=[sstable(2, 10 << 20, 0)]),
+    entry('pending', 3000, strategyId='0', pending=1),
+    entry('compaction', 6000, start=4000, end=6000,
+          input=[sstable(1, 10 << 20, 0), sstable(2, 10 << 20, 0)],
+          output=[sstable(3, 16 << 20, 1)]),
+    entry('pending', 6000, strategyId='0', pending=0),
+])
+
+
+class TestCompactionLog(ccmtest.Tester):
+
+    def test_parse_events(self):
+        events = list(parse_events(LOG.splitlines(True)))
+        self.assertEqual([e.kind if isinstance(e, CompactionEvent) else 'pending' for e in events],
+                         ['flush', 'flush', 'pending', 'compaction', 'pending'])
+        compaction = events[3]
+        self.assertEqual((compaction.bytes_in, compaction.bytes_out), (20 << 20, 16 << 20))
+        self.assertEqual(compaction.duration, 2.0)
+        self.assertEqual((compaction.sstables_before, compaction.sstables_after), (2, 1))
+        self.assertEqual((compaction.tier_kind, compaction.tiers_in, compaction.tiers_out), ('level', (0,), (1,)))
+        self.assertEqual(compaction.start, datetime(1970, 1, 1, 0, 0, 4))
+        self.assertEqual(events[2], PendingCompactions('ks', 'cf', datetime(1970, 1, 1, 0, 0, 3), 1))
+
+    def test_size_tiers(self):
+        self.assertEqual(compaction_log.size_tier(1 << 20), 0)
+        self.assertEqual(compaction_log.size_tier(60 << 20), 1)
+        self.assertEqual(compaction_log.size_tier(250 << 20), 2)
+        line = entry('compaction', 0, input=[sstable(1, 1 << 20), sstable(2, 60 << 20)], output=[sstable(3, 61 << 20)])
+        event = next(parse_events([line]))
+        self.assertEqual((event.tier_kind, event.tiers_in, event.tiers_out), ('bucket', (0, 1), (1,)))
+        # Sstables written before the log was enabled are counted when compacted
+        self.assertEqual((event.sstables_before, event.sstables_after), (2, 1))
+
+    def test_partial_line(self):
+        lines = LOG.splitlines(True) + ['{"type": "flush", "keysp']
+        self.assertEqual(len(list(parse_events(lines))), 5)
+
+
+class TestNodeCompactionStats(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.node = make_node(self.dir)
+        self.log_file = os.path.join(self.dir, 'node1', 'logs', 'compaction.log')
+        with open(self.log_file, 'w') as f:
+            f.write(LOG)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_stats(self):
+        stats = self.node.compaction_stats()[('ks', 'cf')]
+        self.assertEqual((stats.flushes, stats.compactions), (2, 1))
+        self.assertEqual(stats.throughput(), (20 << 20) / 2.0)
+        self.assertEqual(stats.write_amplification(), (36 << 20) / float(20 << 20))
+        self.assertEqual((stats.sstables, stats.pending), (1, 0))
+
+        window = self.node.compaction_stats(until=datetime(1970, 1, 1, 0, 0, 4))[('ks', 'cf')]
+        self.assertEqual((window.compactions, window.pending), (0, 1))
+        self.assertEqual(compaction_log.describe_backlog({('ks', 'cf'): window}), 'ks.cf: 1 pending, 2 sstables')
+
+    def test_from_mark_and_combine(self):
+        mark = self.node.mark_log('compaction.log')
+        with open(self.log_file, 'a') as f:
+            f.write(entry('flush', 7000, tables=[sstable(4, 10 << 20, 0)]))
+        stats = self.node.compaction_stats(from_mark=mark)[('ks', 'cf')]
+        self.assertEqual((stats.flushes, stats.compactions), (1, 0))
+
+        node2 = make_node(self.dir, 'node2')
+        shutil.copy(self.log_file, os.path.join(self.dir, 'node2', 'logs'))
+        combined = compaction_log.combine({'node1': self.node.compaction_stats(),
+                                           'node2': node2.compaction_stats()})[('ks', 'cf')]
+        self.assertEqual((combined.flushes, combined.compactions, combined.sstables), (6, 2, 4))
+
+    def test_timeout_with_unreadable_log(self):
+        def broken(**kwargs):
+            raise ValueError('truncated compaction.log')
+        self.node.compaction_stats = broken
+        with self.assertRaises(TimeoutError) as cm:
+            self.node.wait_for_compactions(timeout=0)
+        self.assertIn('Compactions did not finish in 0 seconds', str(cm.exception))
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+
+from ccmlib import common, config_session
+from ccmlib.cluster import Cluster
+
+from . import ccmtest
+from .fakes import make_install_dir, make_node
+
+
+class TestConfigSession(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        install_dir = make_install_dir(os.path.join(self.dir, 'cassandra'))
+        self.cluster = Cluster(self.dir, 'test', install_dir=install_dir)
+        self.conf = os.path.join(self.cluster.get_path(), 'cluster.conf')
+        self.writes = []
+        self.nodes = [self.__node('node1'), self.__node('node2')]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def __node(self, name):
+        node = make_node(self.dir, name)
+        node.cluster = self.cluster
+        node._write_config = lambda parts: self.writes.append((name, parts))
+        self.cluster.nodes[name] = node
+        return node
+
+    def test_writes_each_file_once(self):
+        os.remove(self.conf)
+        with self.cluster.config_session() as session:
+            for node in self.nodes:
+                node.import_config_files()
+                node.set_log_level('DEBUG')
+                node._save()
+            self.nodes[0]._update_config()
+            self.cluster.set_partitioner('org.apache.cassandra.dht.Murmur3Partitioner')
+            self.cluster._update_config()
+            self.assertTrue(session.pending())
+            self.assertFalse(os.path.exists(self.conf))
+            self.assertEqual(self.writes, [])
+        self.assertEqual(self.writes, [('node1', list(config_session.NODE_PARTS)),
+                                       ('node2', list(config_session.NODE_PARTS))])
+        self.assertTrue(os.path.exists(self.conf))
+        self.assertIsNone(self.cluster._config_session)
+
+    def test_partial_writes(self):
+        with self.cluster.config_session():
+            self.nodes[0].set_log_level('WARN')
+            self.nodes[1]._update_config()
+        self.assertEqual(self.writes, [('node1', [config_session.LOGGING]), ('node2', [config_session.CONF])])
+
+    def test_nested_and_flush(self):
+        with self.cluster.config_session() as outer:
+            with self.cluster.config_session() as inner:
+                self.assertIs(inner, outer)
+                self.nodes[0]._save()
+            self.assertEqual(self.writes, [])
+            self.cluster.flush_config()
+            self.assertEqual(len(self.writes), 1)
+            self.assertFalse(outer.pending())
+        self.assertEqual(len(self.writes), 1)
+
+    def test_flushes_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.cluster.config_session():
+                self.nodes[0]._save()
+                raise ValueError()
+        self.assertEqual([name for name, _ in self.writes], ['node1'])
+
+
+class TestPopulate(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.install_dir = make_install_dir(os.path.join(self.dir, 'cassandra'))
+        self.cluster = Cluster(self.dir, 'test', install_dir=self.install_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_populate(self):
+        self.cluster.populate(3)
+        self.assertIsNone(self.cluster._config_session)
+        for i, node in enumerate(self.cluster.nodelist()):
+            with open(os.path.join(node.get_conf_dir(), 'cassandra.yaml')) as f:
+                data = common.load_yaml(f)
+            self.assertEqual(data['cluster_name'], 'test')
+            self.assertEqual(data['listen_address'], '127.0.0.{}'.format(i + 1))
+            self.assertEqual(data['seed_provider'][0]['parameters'][0]['seeds'], '127.0.0.1,127.0.0.2,127.0.0.3')
+            self.assertTrue(os.path.exists(os.path.join(node.get_conf_dir(), 'logback.xml')))
+            self.assertTrue(os.path.exists(os.path.join(node.get_bin_dir(), 'cassandra')))
+        with open(os.path.join(self.cluster.get_path(), 'cluster.conf')) as f:
+            self.assertEqual(common.load_yaml(f)['nodes'], ['node1', 'node2', 'node3'])
+
+    def test_overrides(self):
+        self.cluster.populate(2)
+        node1, node2 = self.cluster.nodelist()
+        self.cluster.set_configuration_options({'concurrent_writes': 64})
+        node2.set_configuration_options({'concurrent_writes': 16})
+        self.assertEqual(node1.get_conf_option('concurrent_writes'), 64)
+        self.assertEqual(node2.get_conf_option('concurrent_writes'), 16)
+        # A node option of None removes it, leaving Cassandra's default
+        node2.set_configuration_options({'concurrent_writes': None})
+        self.assertIsNone(node2.get_conf_option('concurrent_writes'))
+        node2.set_configuration_options({'concurrent_writes': 8})
+        self.assertEqual(node2.get_conf_option('concurrent_writes'), 8)
+        # The cached template was not modified
+        self.assertEqual(common.load_yaml_template(node1._cassandra_yaml_template())[0]['concurrent_writes'], 32)
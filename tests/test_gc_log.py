@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+
+from ccmlib import gc_log
+from ccmlib.gc_log import GcPauseError, GcStats, parse_pauses
+
+from . import ccmtest
+from .fakes import make_node
+
+JDK8_G1 = """2017-01-01T00:00:01.000+0000: 1.000: [GC pause (G1 Evacuation Pause) (young), 0.0100000 secs]
+   [Parallel Time: 9.0 ms, GC Workers: 4]
+   [Eden: 24.0M(24.0M)->0.0B(20.0M) Survivors: 0.0B->4096.0K Heap: 24.0M(256.0M)->6.0M(256.0M)]
+ [Times: user=0.03 sys=0.00, real=0.01 secs]
+2017-01-01T00:00:01.500+0000: 1.500: Total time for which application threads were stopped: 0.0101 seconds
+2017-01-01T00:00:02.000+0000: 2.000: [GC pause (G1 Evacuation Pause) (young), 0.0200000 secs]
+   [Eden: 20.0M(20.0M)->0.0B(20.0M) Survivors: 4096.0K->4096.0K Heap: 26.0M(256.0M)->8.0M(256.0M)]
+ [Times: user=0.05 sys=0.00, real=0.02 secs]
+2017-01-01T00:00:03.000+0000: 3.000: [Full GC (System.gc())  8M->5M(256M), 0.3000000 secs]
+"""
+
+JDK8_CMS = """2017-01-01T00:00:01.000+0000: 1.000: [GC (Allocation Failure) 1.000: [ParNew: 34944K->4352K(39296K), 0.0123 secs] 34944K->5120K(126720K), 0.0124 secs] [Times: user=0.02 sys=0.01, real=0.01 secs]
+2017-01-01T00:00:02.000+0000: 2.000: [GC (CMS Initial Mark) [1 CMS-initial-mark: 768K(87424K)] 20000K(126720K), 0.0020 secs] [Times: user=0.00 sys=0.00, real=0.00 secs]
+2017-01-01T00:00:02.010+0000: 2.010: [CMS-concurrent-mark-start]
+"""
+
+UNIFIED = """[2017-01-01T00:00:00.100+0000][0.100s][info][gc,init] Heap Region Size: 1M
+[2017-01-01T00:00:01.000+0000][1.000s][info][gc,start    ] GC(0) Pause Young (Normal) (G1 Evacuation Pause)
+[2017-01-01T00:00:01.000+0000][1.000s][info][gc,heap     ] GC(0) Eden regions: 24->0(20)
+[2017-01-01T00:00:01.000+0000][1.000s][info][gc,heap     ] GC(0) Survivor regions: 0->4(4)
+[2017-01-01T00:00:01.010+0000][1.010s][info][gc          ] GC(0) Pause Young (Normal) (G1 Evacuation Pause) 24M->6M(256M) 10.000ms
+[2017-01-01T00:00:03.000+0000][3.000s][info][gc          ] GC(1) Pause Full (System.gc()) 30M->5M(256M) 300.500ms
+[2017-01-01T00:00:04.000+0000][4.000s][info][gc          ] GC(2) Pause Remark 10M->10M(256M) 1.500ms
+"""
+
+
+class TestGcLog(ccmtest.Tester):
+
+    def test_jdk8_g1(self):
+        pauses = list(parse_pauses(JDK8_G1.splitlines(True)))
+        self.assertEqual([p.kind for p in pauses], ['young', 'young', 'full'])
+        self.assertEqual([p.duration for p in pauses], [10.0, 20.0, 300.0])
+        first = pauses[0]
+        self.assertEqual((first.heap_before, first.heap_after), (24 << 20, 6 << 20))
+        self.assertEqual((first.young_before, first.young_after), (24 << 20, 4 << 20))
+        self.assertEqual(first.uptime, 1.0)
+        self.assertIsNotNone(first.timestamp)
+
+    def test_jdk8_cms(self):
+        pauses = list(parse_pauses(JDK8_CMS.splitlines(True)))
+        self.assertEqual([p.kind for p in pauses], ['young', 'initial-mark'])
+        self.assertEqual((pauses[0].heap_before, pauses[0].heap_after), (34944 << 10, 5120 << 10))
+        self.assertEqual((pauses[0].young_before, pauses[0].young_after), (34944 << 10, 4352 << 10))
+
+    def test_unified(self):
+        pauses = list(parse_pauses(UNIFIED.splitlines(True)))
+        self.assertEqual([p.kind for p in pauses], ['young', 'full', 'remark'])
+        self.assertEqual([p.duration for p in pauses], [10.0, 300.5, 1.5])
+        self.assertEqual((pauses[0].young_before, pauses[0].young_after), (24 << 20, 4 << 20))
+
+    def test_stats(self):
+        stats = GcStats()
+        for pause in parse_pauses(JDK8_G1.splitlines(True)):
+            stats.add(pause)
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.percentile(50), 20.0)
+        self.assertEqual(stats.percentile(99), 300.0)
+        self.assertEqual(stats.histogram[gc_log.HISTOGRAM_BOUNDS.index(10)], 1)
+        self.assertEqual([p.duration for p in stats.worst()], [300.0, 20.0, 10.0])
+        # 26M - 6M allocated between the first two pauses, nothing before the full GC
+        self.assertEqual(stats.allocated, 20 << 20)
+        self.assertEqual(stats.allocation_rate(), (20 << 20) / 2.0)
+        # Old gen grew from 0 to 2M in the first pause, from 2M to 4M in the second
+        self.assertEqual(stats.promoted, 4 << 20)
+
+    def test_percentiles_of_unordered_pauses(self):
+        pauses = list(parse_pauses(JDK8_G1.splitlines(True)))
+        stats = GcStats()
+        for pause in reversed(pauses):
+            stats.add(pause)
+        self.assertEqual(stats.percentile(50), 20.0)
+        self.assertEqual(stats.max(), 300.0)
+        # Pauses added once percentiles were asked for are counted too
+        stats.add(pauses[0]._replace(duration=400.0))
+        self.assertEqual(stats.max(), 400.0)
+        combined = GcStats.combine([stats, stats])
+        self.assertEqual(combined.percentile(50), 20.0)
+        self.assertEqual(combined.percentile(99), 400.0)
+
+
+class TestNodeGcStats(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.node = make_node(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_from_mark_and_threshold(self):
+        gc_file = os.path.join(self.dir, 'node1', 'logs', 'gc.log')
+        with open(gc_file, 'w') as f:
+            f.write(UNIFIED)
+        self.assertEqual(self.node.gc_stats().count, 3)
+        mark = self.node.mark_gc_log()
+        with open(gc_file, 'a') as f:
+            f.write('[2017-01-01T00:00:05.000+0000][5.000s][info][gc] GC(3) Pause Young (Normal) (G1 Evacuation Pause) 30M->6M(256M) 5.000ms\n')
+        self.assertEqual(self.node.gc_stats(from_mark=mark).count, 1)
+
+        stats = {'node1': self.node.gc_stats()}
+        with self.assertRaises(GcPauseError):
+            gc_log.check_pauses(stats, max_p99=100)
+        self.assertEqual(gc_log.check_pauses(stats, max_p99=500).count, 4)
+
+    def test_mark_across_rotation(self):
+        logs = os.path.join(self.dir, 'node1', 'logs')
+        pause = '2017-01-01T00:00:0{0}.000+0000: {0}.000: [GC (Allocation Failure) {0}.000: [ParNew: 34944K->4352K(39296K), 0.0123 secs] ' \
+                '34944K->5120K(126720K), 0.0124 secs] [Times: user=0.02 sys=0.01, real=0.01 secs]\n'
+        first = os.path.join(logs, 'gc.log.0.current')
+        with open(first, 'w') as f:
+            f.write('2017-01-01 00:00:00 GC log file created {}\n'.format(first))
+            f.write(pause.format(1))
+        os.utime(first, (1000, 1000))
+        mark = self.node.mark_gc_log()
+
+        # The JVM logs a pause, then rotates to the next file
+        with open(first, 'a') as f:
+            f.write(pause.format(2))
+        os.rename(first, os.path.join(logs, 'gc.log.0'))
+        os.utime(os.path.join(logs, 'gc.log.0'), (1000, 1000))
+        second = os.path.join(logs, 'gc.log.1.current')
+        with open(second, 'w') as f:
+            f.write('2017-01-01 00:00:03 GC log file created {}\n'.format(second))
+            f.write(pause.format(3))
+
+        stats = self.node.gc_stats(from_mark=mark)
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(self.node.gc_stats().count, 3)
+        self.assertEqual(gc_log.find_gc_log(self.node.gclogfilename()), second)
+        # A mark taken now is in the new file
+        self.assertEqual(self.node.gc_stats(from_mark=self.node.mark_gc_log()).count, 0)
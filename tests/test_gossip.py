@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+import time
+
+from ccmlib import gossip
+from ccmlib.gossip import Convergence
+from ccmlib.node import TimeoutError
+
+from . import ccmtest
+from .fakes import make_node
+from .test_log_reader import append_later
+
+
+class TestGossipConvergence(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.nodes = [make_node(self.dir, 'node%d' % i) for i in (1, 2, 3)]
+        for i, node in enumerate(self.nodes, 1):
+            node.cluster = self.nodes[0].cluster
+            node.network_interfaces = {'storage': ('127.0.0.%d' % i, 7000)}
+            open(node.logfilename(), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def log(self, node, *lines):
+        with open(node.logfilename(), 'a') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+    def test_matrix(self):
+        node1, node2, node3 = self.nodes
+        self.log(node1, 'INFO  [GossipStage:1] InetAddress /127.0.0.2 is now UP',
+                 'INFO  [GossipStage:1] InetAddress /127.0.0.3 is now UP')
+        self.log(node2, 'INFO  [GossipStage:1] InetAddress /127.0.0.1:7000 is now UP')
+        # Not node1: a different address that starts the same way
+        self.log(node3, 'INFO  [GossipStage:1] InetAddress /127.0.0.10 is now UP',
+                 'INFO  [GossipStage:1] Node /127.0.0.2 has restarted, now UP')
+        convergence = Convergence(self.nodes, self.nodes).start()
+        try:
+            self.assertFalse(convergence.wait(0.2))
+            self.assertEqual(convergence.missing(), [('node2', 'node3'), ('node3', 'node1')])
+            self.assertEqual(convergence.matrix()['node1'], {'node2': True, 'node3': True})
+
+            append_later(node2.logfilename(), 'INFO  [GossipStage:1] InetAddress /127.0.0.3 is now UP\n', delay=0.1)
+            append_later(node3.logfilename(), 'INFO  [GossipStage:1] InetAddress /127.0.0.1 is now UP\n', delay=0.2)
+            start = time.time()
+            self.assertTrue(convergence.wait(10))
+            self.assertLess(time.time() - start, 3)
+            self.assertEqual(convergence.missing(), [])
+        finally:
+            convergence.close()
+
+    def test_down_from_marks(self):
+        node1, node2, node3 = self.nodes
+        self.log(node2, 'INFO  [GossipStage:1] InetAddress /127.0.0.1 is now DOWN')
+        marks = dict((node.name, node.mark_log()) for node in self.nodes)
+        self.log(node3, 'INFO  [GossipStage:1] InetAddress /127.0.0.1 is now dead')
+        missing = gossip.wait_for([node2, node3], [node1], state='DOWN', marks=marks, timeout=0.2)
+        self.assertEqual(missing, [('node2', 'node1')])
+        self.assertEqual(gossip.describe(missing, 'DOWN'), 'node2 does not see node1 as DOWN')
+
+    def test_node_wait_for_gossip(self):
+        node1, node2, node3 = self.nodes
+        marks = [(node2, node2.mark_log()), (node3, node3.mark_log())]
+        self.log(node2, 'INFO  [GossipStage:1] InetAddress /127.0.0.1 is now UP')
+        with self.assertRaisesRegex(TimeoutError, 'node3 does not see node1 as UP'):
+            node1._wait_for_gossip(marks, 'UP', timeout=0.2)
+        self.log(node3, 'INFO  [GossipStage:1] InetAddress /127.0.0.1 is now UP')
+        node1._wait_for_gossip(marks, 'UP', timeout=5)
@@ -0,0 +1,38 @@
+import io
+
+from ccmlib.log_errors import ErrorExtractor, iter_errors
+
+from . import ccmtest
+
+
+class TestErrorExtraction(ccmtest.Tester):
+
+    LOG = (b'INFO  [main] starting\n'
+           b'ERROR [main] boom\r\n'
+           b'java.lang.RuntimeException: boom\n'
+           b'\tat Foo.bar(Foo.java:1)\n'
+           b'WARN  [main] careful\n'
+           b'ERROR [main] bang')
+
+    def test_records_and_offsets(self):
+        records = list(iter_errors(io.BytesIO(self.LOG), chunk_size=7))
+        self.assertEqual([r.lines for r in records],
+                         [['ERROR [main] boom', 'java.lang.RuntimeException: boom', '\tat Foo.bar(Foo.java:1)'],
+                          ['ERROR [main] bang']])
+        first, last = records
+        self.assertEqual(self.LOG[first.start:first.end].splitlines()[0], b'ERROR [main] boom')
+        self.assertTrue(self.LOG[first.start:first.end].endswith(b'(Foo.java:1)\n'))
+        self.assertEqual(self.LOG[last.start:last.end], b'ERROR [main] bang')
+
+    def test_from_offset(self):
+        start = self.LOG.index(b'WARN')
+        self.assertEqual([r.lines for r in iter_errors(io.BytesIO(self.LOG), start)], [['ERROR [main] bang']])
+
+    def test_feed_returns_completed_record(self):
+        extractor = ErrorExtractor()
+        self.assertIsNone(extractor.feed('ERROR x\n', 0))
+        self.assertIsNone(extractor.feed('  at y\n', 8))
+        record = extractor.feed('INFO z\n', 15)
+        self.assertEqual(record.lines, ['ERROR x', '  at y'])
+        self.assertEqual(record.end, 15)
+        self.assertIsNone(extractor.flush())
@@ -0,0 +1,112 @@
+import json
+import os
+import shutil
+import tempfile
+
+from ccmlib.log_index import LogIndex
+
+from . import ccmtest
+from .fakes import make_node
+from .test_log_reader import roll
+
+
+class TestLogIndex(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.node = make_node(self.dir)
+        self.log = self.node.logfilename()
+        with open(self.log, 'w') as f:
+            f.write('INFO  [main] 2017-01-01 00:00:00,000 starting\n'
+                    'WARN  [main] 2017-01-01 00:00:01,000 careful\n'
+                    'INFO  [main] 2017-01-01 00:00:02,000 127.0.0.2 is now UP\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def append(self, text):
+        with open(self.log, 'a') as f:
+            f.write(text)
+
+    def test_grep_only_scans_new_bytes(self):
+        self.assertEqual(len(self.node.grep_log('now UP')), 1)
+        self.append('INFO  [main] 2017-01-01 00:00:03,000 127.0.0.3 is now UP\n')
+        matchings = self.node.grep_log(r'(127\.0\.0\.\d) is now UP')
+        self.assertEqual([m.group(1) for _, m in matchings], ['127.0.0.2', '127.0.0.3'])
+        index = self.node._log_index('system.log')
+        self.assertEqual(index.scanned(), os.path.getsize(self.log))
+
+    def test_index_is_persisted(self):
+        self.node.grep_log('now UP')
+        index = LogIndex.for_log(self.log)
+        self.assertEqual(index.scanned(), os.path.getsize(self.log))
+        self.assertEqual(len(index.level_offsets('WARN')), 1)
+        # Kept out of the logs directory
+        self.assertEqual(os.listdir(os.path.dirname(self.log)), ['system.log'])
+        self.assertTrue(os.path.exists(os.path.join(self.node.get_path(), 'log_index', 'system.log.json')))
+
+    def test_partial_last_line_is_matched(self):
+        self.append('INFO 127.0.0.4 is now UP')
+        self.assertEqual(len(self.node.grep_log('now UP')), 2)
+
+    def test_reset_when_log_is_replaced(self):
+        self.node.grep_log('now UP')
+        with open(self.log, 'w') as f:
+            f.write('INFO  [main] 2017-02-02 00:00:00,000 restarted\n')
+        self.assertEqual(self.node.grep_log('now UP'), [])
+        self.assertEqual(len(self.node.grep_log('restarted')), 1)
+
+    def test_errors_from_mark(self):
+        mark = self.node.mark_log()
+        self.append('ERROR [main] 2017-01-01 00:00:04,000 boom\n'
+                    '  at somewhere\n'
+                    'INFO  [main] 2017-01-01 00:00:05,000 fine\n')
+        self.assertEqual(self.node.grep_log_for_errors_from(seek_start=mark),
+                         [['ERROR [main] 2017-01-01 00:00:04,000 boom', '  at somewhere']])
+        self.assertEqual(self.node.grep_log_for_errors_from(seek_start=os.path.getsize(self.log)), [])
+
+    def test_state_holds_no_matches(self):
+        self.node.grep_log('now UP')
+        for i in range(100):
+            self.append('INFO  [main] 2017-01-01 00:00:03,000 127.0.0.3 is now UP\n')
+        self.assertEqual(len(self.node.grep_log('now UP')), 101)
+        index_file = os.path.join(self.node.get_path(), 'log_index', 'system.log.json')
+        with open(index_file) as f:
+            state = f.read()
+        # Only in the pattern key
+        self.assertEqual(state.count('now UP'), 1)
+        self.assertLess(len(state), 1000)
+        # The offsets are reloaded from their own file
+        self.assertEqual(len(LogIndex.for_log(self.log).grep('now UP')), 101)
+
+    def test_too_many_matches_are_not_indexed(self):
+        index = LogIndex.for_log(self.log)
+        index.MAX_MATCHES = 2
+        self.assertEqual(len(index.grep('INFO')), 2)
+        self.append('INFO  [main] 2017-01-01 00:00:03,000 fine\n')
+        self.assertEqual(len(index.grep('INFO')), 3)
+        self.append('INFO  [main] 2017-01-01 00:00:04,000 fine')
+        self.assertEqual(len(index.grep('INFO')), 4)
+        self.assertEqual([entry['list'] for entry in index._state['patterns'].values()], [None])
+
+    def test_archive_matches_are_offsets(self):
+        logs = os.path.dirname(self.log)
+        roll(self.log, os.path.join(logs, 'system.log.1.zip'))
+        self.append('INFO  [main] 2017-01-02 00:00:00,000 127.0.0.2 is now UP\n')
+        self.assertEqual(len(self.node.grep_log('now UP')), 2)
+        with open(os.path.join(self.node.get_path(), 'log_index', 'system.log.json')) as f:
+            archives = json.load(f)['archives']
+        self.assertEqual(len(archives), 1)
+        self.assertNotIn('is now UP', json.dumps(archives))
+        matchings = LogIndex.for_log(self.log).grep(r'(127\.0\.0\.\d) is now UP')
+        self.assertEqual([m.group(1) for _, m in matchings], ['127.0.0.2', '127.0.0.2'])
+
+    def test_interrupted_save(self):
+        self.node.grep_log('WARN')
+        warn_file = os.path.join(self.node.get_path(), 'log_index', 'system.log.WARN.bin')
+        with open(warn_file, 'ab') as f:
+            f.write(b'garbage!')
+        index = LogIndex.for_log(self.log)
+        self.append('WARN  [main] 2017-01-01 00:00:03,000 again\n')
+        self.assertEqual(len(index.grep('WARN')), 2)
+        self.assertEqual(len(LogIndex.for_log(self.log).level_offsets('WARN')), 2)
@@ -0,0 +1,182 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from ccmlib import log_reader
+from ccmlib.node import TimeoutError
+
+from . import ccmtest
+from .fakes import make_node
+
+
+def append_later(path, text, delay=0.2):
+    def append():
+        time.sleep(delay)
+        with open(path, 'a') as f:
+            f.write(text)
+    t = threading.Thread(target=append)
+    t.daemon = True
+    t.start()
+    return t
+
+
+class TestChangeWaiter(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, 'system.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_wakes_up_on_append(self):
+        open(self.log, 'w').close()
+        waiter = log_reader.change_waiter([self.log])
+        try:
+            append_later(self.log, 'INFO hello\n')
+            start = time.time()
+            self.assertTrue(waiter.wait(5))
+            self.assertLess(time.time() - start, 2)
+        finally:
+            waiter.close()
+
+    def test_wakes_up_on_creation(self):
+        waiter = log_reader.change_waiter([self.log])
+        try:
+            append_later(self.log, 'INFO hello\n')
+            self.assertTrue(waiter.wait(5))
+        finally:
+            waiter.close()
+
+    def test_polling_backoff(self):
+        waiter = log_reader.PollingChangeWaiter(min_delay=0.01, max_delay=0.04)
+        waiter.wait(1)
+        waiter.wait(1)
+        waiter.wait(1)
+        self.assertEqual(waiter.delay, 0.04)
+        waiter.reset()
+        self.assertEqual(waiter.delay, 0.01)
+
+
+class TestWatchLogFor(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.node = make_node(self.dir)
+        self.log = self.node.logfilename()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_returns_when_line_is_flushed(self):
+        with open(self.log, 'w') as f:
+            f.write('INFO starting\n')
+        append_later(self.log, 'INFO Starting listening for CQL clients\n')
+        start = time.time()
+        line, m = self.node.watch_log_for('Starting listening', timeout=10)
+        self.assertLess(time.time() - start, 2)
+        self.assertIn('CQL clients', line)
+
+    def test_from_mark(self):
+        with open(self.log, 'w') as f:
+            f.write('INFO 127.0.0.2 is now UP\n')
+        mark = self.node.mark_log()
+        append_later(self.log, 'INFO 127.0.0.3 is now UP\n')
+        matchings = self.node.watch_log_for(['now UP'], from_mark=mark, timeout=10)
+        self.assertEqual(len(matchings), 1)
+        self.assertIn('127.0.0.3', matchings[0][0])
+
+    def test_waits_for_end_of_line(self):
+        with open(self.log, 'w') as f:
+            f.write('INFO took 12')
+        append_later(self.log, '3 ms\n')
+        line, m = self.node.watch_log_for(r'took (\d+) ms', timeout=10)
+        self.assertEqual(m.group(1), '123')
+
+    def test_timeout(self):
+        open(self.log, 'w').close()
+        with self.assertRaises(TimeoutError):
+            self.node.watch_log_for('never', timeout=0.5)
+
+
+def roll(log, archive):
+    """
+    Rolls the log the way logback does: compresses it into the archive and
+    starts a new, empty active file.
+    """
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.write(log, os.path.basename(log))
+    os.remove(log)
+    open(log, 'w').close()
+
+
+class TestRotatingLog(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.node = make_node(self.dir)
+        self.log = self.node.logfilename()
+        self.logs = os.path.dirname(self.log)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text, path=None):
+        with open(path or self.log, 'a') as f:
+            f.write(text)
+
+    def test_mark_is_an_offset(self):
+        self.write('INFO first\n')
+        mark = self.node.mark_log()
+        self.assertEqual(mark, len('INFO first\n'))
+        self.assertIsNotNone(mark.generation)
+        self.assertEqual(self.node.mark_log('missing.log'), 0)
+
+    def test_lines_across_archives(self):
+        self.write('INFO one\nINFO two\n')
+        mark = self.node.mark_log()
+        self.write('INFO three\n')
+        roll(self.log, os.path.join(self.logs, 'system.log.1.zip'))
+        self.write('INFO four\n')
+        with gzip.open(os.path.join(self.logs, 'system.log.0.gz'), 'wb') as f:
+            f.write(b'INFO zero\n')
+        old = time.time() - 100
+        os.utime(os.path.join(self.logs, 'system.log.0.gz'), (old, old))
+
+        log = log_reader.RotatingLog(self.log)
+        self.assertEqual([line for _, _, _, line in log.lines()],
+                         ['INFO zero\n', 'INFO one\n', 'INFO two\n', 'INFO three\n', 'INFO four\n'])
+        self.assertEqual([line for _, _, _, line in log.lines(mark)], ['INFO three\n', 'INFO four\n'])
+        # A plain offset refers to the active file
+        self.assertEqual([line for _, _, _, line in log.lines(0)], ['INFO four\n'])
+
+    def test_grep_log_includes_archives(self):
+        self.write('INFO one\nWARN two\n')
+        self.assertEqual(len(self.node.grep_log('WARN')), 1)
+        roll(self.log, os.path.join(self.logs, 'system.log.1.zip'))
+        self.write('WARN three\n')
+        self.assertEqual([line for line, _ in self.node.grep_log('WARN')], ['WARN two\n', 'WARN three\n'])
+        # Archive matches are remembered
+        self.assertEqual([line for line, _ in self.node.grep_log('WARN')], ['WARN two\n', 'WARN three\n'])
+
+    def test_watch_from_rolled_mark(self):
+        self.write('INFO starting\n')
+        mark = self.node.mark_log()
+        self.write('INFO 127.0.0.2 is now UP\n')
+        roll(self.log, os.path.join(self.logs, 'system.log.1.zip'))
+        append_later(self.log, 'INFO 127.0.0.3 is now UP\n')
+        matchings = self.node.watch_log_for(['127.0.0.2.* now UP', '127.0.0.3.* now UP'], from_mark=mark, timeout=10)
+        self.assertEqual(len(matchings), 2)
+
+    def test_errors_from_rolled_mark(self):
+        self.write('INFO starting\n')
+        self.node.mark_log_for_errors()
+        self.write('ERROR [main] boom\n')
+        roll(self.log, os.path.join(self.logs, 'system.log.1.zip'))
+        self.write('ERROR [main] bang\n')
+        errors = self.node.grep_log_for_errors()
+        self.assertEqual(len(errors), 2)
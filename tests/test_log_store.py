@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from ccmlib.log_store import LogStore, parse_line
+
+from . import ccmtest
+from .fakes import make_node
+from .test_log_reader import roll
+
+LOG = ('INFO  [main] 2017-01-01 00:00:00,000 CassandraDaemon.java:100 - Starting\n'
+       'WARN  [ScheduledTasks:1] 2017-01-01 00:00:01,500 GCInspector.java:282 - G1 Young Generation GC in 800ms\n'
+       'ERROR [CompactionExecutor:2] 2017-01-01 00:00:02,000 CassandraDaemon.java:207 - Exception in thread\n'
+       'java.lang.RuntimeException: boom\n'
+       '\tat org.apache.cassandra.db.compaction.CompactionTask.run(CompactionTask.java:1)\n'
+       'INFO  [main] 2017-01-01 00:00:03,000 StorageService.java:1449 - JOINING\n')
+
+
+class TestLogStore(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.node = make_node(self.dir)
+        self.log = self.node.logfilename()
+        self.append(LOG)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def append(self, text):
+        with open(self.log, 'a') as f:
+            f.write(text)
+
+    def test_parse_line(self):
+        record = parse_line('WARN  [ScheduledTasks:1] 2017-01-01 00:00:01,500 GCInspector.java:282 - G1 Young GC\n')
+        self.assertEqual(record.level, 'WARN')
+        self.assertEqual(record.thread, 'ScheduledTasks:1')
+        self.assertEqual(record.timestamp, datetime(2017, 1, 1, 0, 0, 1, 500000))
+        self.assertEqual((record.file, record.line), ('GCInspector.java', 282))
+        self.assertEqual(record.message, 'G1 Young GC')
+        old = parse_line(' INFO [main] 2013-01-01 00:00:00,000 CassandraDaemon.java (line 101) Logging initialized')
+        self.assertEqual((old.file, old.line, old.message), ('CassandraDaemon.java', 101, 'Logging initialized'))
+        self.assertIsNone(parse_line('\tat Foo.bar(Foo.java:1)'))
+
+    def test_queries(self):
+        errors = self.node.query_log(level='ERROR')
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].thread, 'CompactionExecutor:2')
+        self.assertIn('RuntimeException: boom', errors[0].message)
+        self.assertEqual([r.line for r in self.node.query_log(logger='org.apache.cassandra.service.CassandraDaemon')], [100, 207])
+        self.assertEqual(len(self.node.query_log(since=datetime(2017, 1, 1, 0, 0, 1, 500000), until=datetime(2017, 1, 1, 0, 0, 3))), 2)
+        self.assertEqual([r.level for r in self.node.query_log(level=['WARN', 'ERROR'], regex='GC in \\d+ms')], ['WARN'])
+
+    def test_incremental_and_persistent(self):
+        self.assertEqual(len(self.node.query_log()), 4)
+        self.append('INFO  [main] 2017-01-01 00:00:04,000 StorageService.java:1449 - NORMAL\n')
+        store = self.node.log_store()
+        self.assertEqual(len(store.query()), 5)
+        # The last entry is only stored once the next one starts
+        self.assertEqual(len(store), 4)
+        reloaded = LogStore.for_log(self.log)
+        self.assertEqual(len(reloaded), 4)
+        self.assertEqual([r.message for r in reloaded.query()][-2:], ['JOINING', 'NORMAL'])
+        self.assertEqual(os.listdir(os.path.dirname(self.log)), ['system.log'])
+
+    def test_follows_roll(self):
+        self.assertEqual(len(self.node.query_log()), 4)
+        self.append('INFO  [main] 2017-01-01 00:00:04,000 StorageService.java:1449 - before roll\n')
+        roll(self.log, os.path.join(os.path.dirname(self.log), 'system.log.1.zip'))
+        self.append('INFO  [main] 2017-01-01 00:00:05,000 StorageService.java:1449 - after roll\n')
+        self.assertEqual([r.message for r in self.node.query_log()][-3:], ['JOINING', 'before roll', 'after roll'])
+
+    def test_rebuilt_when_replaced(self):
+        self.assertEqual(len(self.node.query_log()), 4)
+        with open(self.log, 'w') as f:
+            f.write('INFO  [main] 2018-01-01 00:00:00,000 CassandraDaemon.java:100 - Restarted\n')
+        self.assertEqual([r.message for r in self.node.query_log()], ['Restarted'])
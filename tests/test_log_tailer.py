@@ -0,0 +1,193 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from ccmlib.cluster import Cluster
+from ccmlib import log_tailer
+from ccmlib.log_tailer import LogSubscription, LogTailer
+
+from . import ccmtest
+from .fakes import make_node
+from .test_log_reader import append_later
+
+
+class TestLogTailer(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, 'system.log')
+        self.tailer = LogTailer()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_dispatches_to_many_subscriptions(self):
+        with open(self.log, 'w') as f:
+            f.write('INFO 127.0.0.2 is now UP\n')
+        subs = self.tailer.add([LogSubscription(self.log, ['127.0.0.%d.* now UP' % i]) for i in (2, 3, 4)])
+        append_later(self.log, 'INFO 127.0.0.3 is now UP\nINFO 127.0.0.4 is now UP\n')
+        for sub in subs:
+            self.assertTrue(sub.wait(5))
+        self.assertIn('127.0.0.4', subs[2].matchings[0][0])
+
+    def test_catches_up_from_earlier_mark(self):
+        with open(self.log, 'w') as f:
+            f.write('INFO first\nINFO second\n')
+        live = self.tailer.subscribe(self.log, ['never'], from_mark=len('INFO first\n'))
+        late = self.tailer.subscribe(self.log, ['first', 'third'], from_mark=0)
+        append_later(self.log, 'INFO third\n')
+        self.assertTrue(late.wait(5))
+        self.assertEqual([line for line, _ in late.matchings], ['INFO first\n', 'INFO third\n'])
+        self.tailer.remove(live)
+
+    def test_ignores_lines_before_mark(self):
+        with open(self.log, 'w') as f:
+            f.write('INFO target\n')
+        sub = self.tailer.subscribe(self.log, ['target'], from_mark=os.path.getsize(self.log))
+        self.assertFalse(sub.wait(0.2))
+        self.tailer.remove(sub)
+
+    def test_waits_for_file_creation(self):
+        sub = self.tailer.subscribe(self.log, ['hello'])
+        append_later(self.log, 'INFO hello\n')
+        self.assertTrue(sub.wait(5))
+
+    def test_failure_ends_waits(self):
+        with open(self.log, 'w') as f:
+            f.write('INFO first\n')
+        sub = self.tailer.subscribe(self.log, ['never'])
+
+        def fail():
+            raise IOError('boom')
+        self.tailer._files[self.log].poll = fail
+        append_later(self.log, 'INFO second\n')
+        start = time.time()
+        with self.assertRaises(IOError):
+            sub.wait(5)
+        self.assertLess(time.time() - start, 3)
+        self.assertEqual(str(sub.error), 'boom')
+        # The next subscriptions get a new thread
+        later = self.tailer.subscribe(self.log, ['second'])
+        self.assertTrue(later.wait(5))
+
+    def test_failure_ends_watch_log_for(self):
+        node = make_node(self.dir)
+        log = node.logfilename()
+        open(log, 'w').close()
+        tailer = node.cluster.log_tailer()
+        errors = []
+
+        def break_tailer():
+            while not tailer._files:
+                time.sleep(0.01)
+            tailed = tailer._files[log]
+
+            def fail():
+                errors.append(True)
+                raise IOError('boom')
+            tailed.poll = fail
+            with open(log, 'a') as f:
+                f.write('INFO more\n')
+        t = threading.Thread(target=break_tailer)
+        t.daemon = True
+        t.start()
+        start = time.time()
+        with self.assertRaises(IOError):
+            node.watch_log_for('never', timeout=30)
+        self.assertLess(time.time() - start, 10)
+        self.assertTrue(errors)
+
+    def test_follows_replaced_file(self):
+        with open(self.log, 'w') as f:
+            f.write('INFO old\n')
+        sub = self.tailer.subscribe(self.log, ['new'])
+
+        def replace():
+            time.sleep(0.2)
+            os.rename(self.log, self.log + '.1')
+            with open(self.log, 'w') as f:
+                f.write('INFO new\n')
+        threading.Thread(target=replace).start()
+        self.assertTrue(sub.wait(5))
+
+    def test_callback_sees_every_line(self):
+        lines = []
+        sub = self.tailer.subscribe(self.log, [], callback=lambda line, offset: lines.append((offset, line)))
+        with open(self.log, 'w') as f:
+            f.write('a\nb\n')
+        self.tailer.poll()
+        self.assertEqual(lines, [(0, 'a\n'), (2, 'b\n')])
+        self.tailer.remove(sub)
+
+
+class TestLogSubscription(ccmtest.Tester):
+
+    def test_reads_are_bounded(self):
+        sub = LogSubscription('system.log', ['never'])
+        for i in range(1000):
+            sub.feed('INFO line {}\n'.format(i), i)
+        self.assertEqual(len(sub.reads), log_tailer.READS_BUFFER_LINES)
+        self.assertEqual(sub.reads[-1], 'INFO line 999\n')
+
+    def test_line_matching_several_patterns(self):
+        sub = LogSubscription('system.log', ['127.0.0.%d.* now UP' % i for i in range(2, 30)] + ['now'])
+        sub.feed('INFO 127.0.0.5 is now UP\n', 0)
+        self.assertEqual(len(sub.matchings), 2)
+        self.assertEqual(len(sub.pending), 27)
+        for i in range(2, 30):
+            sub.feed('INFO 127.0.0.{} is now UP\n'.format(i), i)
+        self.assertTrue(sub.done())
+        self.assertEqual([m.re.pattern for _, m in sub.matchings][:2], ['127.0.0.5.* now UP', 'now'])
+
+    def test_patterns_that_cannot_be_combined(self):
+        sub = LogSubscription('system.log', [r'(\w+) again \1', re.compile('shout', re.I), r'took (\d+) ms'])
+        sub.feed('INFO SHOUT\n', 0)
+        sub.feed('INFO took 12 ms\n', 1)
+        sub.feed('INFO twice again twice\n', 2)
+        self.assertTrue(sub.done())
+        self.assertEqual(sub.matchings[1][1].group(1), '12')
+
+
+class TestActivelyWatchLogsForError(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cluster = Cluster.__new__(Cluster)
+        self.cluster._log_tailer = LogTailer()
+        self.cluster.nodes = {}
+        node = make_node(self.dir)
+        node.cluster = self.cluster
+        node.cluster.get_path = lambda: self.dir
+        self.cluster.nodes[node.name] = node
+        self.log = node.logfilename()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_reports_new_errors(self):
+        with open(self.log, 'w') as f:
+            f.write('ERROR first\n')
+        reported = []
+        watcher = self.cluster.actively_watch_logs_for_error(reported.append, interval=0.1)
+        time.sleep(0.3)
+        with open(self.log, 'a') as f:
+            f.write('INFO fine\nERROR second\n  at somewhere\n')
+        watcher.join()
+        errors = [e for report in reported for e in report['node1']]
+        self.assertEqual(errors, [['ERROR first'], ['ERROR second', '  at somewhere']])
+
+    def test_reports_error_once_log_is_idle(self):
+        with open(self.log, 'w') as f:
+            f.write('ERROR first\n  at somewhere\n')
+        reported = []
+        watcher = self.cluster.actively_watch_logs_for_error(reported.append, interval=0.1)
+        try:
+            deadline = time.time() + 5
+            while not reported and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(reported, [{'node1': [['ERROR first', '  at somewhere']]}])
+        finally:
+            watcher.join()
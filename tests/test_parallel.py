@@ -0,0 +1,189 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+
+from mock import patch
+
+from ccmlib import parallel
+from ccmlib.cluster import Cluster
+from ccmlib.node import NodeError, Status, TimeoutError
+from ccmlib.parallel import Deadline, ParallelError
+
+from . import ccmtest
+from .fakes import make_install_dir, make_node
+
+FakeNode = namedtuple('FakeNode', 'name')
+
+
+class TestParallel(ccmtest.Tester):
+
+    def test_concurrency_limit(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+        started = []
+
+        def task(name):
+            with lock:
+                started.append(name)
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return name.upper()
+
+        names = ['node{}'.format(i) for i in range(1, 7)]
+        results = parallel.run([(FakeNode(n), lambda n=n: task(n)) for n in names], concurrency=2)
+        self.assertEqual(list(results.items()), [(n, n.upper()) for n in names])
+        self.assertEqual(peak[0], 2)
+        # Tasks start in the order they are given
+        self.assertEqual(started[:2], names[:2])
+
+    def test_runs_concurrently(self):
+        start = time.time()
+        parallel.run([(FakeNode('node{}'.format(i)), lambda: time.sleep(0.2)) for i in range(5)])
+        self.assertLess(time.time() - start, 0.8)
+
+    def test_errors_by_node(self):
+        def fail(error):
+            raise error
+        tasks = [(FakeNode('node1'), lambda: 1), (FakeNode('node2'), partial(fail, RuntimeError('boom'))),
+                 (FakeNode('node3'), lambda: 3), (FakeNode('node4'), partial(fail, NodeError('Problem stopping node node4')))]
+        with self.assertRaises(NodeError) as cm:
+            parallel.run(tasks)
+        self.assertIsInstance(cm.exception, ParallelError)
+        self.assertNotIsInstance(cm.exception, TimeoutError)
+        self.assertEqual(list(cm.exception.errors), ['node2', 'node4'])
+        self.assertEqual(dict(cm.exception.results), {'node1': 1, 'node3': 3})
+        self.assertIn('[node2] RuntimeError: boom', str(cm.exception))
+
+    def test_single_error(self):
+        # The error of the node is raised as is
+        def fail():
+            raise NodeError('Problem stopping node node2')
+        with self.assertRaises(NodeError) as cm:
+            parallel.run([(FakeNode('node1'), lambda: 1), (FakeNode('node2'), fail)])
+        self.assertNotIsInstance(cm.exception, ParallelError)
+        self.assertEqual(str(cm.exception), 'Problem stopping node node2')
+
+    def test_timeouts(self):
+        def fail(name):
+            raise TimeoutError('{} did not start'.format(name))
+        with self.assertRaises(TimeoutError) as cm:
+            parallel.run([(FakeNode(name), partial(fail, name)) for name in ('node1', 'node2')])
+        self.assertIsInstance(cm.exception, ParallelError)
+        self.assertEqual(list(cm.exception.errors), ['node1', 'node2'])
+
+    def test_deadline(self):
+        deadline = Deadline(0.1)
+        self.assertFalse(deadline.expired())
+        self.assertGreater(deadline.remaining(), 0)
+        time.sleep(0.15)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(deadline.remaining(), 0)
+
+
+class TestStop(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def node_process(self, name, ignore_term=False):
+        script = "import signal, time\n"
+        if ignore_term:
+            script += "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+        script += "print('ready')\nimport sys; sys.stdout.flush()\ntime.sleep(60)\n"
+        process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+        process.stdout.readline()
+        # Reap the process as soon as it exits so that it stops looking alive
+        reaper = threading.Thread(target=process.wait)
+        reaper.daemon = True
+        reaper.start()
+        node = make_node(self.dir, name)
+        node.pid = process.pid
+        node.status = Status.UP
+        node._update_config = lambda: None
+        return node
+
+    def test_grace_period(self):
+        node = self.node_process('node1', ignore_term=True)
+        start = time.time()
+        self.assertTrue(node.stop(grace_period=0.5))
+        self.assertFalse(node.is_running())
+        self.assertLess(time.time() - start, 5)
+
+    def test_concurrent_stop(self):
+        nodes = [self.node_process('node{}'.format(i), ignore_term=True) for i in range(1, 4)]
+        nodes.append(self.node_process('node4'))
+        start = time.time()
+        results = parallel.run([(node, partial(node.stop, grace_period=1)) for node in nodes])
+        # The nodes were waited on at the same time rather than one after the other
+        self.assertLess(time.time() - start, 3)
+        self.assertEqual(list(results.values()), [True] * 4)
+        self.assertFalse(any(node.is_running() for node in nodes))
+
+    def test_stop_error(self):
+        cluster = Cluster(self.dir, 'test', install_dir=make_install_dir(os.path.join(self.dir, 'cassandra')))
+        running = self.node_process('node1')
+
+        def fail(**kwargs):
+            raise NodeError('Problem stopping node node2')
+        stuck = make_node(self.dir, 'node2')
+        stuck.stop = fail
+        with self.assertRaises(NodeError) as cm:
+            cluster.stop_nodes([running, stuck])
+        self.assertEqual(str(cm.exception), 'Problem stopping node node2')
+        self.assertFalse(running.is_running())
+
+
+class TestStart(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cluster = Cluster(self.dir, 'test', install_dir=make_install_dir(os.path.join(self.dir, 'cassandra')))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def add_node(self, name, error):
+        node = make_node(self.cluster.get_path(), name)
+        node.cluster = self.cluster
+        node.start = lambda **kwargs: None
+
+        def watch_log_for(*args, **kwargs):
+            raise error
+        node.watch_log_for = watch_log_for
+        self.cluster.nodes[name] = node
+        return node
+
+    @patch('ccmlib.common.get_jdk_version', return_value='1.8')
+    @patch('ccmlib.common.assert_socket_available')
+    @patch('ccmlib.common.assert_jdk_valid_for_cassandra_version')
+    def test_exited_nodes(self, *mocks):
+        # As before starts were parallel, a node process that exits makes
+        # start return None
+        self.add_node('node1', RuntimeError('node1 exited'))
+        self.assertIsNone(self.cluster.start())
+        self.add_node('node2', RuntimeError('node2 exited'))
+        self.assertIsNone(self.cluster.start())
+
+    @patch('ccmlib.common.get_jdk_version', return_value='1.8')
+    @patch('ccmlib.common.assert_socket_available')
+    @patch('ccmlib.common.assert_jdk_valid_for_cassandra_version')
+    def test_other_errors(self, *mocks):
+        self.add_node('node1', RuntimeError('node1 exited'))
+        self.add_node('node2', TimeoutError('node2 did not start'))
+        with self.assertRaises(ParallelError) as cm:
+            self.cluster.start()
+        self.assertEqual(dict((name, type(e)) for name, e in cm.exception.errors.items()),
+                         {'node1': RuntimeError, 'node2': TimeoutError})
@@ -0,0 +1,116 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ccmlib import process
+from ccmlib.node import Status
+from ccmlib.process import ProcessHandle
+
+from . import ccmtest
+from .fakes import make_node
+
+
+def spawn(ignore_term=False):
+    script = "import signal, sys, time\n"
+    if ignore_term:
+        script += "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+    script += "print('ready')\nsys.stdout.flush()\ntime.sleep(60)\n"
+    p = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+    p.stdout.readline()
+    return p
+
+
+class TestProcessHandle(ccmtest.Tester):
+
+    def test_wait_for_exit(self):
+        p = spawn()
+        handle = ProcessHandle(p.pid)
+        self.assertTrue(handle.is_running())
+        self.assertFalse(handle.wait_for_exit(0.05))
+        os.kill(p.pid, signal.SIGTERM)
+        start = time.time()
+        self.assertTrue(handle.wait_for_exit(10))
+        self.assertLess(time.time() - start, 1)
+        self.assertFalse(handle.is_running())
+        p.stdout.close()
+
+    def test_reused_pid(self):
+        p = spawn()
+        # A handle on whatever process had this pid before
+        handle = ProcessHandle(p.pid, started=process.start_time(p.pid) - 1)
+        self.assertFalse(handle.is_running())
+        self.assertTrue(handle.wait_for_exit(0))
+        p.kill()
+        p.wait()
+        p.stdout.close()
+
+    def test_gone(self):
+        p = spawn()
+        p.kill()
+        p.wait()
+        p.stdout.close()
+        self.assertIsNone(process.start_time(p.pid))
+        self.assertFalse(ProcessHandle(p.pid).is_running())
+
+
+class TestNodeStop(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_stop_latency(self):
+        p = spawn()
+        node = make_node(self.dir)
+        node.pid, node.pid_start_time = p.pid, process.start_time(p.pid)
+        node.status = Status.UP
+        node._update_config = lambda: None
+        start = time.time()
+        self.assertTrue(node.stop())
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(node.status, Status.DOWN)
+        self.assertIsNone(node.pid)
+        p.wait()
+        p.stdout.close()
+
+
+class TestPidfiles(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_wait_for_pidfiles(self):
+        nodes = [make_node(self.dir, 'node%d' % i) for i in (1, 2, 3)]
+        for node in nodes:
+            node.get_base_cassandra_version = lambda: 3.11
+        paths = [node._pidfile() for node in nodes]
+        # An empty pidfile is not ready
+        open(paths[0], 'w').close()
+
+        def write_later(path, content, delay):
+            def write():
+                time.sleep(delay)
+                with open(path, 'w') as f:
+                    f.write(content)
+            t = threading.Thread(target=write)
+            t.daemon = True
+            t.start()
+        write_later(paths[0], '123', 0.3)
+        write_later(paths[1], '456\n', 0.1)
+        start = time.time()
+        pids = process.wait_for_pidfiles(dict((node._pidfile(), node._read_pid) for node in nodes[:2]), timeout=10)
+        self.assertLess(time.time() - start, 1.5)
+        self.assertEqual(pids, {paths[0]: 123, paths[1]: 456})
+
+        pids = process.wait_for_pidfiles({paths[2]: nodes[2]._read_pid}, timeout=0.2)
+        self.assertEqual(pids, {paths[2]: None})
@@ -0,0 +1,173 @@
+import socket
+import struct
+import threading
+import time
+
+from ccmlib import readiness
+from ccmlib.readiness import Target
+
+from . import ccmtest
+
+
+def string(s):
+    return struct.pack('>H', len(s)) + s
+
+
+class FakeNativeTransport(threading.Thread):
+
+    """
+    Answers OPTIONS and STARTUP like a Cassandra node supporting protocol
+    versions 3 up to max_version, optionally closing the connections it
+    accepts for a while first.
+    """
+
+    def __init__(self, max_version=4, mute_for=0, port=0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.max_version = max_version
+        self.mute_until = time.time() + mute_for
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', port))
+        self.server.listen(16)
+        self.address = self.server.getsockname()
+        self.versions = []
+
+    def respond(self, conn, version, opcode, body=b''):
+        conn.sendall(struct.pack('>BBhBi', 0x80 | version, 0, 0, opcode, len(body)) + body)
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                header = conn.recv(9)
+                if not header:
+                    return
+                version = header[0]
+                self.versions.append(version)
+                if version > self.max_version:
+                    message = b'Invalid or unsupported protocol version (%d)' % version
+                    self.respond(conn, self.max_version, 0x00, struct.pack('>i', 0x000A) + string(message))
+                    return
+                opcode = header[4]
+                length = struct.unpack('>i', header[-4:])[0]
+                if length:
+                    conn.recv(length)
+                if opcode == 0x05:
+                    self.respond(conn, version, 0x06, struct.pack('>H', 1) + string(b'CQL_VERSION') + struct.pack('>H', 1) + string(b'3.4.4'))
+                elif opcode == 0x01:
+                    self.respond(conn, version, 0x02)
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            if time.time() < self.mute_until:
+                conn.close()
+                continue
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self.server.close()
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class FakeNode(object):
+
+    def __init__(self, address, client_encryption_options):
+        self.name = 'node1'
+        self.network_interfaces = {'binary': address}
+        self.client_encryption_options = client_encryption_options
+
+    def get_cassandra_version(self):
+        return '3.11.4'
+
+    def get_conf_option(self, option):
+        return self.client_encryption_options if option == 'client_encryption_options' else None
+
+
+class TestReadiness(ccmtest.Tester):
+
+    def test_handshake(self):
+        servers = [FakeNativeTransport() for _ in range(5)]
+        for server in servers:
+            server.start()
+        try:
+            start = time.time()
+            results = readiness.probe([Target('node%d' % i, s.address, 'cql', 4) for i, s in enumerate(servers)], timeout=10)
+            self.assertLess(time.time() - start, 2)
+            self.assertEqual(list(results.values()), [None] * 5)
+            self.assertEqual(servers[0].versions, [4, 4])
+        finally:
+            for server in servers:
+                server.close()
+
+    def test_version_negotiation(self):
+        server = FakeNativeTransport(max_version=3)
+        server.start()
+        try:
+            self.assertEqual(readiness.probe([Target('node1', server.address, 'cql', 4)], timeout=10), {'node1': None})
+            self.assertEqual(server.versions, [4, 3, 3])
+        finally:
+            server.close()
+
+    def test_not_listening_yet(self):
+        port = free_port()
+        started = []
+
+        def start_later():
+            time.sleep(0.3)
+            server = FakeNativeTransport(port=port)
+            server.start()
+            started.append(server)
+        threading.Thread(target=start_later, daemon=True).start()
+        try:
+            results = readiness.probe([Target('node1', ('127.0.0.1', port), 'cql', 4),
+                                       Target('node2', ('127.0.0.1', port), 'tcp', None)], timeout=10)
+            self.assertEqual(dict(results), {'node1': None, 'node2': None})
+        finally:
+            for server in started:
+                server.close()
+
+    def test_not_serving(self):
+        # Accepts connections, but closes them
+        server = FakeNativeTransport(mute_for=60)
+        server.start()
+        try:
+            start = time.time()
+            results = readiness.probe([Target('node1', server.address, 'cql', 4)], timeout=0.5)
+            self.assertLess(time.time() - start, 1.5)
+            self.assertIsNotNone(results['node1'])
+            # A plain connect succeeds
+            self.assertEqual(readiness.probe([Target('node1', server.address, 'tcp', None)], timeout=1), {'node1': None})
+        finally:
+            server.close()
+
+    def test_protocol_versions(self):
+        self.assertEqual(readiness.native_protocol_version('3.11.4'), 4)
+        self.assertEqual(readiness.native_protocol_version('2.1.20'), 3)
+        self.assertEqual(readiness.native_protocol_version('1.2.19'), 1)
+
+    def test_client_encryption(self):
+        # Accepts connections, but doesn't speak plaintext CQL, like a node
+        # requiring TLS
+        server = FakeNativeTransport(mute_for=60)
+        server.start()
+        try:
+            node = FakeNode(server.address, {'enabled': True, 'keystore': 'keystore.jks'})
+            self.assertEqual(readiness.native_transport(node).kind, 'tcp')
+            start = time.time()
+            self.assertTrue(readiness.wait_for_native_transport([node], timeout=5))
+            self.assertLess(time.time() - start, 2)
+            self.assertEqual(readiness.native_transport(FakeNode(server.address, {'enabled': False})).kind, 'cql')
+            self.assertEqual(readiness.native_transport(FakeNode(server.address, None)).kind, 'cql')
+        finally:
+            server.close()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+from distutils.version import LooseVersion
+
+from ccmlib import resources
+from ccmlib.cluster import Cluster
+from ccmlib.common import ArgumentError
+
+from . import ccmtest
+from .fakes import make_install_dir
+
+
+class TestResources(ccmtest.Tester):
+
+    def test_host(self):
+        self.assertGreater(resources.host_memory(), 0)
+        self.assertGreater(resources.host_cpus(), 0)
+
+    def test_split(self):
+        plan = resources.plan(4, LooseVersion('3.11.4'), budget=0.5, memory=16384, cpus=8)
+        # 2GB per node, half of it heap
+        self.assertEqual(plan['max_heap_size'], '1024M')
+        self.assertEqual(plan['heap_newsize'], '200M')
+        self.assertEqual(plan['nodes'], 4)
+        options = plan['config_options']
+        self.assertEqual(options['concurrent_reads'], 16)
+        self.assertEqual(options['concurrent_writes'], 16)
+        self.assertEqual(options['concurrent_compactors'], 2)
+        self.assertEqual(options['memtable_heap_space_in_mb'], 256)
+        self.assertEqual(options['compaction_throughput_mb_per_sec'], 64)
+
+    def test_dense_host(self):
+        plan = resources.plan(16, LooseVersion('4.1.0'), budget=0.5, memory=8192, cpus=4)
+        self.assertEqual(plan['max_heap_size'], '{}M'.format(resources.MIN_HEAP_MB))
+        self.assertEqual(plan['heap_newsize'], '64M')
+        options = plan['config_options']
+        self.assertEqual(options['concurrent_reads'], 8)
+        self.assertEqual(options['concurrent_compactors'], 1)
+        # Cassandra 4.1 names, with units
+        self.assertEqual(options['memtable_heap_space'], '64MiB')
+        self.assertEqual(options['compaction_throughput'], '16MiB/s')
+        self.assertNotIn('memtable_heap_space_in_mb', options)
+
+    def test_pre_2_1(self):
+        plan = resources.plan(3, LooseVersion('2.0.17'), budget=0.5, memory=12288, cpus=6)
+        options = plan['config_options']
+        # Options that appeared in 2.1
+        self.assertNotIn('concurrent_counter_writes', options)
+        self.assertNotIn('memtable_heap_space_in_mb', options)
+        self.assertEqual(options['concurrent_writes'], 16)
+        self.assertEqual(options['compaction_throughput_mb_per_sec'], 85)
+        self.assertNotIn('concurrent_counter_writes', resources.plan(3, LooseVersion('1.2.19'), memory=12288, cpus=6)['config_options'])
+
+    def test_invalid(self):
+        with self.assertRaises(ArgumentError):
+            resources.plan(0, LooseVersion('3.11'), memory=1024, cpus=1)
+        with self.assertRaises(ArgumentError):
+            resources.plan(1, LooseVersion('3.11'), budget=1.5, memory=1024, cpus=1)
+
+    def test_describe(self):
+        plan = resources.plan(2, LooseVersion('3.0'), memory=4096, cpus=2)
+        lines = resources.describe(plan)
+        self.assertEqual(lines[0], '2 nodes sharing 50% of 4096MB and 2 CPUs')
+        self.assertIn('  MAX_HEAP_SIZE=512M', lines)
+        self.assertIn('  concurrent_reads: 8', lines)
+
+    def test_drop_plan(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            cluster = Cluster(tmp, 'test', install_dir=make_install_dir(os.path.join(tmp, 'cassandra')))
+            cluster.populate(2)
+            node1 = cluster.nodelist()[0]
+            cluster.plan_resources(0.5, memory=8192, cpus=4)
+            self.assertEqual(node1.get_conf_option('memtable_heap_space_in_mb'), 256)
+            self.assertEqual(node1.get_conf_option('concurrent_writes'), 16)
+            cluster.plan_resources(None)
+            self.assertIsNone(cluster.resource_plan)
+            self.assertIsNone(node1.get_conf_option('memtable_heap_space_in_mb'))
+            # Back to the install's value
+            self.assertEqual(node1.get_conf_option('concurrent_writes'), 32)
+        finally:
+            shutil.rmtree(tmp)
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from ccmlib.cluster import Cluster
+from ccmlib.common import ArgumentError
+from ccmlib.log_tailer import LogTailer
+from ccmlib.timeline import format_entry, parse_gc_log
+
+from . import ccmtest
+from .fakes import make_node
+from .test_log_reader import roll
+
+
+class TestTimeline(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cluster = Cluster.__new__(Cluster)
+        self.cluster._log_tailer = LogTailer()
+        self.cluster.nodes = {}
+        for name in ('node1', 'node2'):
+            node = make_node(self.dir, name)
+            node.cluster = self.cluster
+            self.cluster.nodes[name] = node
+        self.cluster.get_path = lambda: self.dir
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, node, text, name='system.log'):
+        with open(os.path.join(self.cluster.nodes[node].get_path(), 'logs', name), 'a') as f:
+            f.write(text)
+
+    def test_interleaves_nodes(self):
+        self.write('node1', 'INFO  [main] 2017-01-01 00:00:00,000 Gossiper.java:1 - a\n'
+                            'INFO  [main] 2017-01-01 00:00:02,000 Gossiper.java:1 - c\n')
+        roll(self.cluster.nodes['node1'].logfilename(), os.path.join(self.dir, 'node1', 'logs', 'system.log.1.zip'))
+        self.write('node1', 'ERROR [main] 2017-01-01 00:00:04,000 Gossiper.java:1 - e\n\tat trace\n')
+        self.write('node2', 'INFO  [main] 2017-01-01 00:00:01,000 Gossiper.java:1 - b\n'
+                            'WARN  [main] 2017-01-01 00:00:03,000 Gossiper.java:1 - d\n')
+        entries = list(self.cluster.timeline())
+        self.assertEqual([(e.node, e.record.message) for e in entries],
+                         [('node1', 'a'), ('node2', 'b'), ('node1', 'c'), ('node2', 'd'), ('node1', 'e\n\tat trace')])
+        filtered = self.cluster.timeline(since=datetime(2017, 1, 1, 0, 0, 1), until=datetime(2017, 1, 1, 0, 0, 4), levels=['WARN', 'INFO'])
+        self.assertEqual([e.record.message for e in filtered], ['b', 'c', 'd'])
+        self.assertEqual(format_entry(entries[1]), '2017-01-01 00:00:01,000 node2 INFO  [main] Gossiper.java:1 - b')
+
+    def test_merges_debug_and_gc_logs(self):
+        self.write('node1', 'DEBUG [main] 2017-01-01 00:00:01,000 Gossiper.java:1 - debug\n', name='debug.log')
+        self.write('node2', 'INFO  [main] 2017-01-01 00:00:00,000 Gossiper.java:1 - system\n')
+        stamp = datetime(2017, 1, 1, 0, 0, 2)
+        offset = time.strftime('%z', time.localtime(time.mktime(stamp.timetuple())))
+        self.write('node2', '[2017-01-01T00:00:02.000{}][2.000s][info][gc] GC(0) Pause Young 10M->5M(20M) 3.000ms\n'.format(offset),
+                   name='gc.log.0.current')
+        entries = list(self.cluster.timeline(logs=('system', 'debug', 'gc')))
+        self.assertEqual([(e.node, e.log) for e in entries], [('node2', 'system'), ('node1', 'debug'), ('node2', 'gc')])
+        self.assertEqual(entries[2].timestamp, stamp)
+
+    def test_jdk8_gc_log(self):
+        records = list(parse_gc_log(['2017-01-01T00:00:02.000+0000: 1.234: [GC pause (G1 Evacuation Pause) (young)\n',
+                                     '   [Eden: 1M(2M)->0B(2M)]\n',
+                                     'Heap after GC invocations=1\n']))
+        self.assertEqual(len(records), 1)
+        self.assertIn('Eden', records[0].message)
+
+    def test_unknown_log(self):
+        with self.assertRaises(ArgumentError):
+            self.cluster.timeline(logs=('bogus',))
@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+import time
+
+from ccmlib import process, timings
+from ccmlib.node import Status
+from ccmlib.timings import Timings
+
+from . import ccmtest
+from .fakes import make_node
+from .test_process import spawn
+
+
+class TestTimings(ccmtest.Tester):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_phases(self):
+        timer = Timings('start', 'node1', started=100)
+        timer.add('spawn', 100, 101.5)
+        timer.add('start_log', 101.5, 104)
+        self.assertEqual(list(timer.phases), ['spawn', 'start_log'])
+        self.assertEqual(timer.phases['start_log'], (1.5, 2.5))
+        self.assertEqual(timer.total(), 4)
+
+    def test_mark(self):
+        timer = Timings('stop', 'node1')
+        time.sleep(0.05)
+        timer.mark('signal')
+        timer.mark('exit')
+        offset, duration = timer.phases['signal']
+        self.assertEqual(offset, 0)
+        self.assertGreaterEqual(duration, 0.05)
+        self.assertAlmostEqual(timer.phases['exit'][0], duration)
+        with timer.phase('kill'):
+            pass
+        self.assertEqual(list(timer.phases), ['signal', 'exit', 'kill'])
+
+    def test_record(self):
+        self.assertEqual(timings.load(self.dir), [])
+        for i in range(timings.HISTORY + 5):
+            timer = Timings('start', 'node1', started=1000 + i)
+            timer.add('spawn', 1000 + i, 1001 + i)
+            timings.record(self.dir, timer)
+        timings.record(self.dir, Timings('stop', 'node1', started=2000))
+        # Recording the same run again replaces it
+        timer.add('start_log', 1001 + i, 1003 + i)
+        timings.record(self.dir, timer)
+
+        starts = timings.load(self.dir, 'start')
+        self.assertEqual(len(starts), timings.HISTORY)
+        self.assertEqual(starts[0].started, 1005)
+        self.assertEqual(list(starts[-1].phases), ['spawn', 'start_log'])
+        self.assertEqual(len(timings.load(self.dir, 'stop')), 1)
+
+    def test_format_runs(self):
+        first = Timings('start', 'test', started=1000)
+        first.add('launch', 1000, 1010)
+        second = Timings('start', 'test', started=2000)
+        second.add('launch', 2000, 2008)
+        second.add('gossip', 2008, 2009)
+        lines = timings.format_runs([first, second])
+        self.assertEqual(lines[0], 'test start')
+        self.assertIn('diff', lines[1])
+        self.assertEqual(lines[2].split(), ['launch', '10.000s', '8.000s', '-2.000s'])
+        self.assertEqual(lines[3].split(), ['gossip', '-', '1.000s', '-'])
+        self.assertEqual(lines[4].split(), ['total', '10.000s', '9.000s', '-1.000s'])
+        self.assertEqual(timings.format_runs([]), [])
+
+    def test_node_stop(self):
+        p = spawn()
+        node = make_node(self.dir)
+        node.pid, node.pid_start_time = p.pid, process.start_time(p.pid)
+        node.status = Status.UP
+        node._update_config = lambda: None
+        self.assertTrue(node.stop())
+        p.wait()
+        p.stdout.close()
+        self.assertEqual(list(node.timings['stop'].phases), ['signal', 'exit'])
+        runs = timings.load(node.get_path(), 'stop')
+        self.assertEqual([list(run.phases) for run in runs], [['signal', 'exit']])